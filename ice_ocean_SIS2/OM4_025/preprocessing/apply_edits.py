@@ -9,56 +9,86 @@ except: error('Unable to import netCDF4 module. Check your PYTHONPATH.\n'
 try: import numpy
 except: error('Unable to import numpy module. Check your PYTHONPATH.\n'
           +'Perhaps try:\n   module load python_numpy')
+import os
 
 def main():
 
   # Command line arguments
   parser = argparse.ArgumentParser(description=
-       '''Applies list of topography edits from one file to a topography file.
+       '''Applies list of topography edits from one or more files to a topography file.
+        Edits from several files are merged, a later file taking precedence where they edit the same point.
+        Any edits already recorded in the topography file are undone first.
         ''',
        epilog='Written by A.Adcroft, 2015.')
-  parser.add_argument('edits_file', type=str,
-                      help='netcdf file with list of edits.')
+  parser.add_argument('edits_files', type=str, nargs='*',
+                      help='netcdf file(s) with list of edits.')
   parser.add_argument('topography_file', type=str,
                       help='netcdf file of topography to update.')
+  parser.add_argument('--undo', action='store_true',
+                      help='Undo the recorded edits at the points listed in the edits files, or all recorded edits if no edits files are given.')
 
   optCmdLineArgs = parser.parse_args()
 
-  createGUI(optCmdLineArgs.edits_file, optCmdLineArgs.topography_file)
-
-def createGUI(edits_file, topo_file, var='depth'):
-
-  # Open netcdf file with list of edits
-  try: rge = Dataset(edits_file, 'r')
-  except: error('There was a problem opening "'+edits_file+'".')
-
-  if not ( 'iEdit' in rge.variables and 'jEdit' in rge.variables and 'zEdit' in rge.variables):
-    print edits_file,'does not have any recorded edits'
-    return
-
-  try:
-    iEdit = rge.variables['iEdit'][:]
-    jEdit = rge.variables['jEdit'][:]
-    zEdit = rge.variables['zEdit'][:]
-    zEdit_units = rge.variables['zEdit'].units
-    eni = rge.variables['ni'][:]
-    enj = rge.variables['nj'][:]
-    rge.close()
-  except: raise Exception('There was a problem reading '+edits_file)
+  createGUI(optCmdLineArgs.edits_files, optCmdLineArgs.topography_file, undo=optCmdLineArgs.undo)
+
+def readEdits(edits_files):
+  """
+  Returns the merged iEdit, jEdit, zEdit of edits_files, their units and dataset shape (nj,ni),
+  or None if there are no recorded edits. A later edit of the same point replaces an earlier one.
+  """
+  iEdit = []; jEdit = []; zEdit = []; units = None; shape = None
+  for edits_file in edits_files:
+    try: rge = Dataset(edits_file, 'r')
+    except: raise Exception('There was a problem opening "'+edits_file+'".')
+    if not ( 'iEdit' in rge.variables and 'jEdit' in rge.variables and 'zEdit' in rge.variables):
+      print edits_file,'does not have any recorded edits'
+      rge.close()
+      continue
+    try:
+      iEdit.append( rge.variables['iEdit'][:] )
+      jEdit.append( rge.variables['jEdit'][:] )
+      zEdit.append( rge.variables['zEdit'][:] )
+      eshape = ( int(rge.variables['nj'][:]), int(rge.variables['ni'][:]) )
+      eunits = rge.variables['zEdit'].units
+      rge.close()
+    except: raise Exception('There was a problem reading '+edits_file)
+    if units is not None and eunits != units: raise Exception('Units mismatch between edits files!')
+    if shape is not None and eshape != shape: raise Exception('Dimension mismatch between edits files!')
+    units = eunits; shape = eshape
+  if units is None: return None
+  iEdit, jEdit, zEdit = lastEdits( numpy.concatenate(iEdit), numpy.concatenate(jEdit), numpy.concatenate(zEdit), shape[1] )
+  return iEdit, jEdit, zEdit, units, shape
+
+def lastEdits(iEdit, jEdit, zEdit, ni):
+  """Returns the edits without repeats, keeping the last edit of each point, in the order given."""
+  n = len(iEdit) - 1 - numpy.unique( (jEdit*ni + iEdit)[::-1], return_index=True )[1]
+  n.sort()
+  return iEdit[n], jEdit[n], zEdit[n]
+
+def createGUI(edits_files, topo_file, var='depth', undo=False):
+
+  edits = readEdits(edits_files)
+  if edits is None and not ( undo and len(edits_files)==0 ): return
 
   rg = Dataset(topo_file, 'r+')
 
   # Sanity check
-  if rg.variables[var].units != zEdit_units: raise Exception('Units mismatch!')
-  if rg.variables[var].shape[0] != enj: raise Exception('j-dimension mismatch!')
-  if rg.variables[var].shape[1] != eni: raise Exception('i-dimension mismatch!')
+  if edits is not None:
+    iEdit, jEdit, zEdit, zEdit_units, (enj, eni) = edits
+    if rg.variables[var].units != zEdit_units: raise Exception('Units mismatch!')
+    if rg.variables[var].shape[0] != enj: raise Exception('j-dimension mismatch!')
+    if rg.variables[var].shape[1] != eni: raise Exception('i-dimension mismatch!')
+  else: zEdit_units = rg.variables[var].units
 
   depth = rg.variables[var][:,:]
+  ni = depth.shape[1]
 
   if ( 'iEdit' in rg.variables and 'jEdit' in rg.variables and 'zEdit' in rg.variables):
-    # Undo existing edits
-    for n,(i,j,z) in enumerate(zip(rg.variables['iEdit'][:], rg.variables['jEdit'][:], rg.variables['zEdit'][:])):
-      depth[j,i] = z
+    # Undo existing edits, in reverse order so that the first recorded value of a point prevails
+    iOld = rg.variables['iEdit'][:]; jOld = rg.variables['jEdit'][:]; zOld = rg.variables['zEdit'][:]
+    zNow = depth[jOld, iOld]
+    depth[jOld[::-1], iOld[::-1]] = zOld[::-1]
+    nRecorded = iOld.shape[0]
   else:
     # Create new edit variables
     rg.createDimension('nEdits', None)
@@ -69,16 +99,24 @@ def createGUI(edits_file, topo_file, var='depth'):
     nc_jEdit.long_name = 'j-index of edited data'
     nc_zEdit.long_name = 'Original value of edited data'
     nc_zEdit.units = zEdit_units
+    iOld = jOld = numpy.zeros(0, dtype=int); zNow = numpy.zeros(0)
+    nRecorded = 0
 
-  n = rg.variables['iEdit'].shape[0]
-  if n > zEdit.shape[0]:
-    raise Exception('List of existing edits are longer than list of new edits')
+  if undo:
+    # Re-apply the recorded edits other than those to undo
+    iOld, jOld, zNow = lastEdits(iOld, jOld, zNow, ni)
+    if edits is None: keep = numpy.zeros(iOld.shape, dtype=bool)
+    else: keep = ~numpy.isin( jOld*ni + iOld, jEdit*ni + iEdit )
+    iEdit, jEdit, zEdit = iOld[keep], jOld[keep], zNow[keep]
 
   # Apply edits
-  old_depths = numpy.zeros( zEdit.shape[0] )
-  for n,(i,j,z) in enumerate(zip(iEdit, jEdit, zEdit)):
-    old_depths[n] = depth[j,i]
-    depth[j,i] = z
+  old_depths = depth[jEdit, iEdit]
+  depth[jEdit, iEdit] = zEdit
+
+  if iEdit.shape[0] < nRecorded: # The unlimited nEdits dimension cannot shrink in place
+    rg.close()
+    rewriteEdits(topo_file, var, depth, iEdit, jEdit, old_depths)
+    return
 
   rg.variables[var][:] = depth
   rg.variables['iEdit'][:] = iEdit
@@ -87,6 +125,24 @@ def createGUI(edits_file, topo_file, var='depth'):
 
   rg.close()
 
+def rewriteEdits(topo_file, var, depth, iEdit, jEdit, zEdit):
+  """Replaces topo_file by a copy with the given var and list of edits."""
+  src = Dataset(topo_file, 'r')
+  tmp_file = topo_file+'.tmp'
+  dst = Dataset(tmp_file, 'w', format=src.file_format)
+  dst.setncatts( dict( (a, src.getncattr(a)) for a in src.ncattrs() ) )
+  for name, dim in src.dimensions.items():
+    dst.createDimension(name, None if dim.isunlimited() else len(dim))
+  values = {var: depth, 'iEdit': iEdit, 'jEdit': jEdit, 'zEdit': zEdit}
+  for name, v in src.variables.items():
+    fill = v.getncattr('_FillValue') if '_FillValue' in v.ncattrs() else None
+    new = dst.createVariable(name, v.dtype, v.dimensions, fill_value=fill)
+    new.setncatts( dict( (a, v.getncattr(a)) for a in v.ncattrs() if a != '_FillValue' ) )
+    if name in values: new[:] = values[name]
+    elif 'nEdits' not in v.dimensions: new[:] = v[:]
+  src.close()
+  dst.close()
+  os.rename(tmp_file, topo_file)
+
 # Invoke main()
 if __name__ == '__main__': main()
-
@@ -29,13 +29,16 @@ except:
     error('Unable to import matplotlib.pyplot module. Check your PYTHONPATH.\n'
           + 'Perhaps try:\n   module load python_matplotlib')
 from matplotlib.widgets import Button, RadioButtons, TextBox, CheckButtons
-from matplotlib.colors import LinearSegmentedColormap
+from matplotlib.colors import LinearSegmentedColormap, Normalize
+from matplotlib.collections import PolyCollection
+from matplotlib.cm import ScalarMappable
 import shutil as sh
 from os.path import dirname, basename, join, splitext
 import time
 import sys
 import os
 import pwd
+import spatialindex
 
 
 def main():
@@ -125,6 +128,8 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
     except:
         lon, lat = np.meshgrid(np.arange(ni+1), np.arange(nj+1))
     fullData = Topography(lon, lat, depth, ref)
+    if not nogui:
+        fullData.meshIndex()  # Build the point-location index now rather than on the first mouse event
 
     class Container:
         def __init__(self):
@@ -224,8 +229,9 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
             except:
                 error('There was a problem applying edits from "'+applyFile+'".')
 
-    All.data = fullData.cloneWindow(
-        (All.view.i0, All.view.j0), (All.view.iw, All.view.jw))
+    # The whole grid with the edits applied, which is what is plotted; panning and zooming
+    # only change the view of it, and edits change it a cell at a time
+    All.data = fullData.cloneWindow((0, 0), (ni, nj))
     All.fieldname = All.data.fieldnames[0]
     if All.edits.ijz:
         All.data.applyEdits(fullData, All.edits.ijz)
@@ -236,22 +242,21 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
 
     # plt.rcParams['toolbar'] = 'None'  # don't use - also disables statusbar
 
-    def replot(All):
-        if All.cbar is not None:
-            All.cbar.remove()
-        h = plt.pcolormesh(All.data.longitude, All.data.latitude,
-                           All.data.plotfield, cmap=All.cmap,
-                           vmin=-All.clim, vmax=All.clim)
-        hc = plt.colorbar()
-        return(h, hc)
-
-    All.quadMesh, All.cbar = replot(All)
-    All.syms = All.edits.plot(fullData)
-    dir(All.syms)
     All.ax = plt.gca()
+    All.quadMesh = TiledMesh(All.ax, All.data, All.data.plotfield, All.cmap, All.clim)
+    All.quadMesh.show((All.view.i0, All.view.j0), (All.view.iw, All.view.jw))
+    All.cbar = plt.colorbar(ScalarMappable(norm=All.quadMesh.norm, cmap=All.cmap), ax=All.ax)
+    All.syms = All.edits.plot(fullData)
+    All.quadMesh.addAnimated(All.syms)
     All.ax.set_xlim(All.data.xlim)
     All.ax.set_ylim(All.data.ylim)
 
+    def resetCell(i, j):
+        # Back to the original value, as the cell has no edit now
+        All.data.height[i, j] = fullData.height[i, j]
+        if All.data.haveref:
+            All.data.diff[i, j] = All.data.height[i, j] - All.data.ref[i, j]
+
     if fullData.haveref:
         def setsource(label):
             All.fieldname = label
@@ -262,9 +267,9 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
                 All.cmap = All.cmap3
             else:
                 All.cmap = All.prevcmap
-            All.quadMesh.set_cmap(All.cmap)
+            All.quadMesh.setCmap(All.cmap)
             All.cbar.mappable.set_cmap(All.cmap)
-            All.quadMesh.set_array(All.data.plotfield.ravel())
+            All.quadMesh.setField(All.data.plotfield)
             plt.draw()
         sourcebuttons = RadioButtons(plt.axes([.88, .4, 0.12, 0.15]),
                                      All.data.fieldnames)
@@ -279,6 +284,13 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
     textbox = TextBox(tbax, 'set depth', '0')
     textbox.on_submit(setDepth)
     textbox.on_text_change(setDepth)
+    stopTyping = textbox.stop_typing
+    def stopTypingIfTyping():
+        # TextBox redraws the whole figure at every click outside it, which would undo
+        # the blitting of edits; only do so when it was being typed in
+        if textbox.capturekeystrokes:
+            stopTyping()
+    textbox.stop_typing = stopTypingIfTyping
     def nothing(x,y):
         return ''
     tbax.format_coord = nothing  # stop status bar displaying coords in textbox
@@ -299,14 +311,13 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
     lowerButtons = Buttons(left=.9)
 
     def undoLast(event):
-        All.edits.pop()
-        All.data = fullData.cloneWindow(
-            (All.view.i0, All.view.j0), (All.view.iw, All.view.jw),
-            fieldname=All.fieldname)
-        All.data.applyEdits(fullData, All.edits.ijz)
-        All.quadMesh.set_array(All.data.plotfield.ravel())
+        last = All.edits.pop()
+        if last is None:
+            return
+        i, j, _ = last
+        resetCell(i, j)
         All.edits.updatePlot(fullData, All.syms)
-        plt.draw()
+        All.quadMesh.update([(i, j)])
     lowerButtons.add('Undo', undoLast)
 
     upperButtons = Buttons(bottom=1-.0615)
@@ -324,24 +335,18 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
             else:
                 All.cmap = All.cmap1
         All.clim = Levs[i]
-        All.quadMesh.set_clim(vmin=-All.clim, vmax=All.clim)
-        All.quadMesh.set_cmap(All.cmap)
-        All.cbar.mappable.set_clim(vmin=-All.clim, vmax=All.clim)
+        All.quadMesh.setClim(All.clim)  # also rescales the colorbar, which shares the norm
+        All.quadMesh.setCmap(All.cmap)
         All.cbar.mappable.set_cmap(All.cmap)
         plt.draw()
 
     def moveVisData(di, dj):
         All.view.move(di, dj)
-        All.data = fullData.cloneWindow(
-            (All.view.i0, All.view.j0), (All.view.iw, All.view.jw),
-            fieldname=All.fieldname)
-        All.data.applyEdits(fullData, All.edits.ijz)
-        plt.sca(All.ax)
-        plt.cla()
-        All.quadMesh, All.cbar = replot(All)
-        All.ax.set_xlim(All.data.xlim)
-        All.ax.set_ylim(All.data.ylim)
-        All.syms = All.edits.plot(fullData)
+        All.quadMesh.show((All.view.i0, All.view.j0), (All.view.iw, All.view.jw))
+        xlim, ylim = fullData.windowLims(
+            (All.view.i0, All.view.j0), (All.view.iw, All.view.jw))
+        All.ax.set_xlim(xlim)
+        All.ax.set_ylim(ylim)
         plt.draw()
 
     def moveWindowLeft(event): moveVisData(-1, 0)
@@ -370,46 +375,37 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
     def onClick(event):  # Mouse button click
         if event.inaxes == All.ax and event.button == 1 and event.xdata:
             # left click: edit point
-            (i, j) = findPointInMesh(fullData.longitude, fullData.latitude,
-                                     event.xdata, event.ydata)
+            (i, j) = fullData.findPoint(event.xdata, event.ydata)
             if i is not None:
-                (I, J) = findPointInMesh(All.data.longitude, All.data.latitude,
-                                         event.xdata, event.ydata)
                 if event.dblclick:
                     nVal = -99999
-                    if All.data.height[I+1, J] < 0:
-                        nVal = max(nVal, All.data.height[I+1, J])
-                    if All.data.height[I-1, J] < 0:
-                        nVal = max(nVal, All.data.height[I-1, J])
-                    if All.data.height[I, J+1] < 0:
-                        nVal = max(nVal, All.data.height[I, J+1])
-                    if All.data.height[I, J-1] < 0:
-                        nVal = max(nVal, All.data.height[I, J-1])
+                    if All.data.height[i+1, j] < 0:
+                        nVal = max(nVal, All.data.height[i+1, j])
+                    if All.data.height[i-1, j] < 0:
+                        nVal = max(nVal, All.data.height[i-1, j])
+                    if All.data.height[i, j+1] < 0:
+                        nVal = max(nVal, All.data.height[i, j+1])
+                    if All.data.height[i, j-1] < 0:
+                        nVal = max(nVal, All.data.height[i, j-1])
                     if nVal == -99999:
                         return
                     All.edits.add(i, j, nVal)
-                    All.data.height[I, J] = nVal
+                    All.data.height[i, j] = nVal
                 else:
                     All.edits.add(i, j)
-                    All.data.height[I, J] = All.edits.get()
+                    All.data.height[i, j] = All.edits.get()
                 if All.data.haveref:
-                    All.data.diff[I, J] = All.data.height[I, J] - All.data.ref[I, J]
-                All.quadMesh.set_array(All.data.plotfield.ravel())
+                    All.data.diff[i, j] = All.data.height[i, j] - All.data.ref[i, j]
                 All.edits.updatePlot(fullData, All.syms)
-                plt.draw()
+                All.quadMesh.update([(i, j)])
         elif event.inaxes == All.ax and event.button == 3 and event.xdata:
             # right click: undo edit
-            (i, j) = findPointInMesh(fullData.longitude, fullData.latitude,
-                                     event.xdata, event.ydata)
+            (i, j) = fullData.findPoint(event.xdata, event.ydata)
             if i is not None:
                 All.edits.delete(i, j)
-                All.data = fullData.cloneWindow(
-                    (All.view.i0, All.view.j0), (All.view.iw, All.view.jw),
-                    fieldname=All.fieldname)
-                All.data.applyEdits(fullData, All.edits.ijz)
-                All.quadMesh.set_array(All.data.plotfield.ravel())
+                resetCell(i, j)
                 All.edits.updatePlot(fullData, All.syms)
-                plt.draw()
+                All.quadMesh.update([(i, j)])
         elif event.inaxes == All.ax and event.button == 2 and event.xdata:
             zoom(event)  # Re-center
     plt.gcf().canvas.mpl_connect('button_press_event', onClick)
@@ -424,32 +420,21 @@ def createGUI(fileName, variable, outFile, refFile, applyFile, nogui, overwrite)
         new_xlim, new_ylim = newLims(
             All.ax.get_xlim(), All.ax.get_ylim(),
             (event.xdata, event.ydata),
-            All.data.xlim, All.data.ylim,
+            fullData.xlim, fullData.ylim,
             All.view.ni, All.view.nj,
             scale_factor)
         if new_xlim is None:
             return  # No change in limits
         All.view.seti(new_xlim)
         All.view.setj(new_ylim)
-        All.data = fullData.cloneWindow(
-            (All.view.i0, All.view.j0), (All.view.iw, All.view.jw),
-            fieldname=All.fieldname)
-        All.data.applyEdits(fullData, All.edits.ijz)
-        plt.sca(All.ax)
-        plt.cla()
-        All.quadMesh, All.cbar = replot(All)
-        # All.ax.set_xlim(All.data.xlim)
-        # All.ax.set_ylim(All.data.ylim)
-        All.syms = All.edits.plot(fullData)
+        All.quadMesh.show((All.view.i0, All.view.j0), (All.view.iw, All.view.jw))
         All.ax.set_xlim(new_xlim)
         All.ax.set_ylim(new_ylim)
-        # All.cbar.mappable.set_clim(vmin=-All.clim, vmax=All.clim)
-        # All.cbar.mappable.set_cmap(All.cmap)
         plt.draw()  # force re-draw
     plt.gcf().canvas.mpl_connect('scroll_event', zoom)
 
     def statusMesg(x, y):
-        j, i = findPointInMesh(fullData.longitude, fullData.latitude, x, y)
+        j, i = fullData.findPoint(x, y)
         if All.useref:
             All.textbox.set_val(repr(fullData.ref[j, i]))  # callback calls All.edits.setVal
         if i is not None:
@@ -575,111 +560,14 @@ and also to a .txt file.
 
 
 def ice9it(i, j, depth):
-    # Iterative implementation of "ice 9"
+    # "Ice 9" from depth[i, j] through points with depth<0, via the shared flood fill
+    # (cyclic in the last index, tri-polar fold at the top)
+    import floodfill
     wetMask = 0*depth
-    (ni, nj) = wetMask.shape
-    stack = set()
-    stack.add((i, j))
-    while stack:
-        (i, j) = stack.pop()
-        if wetMask[i, j] or depth[i, j] >= 0:
-            continue
-        wetMask[i, j] = 1
-        if i > 0:
-            stack.add((i-1, j))
-        else:
-            stack.add((ni-1, j))
-        if i < ni-1:
-            stack.add((i+1, j))
-        else:
-            stack.add((0, j))
-        if j > 0:
-            stack.add((i, j-1))
-        if j < nj-1:
-            stack.add((i, j+1))
+    wetMask[floodfill.connected(j, i, depth < 0)] = 1
     return wetMask
 
 
-def findPointInMesh(meshX, meshY, pointX, pointY):
-    def sign(x):
-        if x > 0:
-            return 1.0
-        elif x < 0:
-            return -1.0
-        else:
-            return 0.
-
-    def crossProd(u0, v0, u1, v1):
-        return sign(u0*v1 - u1*v0)
-
-    def isPointInConvexPolygon(pX, pY, p):
-        u0 = pX[0]-pX[-1]
-        v0 = pY[0]-pY[-1]
-        u1 = pX[-1] - p[0]
-        v1 = pY[-1] - p[1]
-        firstSign = crossProd(u0, v0, u1, v1)
-        for n in range(len(pX)-1):
-            u0 = pX[n+1]-pX[n]
-            v0 = pY[n+1]-pY[n]
-            u1 = pX[n] - p[0]
-            v1 = pY[n] - p[1]
-            if crossProd(u0, v0, u1, v1)*firstSign < 0:
-                return False
-        return True
-
-    def recurIJ(mX, mY, p, ij00, ij22):
-        # Unpack indices
-        i0 = ij00[0]
-        i2 = ij22[0]
-        j0 = ij00[1]
-        j2 = ij22[1]
-        # Test bounding box first (bounding box is larger than polygon)
-        xmin = min(np.amin(mX[i0, j0:j2]), np.amin(
-            mX[i2, j0:j2]), np.amin(mX[i0:i2, j0]), np.amin(mX[i0:i2, j2]))
-        xmax = max(np.amax(mX[i0, j0:j2]), np.amax(
-            mX[i2, j0:j2]), np.amax(mX[i0:i2, j0]), np.amax(mX[i0:i2, j2]))
-        ymin = min(np.amin(mY[i0, j0:j2]), np.amin(
-            mY[i2, j0:j2]), np.amin(mY[i0:i2, j0]), np.amin(mY[i0:i2, j2]))
-        ymax = max(np.amax(mY[i0, j0:j2]), np.amax(
-            mY[i2, j0:j2]), np.amax(mY[i0:i2, j0]), np.amax(mY[i0:i2, j2]))
-        if p[0] < xmin or p[0] > xmax or p[1] < ymin or p[1] > ymax:
-            return None, None
-        if i2 > i0+1:
-            i1 = int(0.5*(i0+i2))
-            if j2 > j0+1:  # Four quadrants to test
-                j1 = int(0.5*(j0+j2))
-                iAns, jAns = recurIJ(mX, mY, p, (i0, j0), (i1, j1))
-                if iAns is None:
-                    iAns, jAns = recurIJ(mX, mY, p, (i1, j1), (i2, j2))
-                if iAns is None:
-                    iAns, jAns = recurIJ(mX, mY, p, (i0, j1), (i1, j2))
-                if iAns is None:
-                    iAns, jAns = recurIJ(mX, mY, p, (i1, j0), (i2, j1))
-            else:  # Two halves, east/west, to test
-                j1 = int(0.5*(j0+j2))
-                iAns, jAns = recurIJ(mX, mY, p, (i0, j0), (i1, j2))
-                if iAns is None:
-                    iAns, jAns = recurIJ(mX, mY, p, (i1, j0), (i2, j2))
-        else:
-            if j2 > j0+1:  # Two halves, north/south, to test
-                j1 = int(0.5*(j0+j2))
-                iAns, jAns = recurIJ(mX, mY, p, (i0, j0), (i2, j1))
-                if iAns is None:
-                    iAns, jAns = recurIJ(mX, mY, p, (i0, j1), (i2, j2))
-            else:  # Only one cell left (based on the bounding box)
-                if not isPointInConvexPolygon(
-                    [mX[i0, j0], mX[i0+1, j0], mX[i0+1, j0+1], mX[i0, j0+1]],
-                    [mY[i0, j0], mY[i0+1, j0], mY[i0+1, j0+1], mY[i0, j0+1]],
-                        p):
-                    return None, None
-                return i0, j0
-        return iAns, jAns
-    (ni, nj) = meshX.shape
-    ij00 = [0, 0]
-    ij22 = [ni-1, nj-1]
-    return recurIJ(meshX, meshY, (pointX, pointY), ij00, ij22)
-
-
 # Calculate a new window by scaling the current window, centering
 # on the cursor if possible.
 def newLims(cur_xlim, cur_ylim, cursor, xlim, ylim, ni, nj, scale_factor):
@@ -763,7 +651,8 @@ class Edits:
 
     def pop(self):
         if self.ijz:
-            self.ijz.pop()
+            return self.ijz.pop()
+        return None
 
     def list(self):
         for a in self.ijz:
@@ -794,11 +683,110 @@ class Edits:
             h.set_ydata(y)
 
 
+# Class to draw a field of a Topography in tiles, each a QuadMesh made the first time
+# it is in view and kept. Panning and zooming show and hide tiles rather than remake
+# the plot. Edited cells are redrawn by blitting, over the image of the axes saved at
+# the last full draw, so take the same time whatever the size of the view.
+class TiledMesh:
+    def __init__(self, ax, topo, field, cmap, clim, tile=256):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        self.topo = topo
+        self.field = field
+        self.cmap = cmap
+        self.norm = Normalize(vmin=-clim, vmax=clim)
+        self.tile = tile
+        self.tiles = {}  # QuadMesh of each tile made, by (jt, it)
+        self.cells = []  # (j, i) of cells changed since the last full draw
+        self.background = None
+        self.overlay = PolyCollection([], cmap=cmap, norm=self.norm, animated=True)
+        self.overlay.set_array(np.zeros(0))
+        ax.add_collection(self.overlay)
+        self.animated = [self.overlay]  # Drawn over the background at each blit
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+
+    def slices(self, jt, it):
+        t = self.tile
+        return slice(jt*t, (jt+1)*t), slice(it*t, (it+1)*t)
+
+    def show(self, i0_j0, iw_jw):
+        # Make visible the tiles covering the window of cells starting at i0_j0, of size iw_jw
+        i0, j0 = i0_j0
+        iw, jw = iw_jw
+        t = self.tile
+        inView = set((jt, it) for jt in range(j0//t, (j0+jw-1)//t + 1)
+                     for it in range(i0//t, (i0+iw-1)//t + 1))
+        for jt, it in inView:
+            if (jt, it) not in self.tiles:
+                sj, si = self.slices(jt, it)
+                sj1 = slice(sj.start, sj.stop+1)
+                si1 = slice(si.start, si.stop+1)
+                self.tiles[jt, it] = self.ax.pcolormesh(
+                    self.topo.longitude[sj1, si1], self.topo.latitude[sj1, si1],
+                    self.field[sj, si], cmap=self.cmap, norm=self.norm)
+        for key, mesh in self.tiles.items():
+            mesh.set_visible(key in inView)
+
+    def setField(self, field):
+        self.field = field
+        for (jt, it), mesh in self.tiles.items():
+            mesh.set_array(field[self.slices(jt, it)])
+
+    def setCmap(self, cmap):
+        self.cmap = cmap
+        for mesh in self.tiles.values():
+            mesh.set_cmap(cmap)
+        self.overlay.set_cmap(cmap)
+
+    def setClim(self, clim):
+        self.norm.vmin = -clim
+        self.norm.vmax = clim
+
+    def addAnimated(self, artist):
+        # Artists, such as the edit markers, that change with the edits and are blitted too
+        artist.set_animated(True)
+        self.animated.append(artist)
+
+    def update(self, cells):
+        # Redraw the cells [(j, i), ...] after their values in the field have changed
+        t = self.tile
+        for jt, it in set((j//t, i//t) for j, i in cells):
+            if (jt, it) in self.tiles:  # So that the next full draw shows the new values
+                self.tiles[jt, it].set_array(self.field[self.slices(jt, it)])
+        self.cells.extend(cells)
+        if self.background is None:  # Nothing drawn yet to blit over
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.drawAnimated()
+        self.canvas.blit(self.ax.bbox)
+
+    def drawAnimated(self):
+        lon = self.topo.longitude
+        lat = self.topo.latitude
+        verts = [((lon[j, i], lat[j, i]), (lon[j+1, i], lat[j+1, i]),
+                  (lon[j+1, i+1], lat[j+1, i+1]), (lon[j, i+1], lat[j, i+1]))
+                 for j, i in self.cells]
+        self.overlay.set_verts(verts)
+        self.overlay.set_array(np.array([self.field[j, i] for j, i in self.cells]))
+        for artist in self.animated:
+            self.ax.draw_artist(artist)
+
+    def onDraw(self, event):
+        # After a full draw, which has all the changes so far: save it as the background
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.cells = []
+        self.drawAnimated()
+
+
 # Class to contain data
 class Topography:
-    def __init__(self, lon, lat, height, ref, fieldname=None):
+    def __init__(self, lon, lat, height, ref, fieldname=None, parent=None, offset=(0, 0)):
         self.longitude = lon
         self.latitude = lat
+        self.parent = parent  # The Topography this is a window of, if any
+        self.offset = offset  # Indices of the first cell of this window in parent
+        self.index = None
         self.height = np.copy(height)
         self.xlim = (np.min(lon), np.max(lon))
         self.ylim = (np.min(lat), np.max(lat))
@@ -826,24 +814,58 @@ class Topography:
                               self.latitude[j0:j1+1, i0:i1+1],
                               self.height[j0:j1, i0:i1],
                               self.ref,
-                              fieldname=fieldname)
+                              fieldname=fieldname, parent=self, offset=(j0, i0))
         else:
             return Topography(self.longitude[j0:j1+1, i0:i1+1],
                               self.latitude[j0:j1+1, i0:i1+1],
                               self.height[j0:j1, i0:i1],
                               self.ref[j0:j1, i0:i1],
-                              fieldname=fieldname)
+                              fieldname=fieldname, parent=self, offset=(j0, i0))
+
+    def meshIndex(self):
+        # Point-location index of the whole mesh, built once and shared by all windows of it
+        if self.parent is not None:
+            return self.parent.meshIndex()
+        if self.index is None:
+            self.index = spatialindex.MeshIndex(self.longitude, self.latitude)
+        return self.index
+
+    def findPoint(self, x, y):
+        # Returns the indices of the cell of this window containing (x, y), or None, None
+        I, J = self.meshIndex().find(x, y)
+        top = self
+        while top.parent is not None:  # Indices in the whole mesh to indices in this window
+            I, J = (None, None) if I is None else (I - top.offset[0], J - top.offset[1])
+            top = top.parent
+        nj, ni = self.height.shape
+        if I is None or not (0 <= I < nj and 0 <= J < ni):
+            return None, None
+        return I, J
 
     def applyEdits(self, origData, ijz):
+        # Edits are indexed as the cells of origData, which this is a window of (or the same as)
+        di = dj = 0
+        top = self
+        while top is not origData and top.parent is not None:
+            di += top.offset[0]
+            dj += top.offset[1]
+            top = top.parent
+        nj, ni = self.height.shape
         for i, j, z in ijz:
-            x = (origData.longitude[i, j] + origData.longitude[i+1, j+1])/2.
-            y = (origData.latitude[i, j] + origData.latitude[i+1, j+1])/2.
-            (I, J) = findPointInMesh(self.longitude, self.latitude, x, y)
-            if I is not None:
+            I, J = i - di, j - dj
+            if 0 <= I < nj and 0 <= J < ni:
                 self.height[I, J] = z
                 if self.haveref:
                     self.diff[I, J] = self.height[I, J] - self.ref[I, J]
 
+    def windowLims(self, i0_j0, iw_jw):
+        # Extent of the window of cells starting at i0_j0, of size iw_jw
+        i0, j0 = i0_j0
+        iw, jw = iw_jw
+        lon = self.longitude[j0:j0+jw+1, i0:i0+iw+1]
+        lat = self.latitude[j0:j0+jw+1, i0:i0+iw+1]
+        return (np.min(lon), np.max(lon)), (np.min(lat), np.max(lat))
+
     def cellCoord(self, j, i):
         #ni, nj = self.longitude.shape
         # if i<0 or j<0 or i>=ni-1 or j>=nj-1: return None, None
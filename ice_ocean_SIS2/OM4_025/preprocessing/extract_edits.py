@@ -14,38 +14,54 @@ def main():
 
   # Command line arguments
   parser = argparse.ArgumentParser(description=
-       '''Extracts the recorded edits in a topogaphy file, if any.
+       '''Extracts the recorded edits in a topogaphy file, if any. The edits of several
+        topography files are merged, a later file taking precedence where they edit the same point.
         ''',
        epilog='Written by A.Adcroft, 2015.')
-  parser.add_argument('topography_file', type=str,
-                      help='netcdf file to read.')
+  parser.add_argument('topography_files', type=str, nargs='+',
+                      help='netcdf file(s) to read.')
   parser.add_argument('-o','--output', type=str,
                       nargs='?', default=' ',
                       help='Write list of edits to output file. If no output file is specified, edits are reported to the screen.')
 
   optCmdLineArgs = parser.parse_args()
 
-  createGUI(optCmdLineArgs.topography_file, optCmdLineArgs.output)
+  createGUI(optCmdLineArgs.topography_files, optCmdLineArgs.output)
 
 
-def createGUI(fileName, outFile):
-
+def readEdits(fileName):
+  """Returns iEdit, jEdit, the original (zEdit) and new depths, units and shape of the edits in fileName, or None."""
   # Open netcdf file
   try: rg = Dataset(fileName, 'r')
   except: error('There was a problem opening "'+fileName+'".')
 
   if not ( 'iEdit' in rg.variables and 'jEdit' in rg.variables and 'zEdit' in rg.variables):
     print fileName,'does not have any recorded edits'
-    return
+    rg.close()
+    return None
 
   iEdit = rg.variables['iEdit'][:]
   jEdit = rg.variables['jEdit'][:]
   zEdit = rg.variables['zEdit'][:]
   zEdit_units = rg.variables['zEdit'].units
-  depths = numpy.zeros( zEdit.shape[0] )
-  (nj,ni) = rg.variables['depth'].shape
-  for n,(i,j) in enumerate(zip(iEdit, jEdit)):
-    depths[n] = rg.variables['depth'][j,i]
+  depths = rg.variables['depth'][:][jEdit, iEdit] # One read of the whole field
+  shape = rg.variables['depth'].shape
+  rg.close()
+  return iEdit, jEdit, zEdit, depths, zEdit_units, shape
+
+def createGUI(fileNames, outFile):
+
+  edits = [e for e in map(readEdits, fileNames) if e is not None]
+  if len(edits) == 0: return
+  zEdit_units = edits[0][4]; (nj,ni) = edits[0][5]
+  for e in edits[1:]:
+    if e[4] != zEdit_units: raise Exception('Units mismatch between topography files!')
+    if e[5] != (nj,ni): raise Exception('Dimension mismatch between topography files!')
+  iEdit, jEdit, zEdit, depths = [ numpy.concatenate([e[k] for e in edits]) for k in range(4) ]
+  # Keep the last edit of each point, in the order given
+  n = len(iEdit) - 1 - numpy.unique( (jEdit*ni + iEdit)[::-1], return_index=True )[1]
+  n.sort()
+  iEdit, jEdit, zEdit, depths = iEdit[n], jEdit[n], zEdit[n], depths[n]
 
   if outFile == ' ':
     print 'Edits apply to a dataset of dimensions %i x %i'%(ni,nj)
@@ -54,8 +70,6 @@ def createGUI(fileName, outFile):
 
     return
 
-  rg.close()
-
   rg = Dataset(outFile, 'w', format='NETCDF3_CLASSIC')
 
   nc_nEdits = rg.createDimension('nEdits', None)
@@ -74,10 +88,9 @@ def createGUI(fileName, outFile):
 
   nc_ni[:] = ni
   nc_nj[:] = nj
-  for n,(i,j,z) in enumerate(zip(iEdit, jEdit, depths)):
-    nc_iEdit[n] = i
-    nc_jEdit[n] = j
-    nc_zEdit[n] = z
+  nc_iEdit[:] = iEdit
+  nc_jEdit[:] = jEdit
+  nc_zEdit[:] = depths
 
   rg.close()
 
@@ -0,0 +1 @@
+../../../tools/analysis/floodfill.py
\ No newline at end of file
@@ -15,6 +15,7 @@ try: import numpy as np
 except: error('Unable to import numpy module. Check your PYTHONPATH.\n'
           +'Perhaps try:\n   module load python_numpy')
 import shutil as sh
+import floodfill
 
 
 def main():
@@ -35,6 +36,11 @@ def main():
                       help='The "shallow" value (+ve, default 1.) to use when calculating the modified_mask. Wet points shallower than this are indicated with mask value of 2.')
   parser.add_argument('--analyze', action='store_true',
                       help='Report on impact of round shallow values to zero')
+  parser.add_argument('--previous', type=str, default=None,
+                      help='A previous output of this script for the same topography before the latest edits. Only the edited points (iEdit, jEdit in either file) are re-examined, instead of the whole grid.')
+  parser.add_argument('--thresholds', type=float, nargs='+',
+                      default=[0.5, 1., 2., 5., 10., 20., 50., 100.],
+                      help='Candidate "shallow" values (+ve) to report on, all in one pass, with --analyze.')
 
   optCmdLineArgs = parser.parse_args()
 
@@ -43,14 +49,15 @@ def main():
   shallow = 1
   if not optCmdLineArgs.shallow==None: shallow = optCmdLineArgs.shallow
   applyIce9(optCmdLineArgs.filename, nFileName, optCmdLineArgs.variable,
-            0., -40., shallow, optCmdLineArgs.analyze)
+            0., -40., shallow, optCmdLineArgs.analyze, optCmdLineArgs.thresholds, optCmdLineArgs.previous)
 
-def applyIce9(fileName, nFileName, variable, x0, y0, shallow, analyze):
+def applyIce9(fileName, nFileName, variable, x0, y0, shallow, analyze, thresholds=[], previous=None):
 
   iRg = Dataset( fileName, 'r' );
   iDepth = iRg.variables[variable] # handle to the variable
   depth = iDepth[:] # Read the data
   print 'Range of input depths: min=',np.amin(depth),'max=',np.amax(depth)
+  if previous is not None: previous = readPrevious(previous, depth.shape) # Now, as it may be the output file
 
   # Open new netcdf file
   if fileName==nFileName: error('Output file must be different from the input file')
@@ -68,7 +75,8 @@ def applyIce9(fileName, nFileName, variable, x0, y0, shallow, analyze):
 
   # A mask based solely on value of depth
   #notLand = np.where( depth<0, 1, 0)
-  notLand = ice9it(600,270,depth)
+  if previous is None: notLand = ice9it(600,270,depth)
+  else: notLand = ice9update(600,270,depth,iRg,previous)
 
   rgWet = rg.createVariable('wet','f4',('ny','nx'))
   rgWet.long_name = 'Wet/dry mask'
@@ -117,25 +125,37 @@ def applyIce9(fileName, nFileName, variable, x0, y0, shallow, analyze):
     numNewDeep = np.count_nonzero(newWet)
     print '# of wet deep points after Ice 9 = %i'%(numNewDeep)
     print '%i - %i = %i fewer points left'%(numNewWet,numNewDeep,numNewWet-numNewDeep)
-  
+    # Every candidate threshold in one union-find pass over the wet points, deepest first
+    print 'Sweeping shallow values...'
+    print '%10s %12s %12s %12s %10s'%('shallow','wet','connected','detached','regions')
+    for s, numWet, numDeep, numRegions in floodfill.thresholdSweep(600, 270, -depth, thresholds, passable=notLand>0):
+      print '%10g %12i %12i %12i %10i'%(s, numWet, numDeep, numWet-numDeep, numRegions)
+
 
 def ice9it(i,j,depth):
-  # Iterative implementation of "ice 9"
+  # "Ice 9" from [j,i] through points with depth<0 (elevation), via the shared flood fill
+  wetMask = 0*depth
+  wetMask[floodfill.connected(i, j, depth<0)] = 1
+  return wetMask
+
+def readPrevious(fileName, shape):
+  # Returns the wet mask and the list of edits (iEdit, jEdit) of a previous output of this script
+  pRg = Dataset( fileName, 'r' )
+  wet = pRg.variables['wet'][:]
+  if wet.shape != shape: error('"%s" is not on the same grid'%(fileName))
+  iEdit = jEdit = np.zeros(0, dtype=int)
+  if 'iEdit' in pRg.variables: iEdit = pRg.variables['iEdit'][:]; jEdit = pRg.variables['jEdit'][:]
+  pRg.close()
+  return wet, iEdit, jEdit
+
+def ice9update(i,j,depth,iRg,previous):
+  # "Ice 9" as ice9it, but revising the wet mask of a previous output at the points edited in either
+  wet, iEdit, jEdit = previous
+  if 'iEdit' in iRg.variables:
+    iEdit = np.concatenate( (iEdit, iRg.variables['iEdit'][:]) )
+    jEdit = np.concatenate( (jEdit, iRg.variables['jEdit'][:]) )
   wetMask = 0*depth
-  (nj,ni) = wetMask.shape
-  stack = set()
-  stack.add( (j,i) )
-  while stack:
-    (j,i) = stack.pop()
-    if wetMask[j,i] or depth[j,i] >= 0: continue
-    wetMask[j,i] = 1
-    if i>0: stack.add( (j,i-1) )
-    else: stack.add( (j,ni-1) )
-    if i<ni-1: stack.add( (j,i+1) )
-    else: stack.add( (0,j) )
-    if j>0: stack.add( (j-1,i) )
-    if j<nj-1: stack.add( (j+1,i) )
-    else: stack.add( (j,ni-1-i) )
+  wetMask[floodfill.updateConnected(i, j, depth<0, wet>0, iEdit, jEdit)] = 1
   return wetMask
 
 # Invoke main()
@@ -0,0 +1 @@
+../../../tools/analysis/spatialindex.py
\ No newline at end of file
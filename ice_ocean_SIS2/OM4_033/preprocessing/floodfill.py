@@ -0,0 +1 @@
+../../OM4_025/preprocessing/floodfill.py
\ No newline at end of file
@@ -0,0 +1 @@
+../../OM4_025/preprocessing/spatialindex.py
\ No newline at end of file
@@ -2,35 +2,20 @@
 
 from midas.rectgrid import *
 from midas.rectgrid_gen import *
+import argparse
 import netCDF4
 import numpy
+import os
+import floodfill
+import spatialindex
 
 def ice9it(i, j, depth, minD=0.):
   """
-  Recursive implementation of "ice 9".
+  "Ice 9" via the shared flood fill (cyclic in x, tri-polar fold at the top).
   Returns 1 where depth>minD and is connected to depth[j,i], 0 otherwise.
   """
-  wetMask = 0*depth      
-
-  (nj,ni) = wetMask.shape
-  stack = set()
-  stack.add( (j,i) )
-  while stack:
-    (j,i) = stack.pop()
-    if wetMask[j,i] or depth[j,i] <= minD: continue
-    wetMask[j,i] = 1
-  
-    if i>0: stack.add( (j,i-1) )
-    else: stack.add( (j,ni-1) ) # Periodic beyond i=0
-
-    if i<ni-1: stack.add( (j,i+1) )
-    else: stack.add( (j,0) ) # Periodic beyond i=ni-1
-    
-    if j>0: stack.add((j-1,i))
-        
-    if j<nj-1: stack.add( (j+1,i) )
-    else: stack.add( (j,ni-1-i) ) # Tri-polar fold beyond j=nj-1
-
+  wetMask = 0*depth
+  wetMask[floodfill.connected(i, j, depth>minD)] = 1
   return wetMask
 
 def ice9(x, y, depth, xy0):
@@ -39,9 +24,9 @@ def ice9(x, y, depth, xy0):
 
 def nearestJI(x, y, (x0, y0)):
   """
-  Find (j,i) of cell with center nearest to (x0,y0).
+  Find (j,i) of cell with center nearest to (x0,y0), by great-circle distance.
   """
-  return numpy.unravel_index( ((x-x0)**2 + (y-y0)**2).argmin() , x.shape)
+  return spatialindex.nearestJI(x, y, (x0, y0))
 
 def southOf(x, y, xy0, xy1):
   """
@@ -53,6 +38,125 @@ def southOf(x, y, xy0, xy1):
   Y[Y>=0] = 1; Y[Y<=0] = 0
   return Y
 
+def capes(x, y, wet):
+  """
+  Returns the land of Africa and of Australia (that connected to a point in each) for the wet mask,
+  and their southernmost latitudes, yCGH (Cape of Good Hope) and yMel (Melbourne).
+  """
+  print 'Finding Cape of Good Hope ...',
+  africa = 1 - wet; africa[x<-30] = 0
+  africa = ice9(x, y, africa, (20,-30.))
+  yCGH = (africa*y).min()
+  print 'done.', yCGH
+
+  print 'Finding Melbourne ...',
+  australia = 1 - wet; australia[x>-180] = 0
+  australia = ice9(x, y, australia, (-220,-25.))
+  yMel = (australia*y).min()
+  print 'done.', yMel
+  return africa, australia, yCGH, yMel
+
+def basins(x, y, yCGH, yMel):
+  """
+  Returns [(code, name, region, seed), ...] for the named basins, in the order they are filled.
+  Each basin is the wet points not in an earlier basin, where region>0, that are connected to
+  the point nearest seed (lon,lat). region is evaluated at the points x, y (arrays of any shape).
+  """
+  return [
+    (11, 'Persian Gulf', 1-southOf(x, y, (55.,23.), (56.5,27.)), (53.,25.)),
+    (10, 'Red Sea', 1-southOf(x, y, (40.,11.), (45.,13.)), (40.,18.)),
+    (7, 'Black Sea', 1-southOf(x, y, (26.,42.), (32.,40.)), (32.,43.)),
+    (6, 'Mediterranean', southOf(x, y, (-5.7,35.5), (-5.7,36.5)), (4.,38.)),
+    (9, 'Baltic', southOf(x, y, (8.6,56.), (8.6,60.)), (10.,58.)),
+    (8, 'Hudson Bay',
+             ( 1-(1-southOf(x, y, (-95.,66.), (-83.5,67.5)))
+                *(1-southOf(x, y, (-83.5,67.5), (-84.,71.)))
+             )*( 1-southOf(x, y, (-70.,58.), (-70.,65.)) ), (-85.,60.)),
+    (4, 'Arctic',
+            (1-southOf(x, y, (-171.,66.), (-166.,65.5))) * (1-southOf(x, y, (-64.,66.4), (-50.,68.5))) # Lab Sea
+       +    southOf(x, y, (-50.,0.), (-50.,90.)) * (1- southOf(x, y, (0.,65.5), (360.,65.5))  ) # Denmark Strait
+       +    southOf(x, y, (-18.,0.), (-18.,65.)) * (1- southOf(x, y, (0.,64.9), (360.,64.9))  ) # Iceland-Sweden
+       +    southOf(x, y, (20.,0.), (20.,90.)) # Barents Sea
+       +    (1-southOf(x, y, (-280.,55.), (-200.,65.))), (0.,85.)),
+    (3, 'Pacific',
+             (1-southOf(x, y, (0.,yMel), (360.,yMel)))
+             -southOf(x, y, (-257,1), (-257,0))*southOf(x, y, (0,3), (1,3))
+             -southOf(x, y, (-254.25,1), (-254.25,0))*southOf(x, y, (0,-5), (1,-5))
+             -southOf(x, y, (-243.7,1), (-243.7,0))*southOf(x, y, (0,-8.4), (1,-8.4))
+             -southOf(x, y, (-234.5,1), (-234.5,0))*southOf(x, y, (0,-8.9), (1,-8.9)), (-150.,0.)),
+    (2, 'Atlantic', 1-southOf(x, y, (0.,yCGH), (360.,yCGH)), (-20.,0.)),
+    (5, 'Indian', 1-southOf(x, y, (0.,yCGH), (360.,yCGH)), (55.,0.)),
+    (1, 'Southern Ocean', 1, (0.,-55.)) ]
+
+def basinCodes(x, y, depth):
+  """
+  Generates the basin codes from scratch, by flood filling each named region in turn.
+  """
+  print 'Generating global wet mask ...',
+  wet = ice9(x, y, depth, (0,-35)) # All ocean points seeded from South Atlantic
+  print 'done.'
+
+  code = 0*wet
+  africa, australia, yCGH, yMel = capes(x, y, wet)
+
+  for basin, name, region, seed in basins(x, y, yCGH, yMel):
+    print 'Processing %s ...'%name
+    tmp = ice9(x, y, wet*region, seed)
+    code[tmp>0] = basin
+    wet = wet - tmp # Removed named points
+
+  code[wet>0] = -9
+  (j,i) = numpy.unravel_index( wet.argmax(), x.shape)
+  if j:
+    print 'There are leftover points unassigned to a basin code'
+    while j:
+      print x[j,i],y[j,i],[j,i]
+      wet[j,i]=0
+      (j,i) = numpy.unravel_index( wet.argmax(), x.shape)
+  else: print 'All points assigned a basin code'
+  return code
+
+def updateBasinCodes(x, y, depth, previous, codesFile='basin_codes.nc', topogFile='ocean_topog.nc'):
+  """
+  Returns the codes in codesFile, made from the topography "previous", revised at the points
+  edited in either previous or topogFile (iEdit, jEdit), or None if they need generating afresh
+  because basinCodes() could give different codes elsewhere (see floodfill.updateCodes), or
+  the edits move the capes dividing the oceans.
+  """
+  if not os.path.exists(codesFile): return None
+  nc = netCDF4.Dataset(codesFile)
+  code = numpy.ma.filled( nc.variables['basin'][:], 0 )
+  nc.close()
+  if code.shape != depth.shape: return None
+  iEdit = []; jEdit = []
+  for f in (previous, topogFile):
+    rg = netCDF4.Dataset(f)
+    if 'iEdit' in rg.variables: iEdit.append(rg.variables['iEdit'][:]); jEdit.append(rg.variables['jEdit'][:])
+    rg.close()
+  if len(iEdit) == 0: return None
+  wet = 1*(code != 0) # Every wet point has a code, -9 if unassigned
+  ji = nearestJI(x, y, (0,-35)) # As for the global wet mask
+  newWet = floodfill.updateConnected(ji[1], ji[0], depth>0, wet, numpy.concatenate(iEdit), numpy.concatenate(jEdit))
+  changed = numpy.flatnonzero( (wet>0) != newWet )
+  if not changed.size: return code
+  africa, australia, yCGH, yMel = capes(x, y, wet)
+  if floodfill.touches(africa, changed) or floodfill.touches(australia, changed): return None
+  ni = x.shape[1]
+  seeds = {}
+  for basin, name, region, seed in basins(x[:1,:1], y[:1,:1], yCGH, yMel):
+    j, i = nearestJI(x, y, seed); seeds[basin] = j*ni + i
+  def inRegion(basin, cells):
+    if basin not in seeds: return True # Points unassigned to a basin
+    cells = numpy.array(cells)
+    for b, name, region, seed in basins(x.flat[cells], y.flat[cells], yCGH, yMel):
+      if b == basin: return bool( numpy.all(region>0) )
+  return floodfill.updateCodes(code, wet, newWet, seeds=seeds, inRegion=inRegion)
+
+parser = argparse.ArgumentParser(description='Generates basin_codes.nc from ocean_hgrid.nc and ocean_topog.nc.')
+parser.add_argument('--update', type=str, default=None, metavar='PREVIOUS_TOPOG',
+                    help='The ocean_topog.nc that the existing basin_codes.nc was made from. The codes are only revised at the points edited since, and are then the same as generating them afresh; edits that could change the codes elsewhere (joining or splitting basins, crossing the lines between them or moving the capes that place those lines) fall back to generating them afresh.')
+args = parser.parse_args()
+
 # Rewrite
 print 'Reading grid ...',
 x = netCDF4.Dataset('ocean_hgrid.nc').variables['x'][1::2,1::2] # Cell centers
@@ -61,112 +165,13 @@ print 'reading topography ...',
 depth = netCDF4.Dataset('ocean_topog.nc').variables['depth'][:]
 print 'done.'
 
-print 'Generating global wet mask ...',
-wet = ice9(x, y, depth, (0,-35)) # All ocean points seeded from South Atlantic
-print 'done.'
-
-code = 0*wet
-
-print 'Finding Cape of Good Hope ...',
-tmp = 1 - wet; tmp[x<-30] = 0
-tmp = ice9(x, y, tmp, (20,-30.))
-yCGH = (tmp*y).min()
-print 'done.', yCGH
-
-print 'Finding Melbourne ...',
-tmp = 1 - wet; tmp[x>-180] = 0
-tmp = ice9(x, y, tmp, (-220,-25.))
-yMel = (tmp*y).min()
-print 'done.', yMel
-
-print 'Processing Persian Gulf ...'
-tmp = wet*( 1-southOf(x, y, (55.,23.), (56.5,27.)) )
-tmp = ice9(x, y, tmp, (53.,25.))
-code[tmp>0] = 11
-wet = wet - tmp # Removed named points
-
-print 'Processing Red Sea ...'
-tmp = wet*( 1-southOf(x, y, (40.,11.), (45.,13.)) )
-tmp = ice9(x, y, tmp, (40.,18.))
-code[tmp>0] = 10
-wet = wet - tmp # Removed named points
-
-print 'Processing Black Sea ...'
-tmp = wet*( 1-southOf(x, y, (26.,42.), (32.,40.)) )
-tmp = ice9(x, y, tmp, (32.,43.))
-code[tmp>0] = 7
-wet = wet - tmp # Removed named points
-
-print 'Processing Mediterranean ...'
-tmp = wet*( southOf(x, y, (-5.7,35.5), (-5.7,36.5)) )
-tmp = ice9(x, y, tmp, (4.,38.))
-code[tmp>0] = 6
-wet = wet - tmp # Removed named points
-
-print 'Processing Baltic ...'
-tmp = wet*( southOf(x, y, (8.6,56.), (8.6,60.)) )
-tmp = ice9(x, y, tmp, (10.,58.))
-code[tmp>0] = 9
-wet = wet - tmp # Removed named points
-
-print 'Processing Hudson Bay ...'
-tmp = wet*( 
-           ( 1-(1-southOf(x, y, (-95.,66.), (-83.5,67.5)))
-              *(1-southOf(x, y, (-83.5,67.5), (-84.,71.))) 
-           )*( 1-southOf(x, y, (-70.,58.), (-70.,65.)) ) )
-tmp = ice9(x, y, tmp, (-85.,60.))
-code[tmp>0] = 8
-wet = wet - tmp # Removed named points
-
-print 'Processing Arctic ...'
-tmp = wet*( 
-          (1-southOf(x, y, (-171.,66.), (-166.,65.5))) * (1-southOf(x, y, (-64.,66.4), (-50.,68.5))) # Lab Sea
-     +    southOf(x, y, (-50.,0.), (-50.,90.)) * (1- southOf(x, y, (0.,65.5), (360.,65.5))  ) # Denmark Strait
-     +    southOf(x, y, (-18.,0.), (-18.,65.)) * (1- southOf(x, y, (0.,64.9), (360.,64.9))  ) # Iceland-Sweden
-     +    southOf(x, y, (20.,0.), (20.,90.)) # Barents Sea
-     +    (1-southOf(x, y, (-280.,55.), (-200.,65.)))
-          )
-tmp = ice9(x, y, tmp, (0.,85.))
-code[tmp>0] = 4
-wet = wet - tmp # Removed named points
-
-print 'Processing Pacific ...'
-tmp = wet*( (1-southOf(x, y, (0.,yMel), (360.,yMel)))
-           -southOf(x, y, (-257,1), (-257,0))*southOf(x, y, (0,3), (1,3))
-           -southOf(x, y, (-254.25,1), (-254.25,0))*southOf(x, y, (0,-5), (1,-5)) 
-           -southOf(x, y, (-243.7,1), (-243.7,0))*southOf(x, y, (0,-8.4), (1,-8.4)) 
-           -southOf(x, y, (-234.5,1), (-234.5,0))*southOf(x, y, (0,-8.9), (1,-8.9)) 
-          )
-tmp = ice9(x, y, tmp, (-150.,0.))
-code[tmp>0] = 3
-wet = wet - tmp # Removed named points
-
-print 'Processing Atlantic ...'
-tmp = wet*(1-southOf(x, y, (0.,yCGH), (360.,yCGH)))
-tmp = ice9(x, y, tmp, (-20.,0.))
-code[tmp>0] = 2
-wet = wet - tmp # Removed named points
-
-print 'Processing Indian ...'
-tmp = wet*(1-southOf(x, y, (0.,yCGH), (360.,yCGH)))
-tmp = ice9(x, y, tmp, (55.,0.))
-code[tmp>0] = 5
-wet = wet - tmp # Removed named points
-
-print 'Processing Southern Ocean ...'
-tmp = ice9(x, y, wet, (0.,-55.))
-code[tmp>0] = 1
-wet = wet - tmp # Removed named points
-
-code[wet>0] = -9
-(j,i) = numpy.unravel_index( wet.argmax(), x.shape)
-if j:
-  print 'There are leftover points unassigned to a basin code'
-  while j:
-    print x[j,i],y[j,i],[j,i]
-    wet[j,i]=0
-    (j,i) = numpy.unravel_index( wet.argmax(), x.shape)
-else: print 'All points assigned a basin code'
+code = None
+if args.update is not None:
+  print 'Revising basin_codes.nc at the edited points ...',
+  code = updateBasinCodes(x, y, depth, args.update)
+  if code is None: print 'the edits need the basin codes generating afresh.'
+  else: print 'done.'
+if code is None: code = basinCodes(x, y, depth)
 
 sgrid=supergrid(file='ocean_hgrid.nc',cyclic_x=True,tripolar_n=True)
 grid=quadmesh(supergrid=sgrid)
@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import io
 import netCDF4
 import numpy
 import m6plot
@@ -22,22 +21,14 @@ def run():
   main(cmdLineArgs)
 
 def main(cmdLineArgs,stream=False):
-  rootGroup = netCDF4.MFDataset( cmdLineArgs.infile )
+  rootGroup = m6toolbox.openDataset( cmdLineArgs.infile )
   if 'MLD_003' not in rootGroup.variables: raise Exception('Could not find "MLD_003" in file "%s"'%(cmdLineArgs.infile))
   
-  if not os.path.exists(cmdLineArgs.gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
-  if os.path.isdir(cmdLineArgs.gridspec):
-    x = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][::2,::2]
-    y = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][::2,::2]
-    msk = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_mask.nc').variables['mask'][:]
-    area = msk*netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['area'][:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-  elif os.path.isfile(cmdLineArgs.gridspec):
-    x = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[::2,::2]
-    y = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[::2,::2]
-    msk = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_mask.nc','mask')[:]
-    area = msk*m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','area')[:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-  else:
-    raise ValueError('Unable to extract grid information from gridspec directory/tar file.') 
+  grid = m6toolbox.loadGrid(cmdLineArgs.gridspec)
+  x = grid.x
+  y = grid.y
+  msk = grid.msk
+  area = grid.area
   
   variable = rootGroup.variables['MLD_003']
   shape = variable.shape
@@ -55,15 +46,15 @@ def main(cmdLineArgs,stream=False):
   
   imgbufs = []
   
-  # Plot of shallowest model MLD (summer)
-  m6plot.xyplot( MLD.min(axis=0), x, y, area=area,
+  # Plot of shallowest model MLD (summer), on a mesh reused for the deepest
+  mldPlot = m6plot.XYPlot( x, y, area=area )
+  mldPlot.draw( MLD.min(axis=0),
         suptitle=rootGroup.title+' '+cmdLineArgs.label, title='Annual-minimum MLD$_{0.03}$ [m]',
         clim=ciMin, extend='max', colormap='dunneRainbow',
         save=cmdLineArgs.outdir+'/MLD_003_minimum.png')
   
   # 2-panel plot of shallowest model MLD + obs (summer)
-  if stream is True: img = io.BytesIO()
-  else: img = cmdLineArgs.outdir+'/MLD_003_minimum.2_panel.png'
+  img = m6toolbox.plotOutput(cmdLineArgs, 'MLD_003_minimum.2_panel.png', stream)
   m6plot.setFigureSize(aspect=[3,3], verticalresolution=976, npanels=0)
   ax1 = plt.subplot(2,1,1)
   m6plot.xyplot( numpy.roll(MLD_obs.min(axis=0),300,axis=-1), x_obs-300, y_obs,
@@ -79,14 +70,14 @@ def main(cmdLineArgs,stream=False):
   if stream is True: imgbufs.append(img)
   
   # Plot of deepest model MLD (winter)
-  m6plot.xyplot( MLD.max(axis=0), x, y, area=area,
+  mldPlot.draw( MLD.max(axis=0),
         suptitle=rootGroup.title+' '+cmdLineArgs.label, title='Annual-maximum MLD$_{0.03}$ [m]',
         clim=ciMax, extend='max', colormap='dunneRainbow',
         save=cmdLineArgs.outdir+'/MLD_003_maximum.png')
+  mldPlot.close()
   
   # 2-panel plot of deepest model MLD + obs (winter)
-  if stream is True: img = io.BytesIO()
-  else: img = cmdLineArgs.outdir+'/MLD_003_maximum.2_panel.png'
+  img = m6toolbox.plotOutput(cmdLineArgs, 'MLD_003_maximum.2_panel.png', stream)
   m6plot.setFigureSize(aspect=[3,3], verticalresolution=976, npanels=0)
   ax1 = plt.subplot(2,1,1)
   m6plot.xyplot( numpy.roll(MLD_obs.max(axis=0),300,axis=-1), x_obs-300, y_obs,
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import numpy
+import m6toolbox
+import time
+
+def run():
+  try: import argparse
+  except: raise Exception('This version of python is not new enough. python 2.7 or newer is required.')
+  parser = argparse.ArgumentParser(description='''Times m6toolbox.MOCpsi on synthetic transports and checks
+      the stream functions against the original level-by-level implementation.''')
+  parser.add_argument('-n','--nt', type=int, default=12, help='''Number of time levels. Default is 12.''')
+  parser.add_argument('-k','--nk', type=int, default=75, help='''Number of vertical levels. Default is 75.''')
+  parser.add_argument('-r','--resolutions', type=float, nargs='+', default=[1., 0.5, 0.25],
+    help='''Nominal grid spacings in degrees to time. Default is 1, 1/2 and 1/4.''')
+  parser.add_argument('--float32', action='store_true', help='''Use single precision transports.''')
+  parser.add_argument('--masked', action='store_true', help='''Mask the transports where vmsk is 0, as on land.''')
+  parser.add_argument('--repeat', type=int, default=3, help='''Times to run each, keeping the fastest. Default is 3.''')
+  parser.add_argument('--seed', type=int, default=1, help='''Random seed for the synthetic transports.''')
+  cmdLineArgs = parser.parse_args()
+  main(cmdLineArgs)
+
+def MOCpsi_loop(vh, vmsk=None):
+  """The original level-by-level implementation of MOCpsi, kept here as the reference."""
+  shape = list(vh.shape); shape[-3] += 1
+  psi = numpy.zeros(shape[:-1])
+  if len(shape)==3:
+    for k in range(shape[-3]-1,0,-1):
+      if vmsk is None: psi[k-1,:] = psi[k,:] - vh[k-1].sum(axis=-1)
+      else: psi[k-1,:] = psi[k,:] - (vmsk*vh[k-1]).sum(axis=-1)
+  else:
+    for n in range(shape[0]):
+      for k in range(shape[-3]-1,0,-1):
+        if vmsk is None: psi[n,k-1,:] = psi[n,k,:] - vh[n,k-1].sum(axis=-1)
+        else: psi[n,k-1,:] = psi[n,k,:] - (vmsk*vh[n,k-1]).sum(axis=-1)
+  return psi
+
+def best(f, repeat):
+  """Returns the shortest time of repeat calls of f, and its result."""
+  times = []
+  for n in range(repeat):
+    tic = time.time()
+    result = f()
+    times.append(time.time() - tic)
+  return min(times), result
+
+def main(cmdLineArgs):
+  rng = numpy.random.RandomState(cmdLineArgs.seed)
+  print('%12s %20s %10s %10s %10s %s'%('resolution','nt x nk x nj x ni','vmsk','MOCpsi [s]','loop [s]','max rel diff'))
+  for res in cmdLineArgs.resolutions:
+    ni = int(round(360./res)); nj = int(round(270./res))
+    vh = rng.standard_normal((cmdLineArgs.nt,cmdLineArgs.nk,nj,ni))
+    if cmdLineArgs.float32: vh = vh.astype(numpy.float32)
+    vmsk = 1.*(rng.rand(nj,ni)>0.5)
+    if cmdLineArgs.masked: vh = numpy.ma.masked_where(numpy.broadcast_to(vmsk==0, vh.shape), vh)
+    for msk in [None, vmsk]:
+      tNew, psi = best(lambda: m6toolbox.MOCpsi(vh, vmsk=msk), cmdLineArgs.repeat)
+      tRef, ref = best(lambda: MOCpsi_loop(vh, vmsk=msk), cmdLineArgs.repeat)
+      print('%12.4f %20s %10s %10.3f %10.3f %12.1e'%(res, '%ix%ix%ix%i'%vh.shape, msk is not None,
+            tNew, tRef, numpy.abs(psi - ref).max()/numpy.abs(ref).max()))
+
+if __name__ == '__main__':
+  run()
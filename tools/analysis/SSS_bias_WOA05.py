@@ -24,32 +24,21 @@ def run():
 def main(cmdLineArgs,stream=False):
   numpy.seterr(divide='ignore', invalid='ignore', over='ignore') # To avoid warnings
 
-  if not os.path.exists(cmdLineArgs.gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
-  if os.path.isdir(cmdLineArgs.gridspec):
-    x = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][::2,::2]
-    xcenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][1::2,1::2]
-    y = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][::2,::2]
-    ycenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][1::2,1::2]
-    msk = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_mask.nc').variables['mask'][:]
-    area = msk*netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['area'][:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_topog.nc').variables['depth'][:]
-  elif os.path.isfile(cmdLineArgs.gridspec):
-    x = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[::2,::2]
-    xcenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[1::2,1::2]
-    y = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[::2,::2]
-    ycenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[1::2,1::2]
-    msk = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_mask.nc','mask')[:]
-    area = msk*m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','area')[:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_topog.nc','depth')[:]
-  else:
-    raise ValueError('Unable to extract grid information from gridspec directory/tar file.') 
+  grid = m6toolbox.loadGrid(cmdLineArgs.gridspec)
+  x = grid.x
+  xcenter = grid.xcenter
+  y = grid.y
+  ycenter = grid.ycenter
+  msk = grid.msk
+  area = grid.area
+  depth = grid.depth
   
   
   Sobs = netCDF4.Dataset( cmdLineArgs.woa ).variables['salt']
   if len(Sobs.shape)==3: Sobs = Sobs[0]
   else: Sobs = Sobs[:,0].mean(axis=0)
 
-  rootGroup = netCDF4.MFDataset( cmdLineArgs.infile )
+  rootGroup = m6toolbox.openDataset( cmdLineArgs.infile )
   if 'salt' in rootGroup.variables: varName = 'salt'
   elif 'so' in rootGroup.variables: varName = 'so'
   else: raise Exception('Could not find "salt" or "so" in file "%s"'%(cmdLineArgs.infile))
@@ -60,16 +49,16 @@ def main(cmdLineArgs,stream=False):
   else: suptitle = rootGroup.title + ' ' + cmdLineArgs.label
 
   imgbufs = []
+  queue = m6plot.RenderQueue() # Figures are rendered concurrently by queue.render()
   ci=m6plot.pmCI(0.125,2.25,.25)
-  if stream is True: img = io.BytesIO()
-  else: img = cmdLineArgs.outdir+'/SSS_bias_WOA05.png'
-  m6plot.xyplot( Smod - Sobs , x, y, area=area,
+  img = m6toolbox.plotOutput(cmdLineArgs, 'SSS_bias_WOA05.png', stream)
+  queue.add(m6plot.xyplot, Smod - Sobs , x, y, area=area,
       suptitle=suptitle, title='SSS bias (w.r.t. WOA\'05) [ppt]',
       clim=ci, colormap='dunnePM', centerlabels=True, extend='both',
       save=img)
   if stream is True: imgbufs.append(img)
   
-  m6plot.xycompare( Smod, Sobs , x, y, area=area,
+  queue.add(m6plot.xycompare, Smod, Sobs , x, y, area=area,
       suptitle=suptitle,
       title1='SSS [ppt]',
       title2='WOA\'05 SSS [ppt]',
@@ -77,6 +66,8 @@ def main(cmdLineArgs,stream=False):
       dlim=ci, dcolormap='dunnePM', dextend='both', centerdlabels=True,
       save=cmdLineArgs.outdir+'/SSS_bias_WOA05.3_panel.png')
 
+  queue.render()
+
   if stream is True:
     return imgbufs
 
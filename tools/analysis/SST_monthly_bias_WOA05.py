@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import io
 import netCDF4
 import numpy
 import m6plot
@@ -20,35 +19,26 @@ def run():
     help='''Directory containing mosaic/grid-spec files (ocean_hgrid.nc and ocean_mask.nc).''')
   parser.add_argument('-w','--woa_monthly', type=str, required=True,
     help='''File containing WOA (or obs) data to compare against.''')
+  parser.add_argument('-m','--monthly_frames', action='store_true',
+    help='''Also plot the bias of each record (month) of the input, e.g. as frames for an animation.''')
   cmdLineArgs = parser.parse_args()
   main(cmdLineArgs)
 
 def main(cmdLineArgs,stream=False):
   numpy.seterr(divide='ignore', invalid='ignore', over='ignore') # To avoid warnings
 
-  if not os.path.exists(cmdLineArgs.gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
-  if os.path.isdir(cmdLineArgs.gridspec):
-    x = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][::2,::2]
-    xcenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][1::2,1::2]
-    y = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][::2,::2]
-    ycenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][1::2,1::2]
-    msk = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_mask.nc').variables['mask'][:]
-    area = msk*netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['area'][:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_topog.nc').variables['depth'][:]
-  elif os.path.isfile(cmdLineArgs.gridspec):
-    x = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[::2,::2]
-    xcenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[1::2,1::2]
-    y = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[::2,::2]
-    ycenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[1::2,1::2]
-    msk = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_mask.nc','mask')[:]
-    area = msk*m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','area')[:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_topog.nc','depth')[:]
-  else:
-    raise ValueError('Unable to extract grid information from gridspec directory/tar file.') 
+  grid = m6toolbox.loadGrid(cmdLineArgs.gridspec)
+  x = grid.x
+  xcenter = grid.xcenter
+  y = grid.y
+  ycenter = grid.ycenter
+  msk = grid.msk
+  area = grid.area
+  depth = grid.depth
 
 
   # open dataset
-  rootGroup = netCDF4.MFDataset( cmdLineArgs.infile )
+  rootGroup = m6toolbox.openDataset( cmdLineArgs.infile )
 
   # gather months from input dataset
   tvar = rootGroup.variables['time']
@@ -70,6 +60,7 @@ def main(cmdLineArgs,stream=False):
   if 'temp' in Tobs.variables: Tobs = Tobs.variables['temp']
   elif 'ptemp' in Tobs.variables: Tobs = Tobs.variables['ptemp']
   else: raise Exception('Could not find "temp" or "ptemp" in file "%s"'%(cmdLineArgs.woa_monthly))
+  TobsVar = Tobs
   if len(Tobs.shape)==3: Tobs = Tobs[0]
   else: Tobs = Tobs[idx,0].mean(axis=0)
 
@@ -80,8 +71,7 @@ def main(cmdLineArgs,stream=False):
   # invoke m6plot
   imgbufs = []
   ci=m6plot.pmCI(0.25,4.5,.5)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/SST_bias_WOA05.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'SST_bias_WOA05.png', stream)
   m6plot.xyplot( Tmod - Tobs , x, y, area=area,
       suptitle=suptitle, title=month_label+' SST bias (w.r.t. WOA\'05) [$\degree$C]',
       clim=ci, colormap='dunnePM', centerlabels=True, extend='both',
@@ -96,6 +86,20 @@ def main(cmdLineArgs,stream=False):
       dlim=ci, dcolormap='dunnePM', dextend='both', centerdlabels=True,
       save=cmdLineArgs.outdir+'/SST_bias_WOA05.3_panel.png')
 
+  # One bias plot per record, drawn on a single mesh
+  if getattr(cmdLineArgs, 'monthly_frames', False):
+    framePlot = m6plot.XYPlot( x, y, area=area )
+    for n,date in enumerate(times):
+      if len(TobsVar.shape)==3: TobsMonth = TobsVar[0]
+      else: TobsMonth = TobsVar[date.month-1,0]
+      objOut = m6toolbox.plotOutput(cmdLineArgs, 'SST_bias_WOA05.%04i-%02i.png'%(date.year,date.month), stream)
+      framePlot.draw( rootGroup.variables[varName][n] - TobsMonth,
+          suptitle=suptitle, title=date.strftime('%b')+' SST bias (w.r.t. WOA\'05) [$\degree$C]',
+          clim=ci, colormap='dunnePM', centerlabels=True, extend='both',
+          save=objOut)
+      if stream is True: imgbufs.append(objOut)
+    framePlot.close()
+
   if stream is True:
     return imgbufs
 
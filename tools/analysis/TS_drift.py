@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import io
 import netCDF4
 import numpy
 import m6plot
@@ -24,45 +23,42 @@ def run():
 def main(cmdLineArgs,stream=False):
   if not isinstance(cmdLineArgs.infile,list):
     cmdLineArgs.infile = [cmdLineArgs.infile]
-  rootGroupT = [x+'.thetao_xyave.nc' for x in cmdLineArgs.infile]  
-  rootGroupS = [x+'.so_xyave.nc' for x in cmdLineArgs.infile]  
-  rootGroupT = netCDF4.MFDataset( rootGroupT )
-  rootGroupS = netCDF4.MFDataset( rootGroupS )
+  rootGroupT = m6toolbox.MFTimeSeries( [x+'.thetao_xyave.nc' for x in cmdLineArgs.infile] )
+  rootGroupS = m6toolbox.MFTimeSeries( [x+'.so_xyave.nc' for x in cmdLineArgs.infile] )
   if 'thetao_xyave' not in rootGroupT.variables: raise Exception('Could not find "thetao_xyave" files "%s"'%(cmdLineArgs.infile))
   if 'so_xyave' not in rootGroupS.variables: raise Exception('Could not find "so_xyave" files "%s"'%(cmdLineArgs.infile))
 
-  if 'zt' in list(rootGroupT.variables.keys()):
-    zt = rootGroupT.variables['zt'][:] * -1
-  elif 'z_l' in list(rootGroupT.variables.keys()):
-    zt = rootGroupT.variables['z_l'][:] * -1
-  timeT = rootGroupT.variables['time']
-  timeS = rootGroupS.variables['time']
-  timeT = numpy.array([int(x.year) for x in netCDF4.num2date(timeT[:],timeT.units,calendar=timeT.calendar)])
-  timeS = numpy.array([int(x.year) for x in netCDF4.num2date(timeS[:],timeS.units,calendar=timeS.calendar)])
+  if 'zt' in rootGroupT.variables:
+    zt = rootGroupT.static('zt') * -1
+  elif 'z_l' in rootGroupT.variables:
+    zt = rootGroupT.static('z_l') * -1
+  # Only the records in the requested years are read
+  trange = m6toolbox.parseTrange(cmdLineArgs.trange)
+  recordsT = rootGroupT.select(trange)
+  recordsS = rootGroupS.select(trange)
+  timeT = rootGroupT.years(recordsT)
+  timeS = rootGroupS.years(recordsS)
 
-  variable = rootGroupT.variables['thetao_xyave']
-  T = variable[:]
-  T = T-T[0]
+  # Drift is relative to the first record of the run
+  T = rootGroupT.read('thetao_xyave', recordsT)
+  T = T-rootGroupT.read('thetao_xyave', slice(0,1))[0]
 
-  variable = rootGroupS.variables['so_xyave']
-  S = variable[:]
-  S = S-S[0]
+  S = rootGroupS.read('so_xyave', recordsS)
+  S = S-rootGroupS.read('so_xyave', slice(0,1))[0]
 
   if cmdLineArgs.suptitle != '':  suptitle = cmdLineArgs.suptitle + ' ' + cmdLineArgs.label
   else: suptitle = rootGroupT.title + ' ' + cmdLineArgs.label
 
   imgbufs = []
 
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/T_drift.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'T_drift.png', stream)
   m6plot.ztplot( T, timeT, zt, splitscale=[0., -2000., -6500.],
       suptitle=suptitle, title='Potential Temperature [C]',
       extend='both', colormap='dunnePM', autocenter=True,
       save=objOut)
   if stream is True: imgbufs.append(objOut)
 
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/S_drift.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'S_drift.png', stream)
   m6plot.ztplot( S, timeS, zt, splitscale=[0., -2000., -6500.],
       suptitle=suptitle, title='Salinity [psu]',
       extend='both', colormap='dunnePM', autocenter=True,
@@ -50,7 +50,7 @@ def main(args):
     geolon = np.array(f.variables['geolon'][:])
     geolat = np.array(f.variables['geolat'][:])
     deptho = np.array(f.variables['deptho'][:].filled(0))
-    basin_code = m6toolbox.genBasinMasks(geolon, geolat, deptho, args.verbose)
+    basin_code = m6toolbox.basinMasks(geolon, geolat, deptho, args.verbose)
 
     shutil.copyfile(args.infile,outfile)
 
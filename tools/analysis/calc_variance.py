@@ -3,14 +3,25 @@
 import netCDF4
 import numpy
 import os
+import streamstats
 
 try: import argparse
 except: raise Exception('This version of python is not new enough. python 2.7 or newer is required.')
 
-parser = argparse.ArgumentParser(description='''Script for generating monthly-averages of square from a year-long file of daily data.''')
+parser = argparse.ArgumentParser(description='''Script for generating monthly-averages of square from a year-long file of daily data.
+    If the output file holds the averages of an interrupted run they are resumed where they stopped.''')
 parser.add_argument('variable', type=str, help='''Variable to process.''')
 parser.add_argument('daily_file', type=str, help='''Daily data file.''')
 parser.add_argument('annual_file', type=str, help='''Annual file to create.''')
+parser.add_argument('-w','--window', type=str, default='monthly',
+  help='''Averaging window: monthly, annual, all or a number of records. Months and years are those of the
+  calendar of the time axis. Default is monthly.''')
+parser.add_argument('-c','--chunk', type=int, default=None, help='''Number of records to read at a time. Default is as many
+  as fit in 64 MB as float64, and one at a time for large (e.g. 3D) fields, which keeps the memory used to a few hundred MB.''')
+parser.add_argument('-m','--moments', type=int, default=2, choices=[2,3,4],
+  help='''Highest moment to calculate: 3 adds the skewness and 4 the kurtosis. Default is 2.''')
+parser.add_argument('--covariance', type=str, nargs='+', default=[], metavar='VARIABLE',
+  help='''Other variables, on the same grid, whose covariance with variable to calculate.''')
 parser.add_argument('-v','--verbose', action='store_true', help='''Inidicate progress.''')
 args = parser.parse_args()
 
@@ -22,6 +33,10 @@ if len(variable.shape)<=2: raise Exception('Expecting a 2D+time or 3D+time array
 shape = variable.shape
 nt = shape[0];
 nxy = shape[1:]
+if args.chunk is None: args.chunk = streamstats.chunkSize(nxy)
+for v in args.covariance:
+  if v not in nc_in.variables: raise Exception('Could not find %s in file "%s"'%(v,args.daily_file))
+  if nc_in.variables[v].shape != shape: raise Exception('%s and %s do not have the same shape'%(v,args.variable))
 
 if args.verbose: print('Creating',args.annual_file)
 if os.path.exists(args.annual_file):
@@ -32,7 +47,11 @@ else:
     append = False
 nc_out = netCDF4.Dataset( args.annual_file, mode, format='NETCDF3_CLASSIC' )
 
-if append is True:
+# Number of windows already written by an interrupted run, recorded in a global attribute until done
+progress = args.variable+'_windows_done'
+resume = append and progress in nc_out.ncattrs()
+
+if append is True and not resume:
   if 'time' in list(nc_out.variables.keys()):
     time_var = 'time'
   elif 'Time' in list(nc_out.variables.keys()):
@@ -44,11 +63,6 @@ if append is True:
     nc_out.close()
     raise ValueError('Existing file has only one time value. Assuming this is annual output.  Aborting.')
 
-if nt==365: days_in_month =   [31,28,31,30,31,30,31,31,30,31,30,31]
-elif nt==366: days_in_month = [31,29,31,30,31,30,31,31,30,31,30,31]
-elif nt==73 : days_in_month = [6,6,6,6,6,6,6,7,6,6,6,6] # for ocean_5daily.nc
-else: raise Exception('First dimension appears to not match a days in a single year.')
-
 # Create dimensions
 for d in variable.dimensions:
   if d not in nc_out.dimensions:
@@ -79,74 +93,84 @@ for v in copy_vars+time_bounds_vars:
       if nc_in.dimensions[v].isunlimited():
         intime = nc_in.variables[v]
         time = intime[:]  # Keep around for later
-
-# Create new variables
-if args.variable not in nc_out.variables:
-  new_mean = nc_out.createVariable(args.variable, variable.dtype, variable.dimensions)
-  do_mean = True
-else:
-  do_mean = False
-
-if args.variable+'_squared' not in nc_out.variables:
-  new_squared = nc_out.createVariable(args.variable+'_squared', variable.dtype, variable.dimensions)
-  do_squared = True
-else:
-  do_squared = False
-
-if args.variable+'_var' not in nc_out.variables:
-  new_variance = nc_out.createVariable(args.variable+'_var', variable.dtype, variable.dimensions)
-  do_variance = True
-else:
-  do_variance = False
-
-
-for a in variable.ncattrs():
-  if do_mean:  new_mean.setncattr(a, variable.__getattr__(a))
-  if a == 'long_name':
-    if do_squared:  new_squared.setncattr(a, 'Square of '+variable.__getattr__(a))
-    if do_variance:  new_variance.setncattr(a, 'Variance of '+variable.__getattr__(a))
-  elif a == 'units':
-    if do_squared:  new_squared.setncattr(a, '('+variable.__getattr__(a)+')^2')
-    if do_variance:  new_variance.setncattr(a, '('+variable.__getattr__(a)+')^2')
-  else:
-    if do_squared:  new_squared.setncattr(a, variable.__getattr__(a))
-    if do_variance:  new_variance.setncattr(a, variable.__getattr__(a))
-
-numpy.seterr(divide='ignore', invalid='ignore', over='ignore') # To avoid warnings
-record = -1
-if len(time_bounds_vars): b1 = nc_in.variables[time_bounds_vars[0]][0]
-for month,days in enumerate(days_in_month):
-  if args.verbose: print('Reading daily data for month',month+1)
-  mean_val = numpy.ma.zeros(nxy)
-  squared_val = numpy.ma.zeros(nxy)
+        outtime = nc_out.variables[v]
+
+# Create new variables (or, when resuming, continue those already there)
+def attribute(a, default=''):
+  if a in variable.ncattrs(): return variable.__getattr__(a)
+  return default
+
+def newVariable(name, attributes):
+  """Returns the output variable "name", or None if it already exists and is complete."""
+  if name in nc_out.variables:
+    if resume: return nc_out.variables[name]
+    return None
+  new = nc_out.createVariable(name, variable.dtype, variable.dimensions, fill_value=attribute('_FillValue', None))
+  for a in variable.ncattrs():
+    if a == '_FillValue': continue
+    if a in attributes: new.setncattr(a, attributes[a])
+    else: new.setncattr(a, variable.__getattr__(a))
+  return new
+
+new_mean = newVariable(args.variable, {})
+new_squared = newVariable(args.variable+'_squared',
+                          {'long_name': 'Square of '+attribute('long_name'), 'units': '('+attribute('units')+')^2'})
+new_variance = newVariable(args.variable+'_var',
+                           {'long_name': 'Variance of '+attribute('long_name'), 'units': '('+attribute('units')+')^2'})
+new_skewness = new_kurtosis = None
+if args.moments>2:
+  new_skewness = newVariable(args.variable+'_skew', {'long_name': 'Skewness of '+attribute('long_name'), 'units': '1'})
+if args.moments>3:
+  new_kurtosis = newVariable(args.variable+'_kurt', {'long_name': 'Kurtosis of '+attribute('long_name'), 'units': '1'})
+new_covariance = {}
+for v in args.covariance:
+  other = nc_in.variables[v]
+  other_name = other.__getattr__('long_name') if 'long_name' in other.ncattrs() else v
+  other_units = other.__getattr__('units') if 'units' in other.ncattrs() else ''
+  new_covariance[v] = newVariable(args.variable+'_'+v+'_cov',
+                                  {'long_name': 'Covariance of '+attribute('long_name')+' and '+other_name,
+                                   'units': '('+attribute('units')+') ('+other_units+')'})
+
+ranges = streamstats.windows(time, intime.__getattr__('units') if 'units' in intime.ncattrs() else None,
+                             intime.__getattr__('calendar') if 'calendar' in intime.ncattrs() else 'standard', args.window)
+first = 0
+if resume: first = int(nc_out.__getattr__(progress))
+nc_out.setncattr(progress, first)
+
+for window,(start,stop) in enumerate(ranges):
+  if window < first: continue
+  if args.verbose: print('Reading records',start+1,'to',stop,'for window',window+1)
+  # The time axis is ours to write unless adding variables to an existing file
+  write_time = window >= len(outtime) or numpy.ma.is_masked(outtime[window])
+  moments = streamstats.Moments(args.moments)
+  comoments = dict( (v, streamstats.CoMoments()) for v in new_covariance )
   time_val = 0.
   count = 0.
-  dt = 0.
-  b0 = b1 # Assumes the time bounds are space-filling
-  for day in range(days):
-    record += 1
-    daily_vals = variable[record,:]
-    mean_val += daily_vals
-    squared_val += daily_vals**2
-    time_val += intime[record]
-    if len(time_bounds_vars):
-      b1 = nc_in.variables[time_bounds_vars[1]][record]
-      dt = nc_in.variables[time_bounds_vars[2]][record]
-      count += dt
-    else:
-      count += 1.
-  mean_val = mean_val/count
-  squared_val = squared_val/count
-  if do_mean:  new_mean[month,:] = mean_val
-  if do_squared:  new_squared[month,:] = squared_val
-  if do_variance:  new_variance[month,:] = squared_val - mean_val**2
-  if append is False:
-    time[month] = time_val/count
+  for a,b in streamstats.chunks(start, stop, args.chunk):
+    if len(time_bounds_vars): dt = nc_in.variables[time_bounds_vars[2]][a:b]
+    else: dt = numpy.ones(b-a)
+    vals = variable[a:b]
+    moments.update(vals, dt)
+    for v in comoments: comoments[v].update(vals, nc_in.variables[v][a:b], dt)
+    time_val += (dt*time[a:b]).sum()
+    count += dt.sum()
+  if new_mean is not None:  new_mean[window,:] = moments.weightedMean()
+  if new_squared is not None:  new_squared[window,:] = moments.meanSquare()
+  if new_variance is not None:  new_variance[window,:] = moments.variance()
+  if new_skewness is not None:  new_skewness[window,:] = moments.skewness()
+  if new_kurtosis is not None:  new_kurtosis[window,:] = moments.kurtosis()
+  for v in comoments:
+    if new_covariance[v] is not None:  new_covariance[v][window,:] = comoments[v].covariance()
+  if write_time:
+    outtime[window] = time_val/count
     if len(time_bounds_vars):
-      nc_out.variables[time_bounds_vars[0]][month] = b0
-      nc_out.variables[time_bounds_vars[1]][month] = b1
-      nc_out.variables[time_bounds_vars[2]][month] = count
+      nc_out.variables[time_bounds_vars[0]][window] = nc_in.variables[time_bounds_vars[0]][start]
+      nc_out.variables[time_bounds_vars[1]][window] = nc_in.variables[time_bounds_vars[1]][stop-1]
+      nc_out.variables[time_bounds_vars[2]][window] = count
+  nc_out.setncattr(progress, window+1)
+  nc_out.sync()
 
+nc_out.delncattr(progress)
 nc_out.close()
 nc_in.close()
 if args.verbose: print(args.annual_file,'written.')
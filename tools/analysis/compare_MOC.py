@@ -3,6 +3,7 @@
 import netCDF4
 import numpy
 import m6plot
+import m6toolbox
 import matplotlib.pyplot as plt
 
 try: import argparse
@@ -41,21 +42,6 @@ else: VHmod = rootGroup.variables[varName][:].filled(0.)
 if 'e' in rootGroup.variables: Zmod = rootGroup.variables['e'][0]
 else: Zmod = rootGroup.variables['e'][0] # Using model z-ou:put
 
-def MOCpsi(vh, vmsk=None):
-  """Sums 'vh' zonally and cumulatively in the vertical to yield an overturning stream function, psi(y,z)."""
-  shape = list(vh.shape); shape[-3] += 1
-  psi = numpy.zeros(shape[:-1])
-  if len(shape)==3:
-    for k in range(shape[-3]-1,0,-1):
-      if vmsk is None: psi[k-1,:] = psi[k,:] - vh[k-1].sum(axis=-1)
-      else: psi[k-1,:] = psi[k,:] - (vmsk*vh[k-1]).sum(axis=-1)
-  else:
-    for n in range(shape[0]):
-      for k in range(shape[-3]-1,0,-1):
-        if vmsk is None: psi[n,k-1,:] = psi[n,k,:] - vh[n,k-1].sum(axis=-1)
-        else: psi[n,k-1,:] = psi[n,k,:] - (vmsk*vh[n,k-1]).sum(axis=-1)
-  return psi
-
 def plotPsi(y, z, psi, ci, title):
   cmap = plt.get_cmap('dunnePM')
   plt.contourf(y, z, psi, levels=ci, cmap=cmap, extend='both')
@@ -82,8 +68,8 @@ else: title2 = rootGroupRef.title
 # Global MOC
 z = Zmod.min(axis=-1)
 yy = y[1:,:].max(axis=-1)+0*z
-psiPlotM = MOCpsi(VHmod)/1e6
-psiPlotR = MOCpsi(VHref)/1e6
+psiPlotM = m6toolbox.MOCpsi(VHmod)/1e6
+psiPlotR = m6toolbox.MOCpsi(VHref)/1e6
 ci=m6plot.pmCI(0.,40.,5.)
 di=m6plot.pmCI(0.,5.,0.5)
 plt.subplot(311)
@@ -115,8 +101,8 @@ plt.clf()
 m = 0*basin_code; m[(basin_code==2) | (basin_code==4) | (basin_code==6) | (basin_code==7) | (basin_code==8)]=1
 z = (m*Zmod).min(axis=-1)
 y = y[1:,:].max(axis=-1)+0*z
-psiPlotM = MOCpsi(VHmod, vmsk=m*numpy.roll(m,1,axis=1))/1e6
-psiPlotR = MOCpsi(VHref, vmsk=m*numpy.roll(m,1,axis=1))/1e6
+psiPlotM = m6toolbox.MOCpsi(VHmod, vmsk=m*numpy.roll(m,1,axis=1))/1e6
+psiPlotR = m6toolbox.MOCpsi(VHref, vmsk=m*numpy.roll(m,1,axis=1))/1e6
 ci=m6plot.pmCI(0.,22.,2.)
 di=m6plot.pmCI(0.,5.,0.5)
 plt.subplot(311)
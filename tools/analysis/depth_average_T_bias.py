@@ -21,25 +21,14 @@ parser.add_argument('-zt','--ztop', type=float, default=0., help='''Depth (+ve)
 parser.add_argument('-zb','--zbottom', type=float, default=300., help='''Depth (+ve) over which to end the average (default 300).''')
 cmdLineArgs = parser.parse_args()
 
-if not os.path.exists(cmdLineArgs.gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
-if os.path.isdir(cmdLineArgs.gridspec):
-  x = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][::2,::2]
-  xcenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][1::2,1::2]
-  y = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][::2,::2]
-  ycenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][1::2,1::2]
-  msk = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_mask.nc').variables['mask'][:]
-  area = msk*netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['area'][:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-  depth = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_topog.nc').variables['depth'][:]
-elif os.path.isfile(cmdLineArgs.gridspec):
-  x = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[::2,::2]
-  xcenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[1::2,1::2]
-  y = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[::2,::2]
-  ycenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[1::2,1::2]
-  msk = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_mask.nc','mask')[:]
-  area = msk*m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','area')[:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-  depth = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_topog.nc','depth')[:]
-else:
-  raise ValueError('Unable to extract grid information from gridspec directory/tar file.') 
+grid = m6toolbox.loadGrid(cmdLineArgs.gridspec)
+x = grid.x
+xcenter = grid.xcenter
+y = grid.y
+ycenter = grid.ycenter
+msk = grid.msk
+area = grid.area
+depth = grid.depth
 
 depth = numpy.ma.array(depth, mask=depth<=cmdLineArgs.ztop)
 lDepth = cmdLineArgs.zbottom
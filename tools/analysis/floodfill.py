@@ -0,0 +1,292 @@
+"""
+The shared "Ice 9" flood fill used by the analysis tools (m6toolbox) and by the
+topography preprocessing scripts (ice9.py, make_basin_mask.py, editTopo.py).
+
+The neighbour graph of a grid (the 4-point stencil plus the links across the
+cyclic x-boundary and the tri-polar fold) is built once per grid shape and
+cached. A fill is then a whole-array scipy.ndimage.label pass followed by a
+merge of the labels that meet across those seams.
+
+updateConnected() and updateCodes() revise a previous fill, and the basin codes
+built from it, after a few cells have been edited, searching only the regions
+that those cells join or split.
+
+thresholdSweep() answers the same question for many thresholds at once: cells
+are added deepest first to a union-find, so one pass gives the size of the
+connected region at every threshold.
+"""
+import numpy as np
+from scipy import ndimage, sparse
+from scipy.sparse import csgraph
+
+class Connectivity:
+  """
+  Neighbour graph of a logically rectangular (nj,ni) grid.
+
+  xcyclic = True links the first and last columns of each row. (default)
+  tripolar = True links cell i of the top-most row to cell ni-1-i. (default)
+  """
+  def __init__(self, shape, xcyclic=True, tripolar=True):
+    self.shape = tuple(shape)
+    self.xcyclic = xcyclic
+    self.tripolar = tripolar
+    index = np.arange(self.shape[0]*self.shape[1]).reshape(self.shape)
+    seamA = []; seamB = []
+    if xcyclic: seamA.append(index[:,0]); seamB.append(index[:,-1])
+    if tripolar: seamA.append(index[-1,:]); seamB.append(index[-1,::-1]) # Tri-polar fold
+    if seamA:
+      self.seamA = np.concatenate(seamA); self.seamB = np.concatenate(seamB)
+    else:
+      self.seamA = np.zeros(0, dtype=int); self.seamB = np.zeros(0, dtype=int)
+    self.seams = {} # Neighbours across the seams, by flat index
+    for a, b in zip(self.seamA.tolist(), self.seamB.tolist()):
+      if a != b: self.seams.setdefault(a, []).append(b); self.seams.setdefault(b, []).append(a)
+
+  def label(self, passable):
+    """
+    Returns an integer array numbering the connected regions of the boolean array
+    "passable" (ids are positive but not necessarily contiguous), and 0 elsewhere.
+    """
+    if passable.shape!=self.shape: raise Exception('passable has shape %s but the grid is %s'%(passable.shape,self.shape))
+    label, nlabels = ndimage.label(np.ma.filled(passable, False))
+    if not self.seamA.size: return label
+    a = label.flat[self.seamA]; b = label.flat[self.seamB]
+    linked = (a>0) & (b>0)
+    links = sparse.coo_matrix( (np.ones(linked.sum()), (a[linked], b[linked])), shape=(nlabels+1,nlabels+1) )
+    ncomponents, component = csgraph.connected_components(links, directed=False)
+    lookup = component + 1; lookup[0] = 0 # Label 0 (blocked) never has links
+    return lookup[label]
+
+  def neighbours(self, c):
+    """Returns the flat indices of the neighbours of flat index c, including across the seams."""
+    nj, ni = self.shape
+    neighbours = self.seams[c][:] if c in self.seams else []
+    ic = c % ni
+    if ic > 0: neighbours.append(c-1)
+    if ic < ni-1: neighbours.append(c+1)
+    if c >= ni: neighbours.append(c-ni)
+    if c < (nj-1)*ni: neighbours.append(c+ni)
+    return neighbours
+
+  def connected(self, i, j, passable):
+    """Returns a boolean array that is True for the cells of "passable" connected to [j,i]."""
+    passable = np.ma.filled(passable, False) # Masked points are not passable
+    if not passable[j,i]: return np.zeros(self.shape, dtype=bool)
+    region = self.label(passable)
+    return region == region[j,i]
+
+_graphs = {}
+
+def connectivity(shape, xcyclic=True, tripolar=True):
+  """Returns the (cached) Connectivity for a grid of the given shape and topology."""
+  key = (tuple(shape), bool(xcyclic), bool(tripolar))
+  if key not in _graphs: _graphs[key] = Connectivity(shape, xcyclic=xcyclic, tripolar=tripolar)
+  return _graphs[key]
+
+def connected(i, j, passable, xcyclic=True, tripolar=True):
+  """Returns a boolean array that is True for the cells of "passable" connected to [j,i]."""
+  return connectivity(passable.shape, xcyclic=xcyclic, tripolar=tripolar).connected(i, j, passable)
+
+def ice9(i, j, source, xcyclic=True, tripolar=True):
+  """
+  An implementation of "Ice 9".
+
+  The flood fill starts at [j,i] and treats any positive value of "source" as
+  passable. Zero and negative values block flooding.
+
+  xcyclic = True allows cyclic behavior in the last index. (default)
+  tripolar = True allows a fold across the top-most edge. (default)
+
+  Returns an array of 0's and 1's.
+  """
+  wetMask = 0*source
+  # Cells are blocked where source<=0 or where 0*source is non-zero (NaN/inf), exactly
+  # as the original stack-based walk treated them. Masked values do not block.
+  blocked = np.ma.filled(source <= 0, False) | np.ma.filled(wetMask != 0, False)
+  wetMask[connected(i, j, ~blocked, xcyclic=xcyclic, tripolar=tripolar)] = 1
+  return wetMask
+
+class UnionFind:
+  """
+  Disjoint sets of the integers 0..n-1, with union by size and path halving.
+  """
+  def __init__(self, n):
+    self.parent = list(range(n))
+    self.size = [1]*n
+
+  def find(self, a):
+    parent = self.parent
+    while parent[a] != a:
+      parent[a] = parent[parent[a]]
+      a = parent[a]
+    return a
+
+  def union(self, a, b):
+    """Merges the sets of a and b. Returns False if they were already the same set."""
+    a = self.find(a); b = self.find(b)
+    if a == b: return False
+    if self.size[a] < self.size[b]: a, b = b, a
+    self.parent[b] = a
+    self.size[a] += self.size[b]
+    return True
+
+def thresholdSweep(i, j, level, thresholds, passable=None, xcyclic=True, tripolar=True):
+  """
+  For each of thresholds, considers the cells where level>=threshold (and passable, if given)
+  and returns a list of (threshold, number of such cells, number of them connected to [j,i],
+  number of separate regions), in the order of thresholds.
+
+  This is what connected(i, j, (level>=threshold) & passable) would give for every threshold,
+  but in one union-find pass over the cells sorted by level.
+  """
+  level = np.ma.filled(np.ma.asarray(level, dtype=np.float64), -np.inf)
+  nj, ni = level.shape
+  graph = connectivity(level.shape, xcyclic=xcyclic, tripolar=tripolar)
+  candidates = level > -np.inf
+  if passable is not None: candidates &= np.ma.filled(passable, False)
+  cells = np.flatnonzero(candidates)
+  cells = cells[np.argsort(-level.flat[cells], kind='stable')].tolist() # Deepest first
+  values = level.ravel().tolist()
+  seed = j*ni + i
+
+  sets = UnionFind(nj*ni)
+  added = [False]*(nj*ni)
+  nadded = 0; nregions = 0; n = 0
+  results = {}
+  for threshold in sorted(set(thresholds), reverse=True):
+    while n < len(cells) and values[cells[n]] >= threshold:
+      c = cells[n]; n += 1
+      added[c] = True; nadded += 1; nregions += 1
+      for b in graph.neighbours(c):
+        if added[b] and sets.union(c, b): nregions -= 1
+    nseed = sets.size[sets.find(seed)] if added[seed] else 0
+    results[threshold] = (nadded, nseed, nregions)
+  return [(t,) + results[t] for t in thresholds]
+
+def updateConnected(i, j, passable, region, ii, jj, budget=20000, xcyclic=True, tripolar=True):
+  """
+  Returns connected(i, j, passable), given region = the result of connected(i, j, previous passable)
+  and the indices ii, jj of the only cells whose passability may have changed (e.g. the iEdit, jEdit
+  of the topography edits).
+
+  Cells no longer passable can only split off the parts of region that were reached through them:
+  for each in turn, searches from its neighbours run side by side until all but one have run out,
+  and those that ran out without reaching [j,i] are removed. Cells newly passable can only join region through
+  themselves: the regions they lead to are searched and added if they touch region. If the searches
+  visit more than budget cells in total the whole fill is done instead.
+  """
+  graph = connectivity(np.shape(passable), xcyclic=xcyclic, tripolar=tripolar)
+  passable = np.ma.filled(passable, False).ravel()
+  new = np.ma.filled(region, False).astype(bool).ravel()
+  ni = graph.shape[1]
+  seed = j*ni + i
+  cells = np.unique( np.asarray(jj, dtype=int)*ni + np.asarray(ii, dtype=int) ).tolist()
+  if not passable[seed]: return np.zeros(graph.shape, dtype=bool)
+  if not new[seed]: return graph.connected(i, j, passable.reshape(graph.shape)) # Not a previous fill from [j,i]
+
+  for c in cells: # One at a time, so that each search stays local to one cell
+    if not new[c] or passable[c]: continue
+    new[c] = False
+    detached = _detached(graph, new, [n for n in graph.neighbours(c) if new[n]], seed, budget)
+    if detached is None: return graph.connected(i, j, passable.reshape(graph.shape))
+    new[detached] = False
+
+  visited = set()
+  for c in cells:
+    if new[c] or not passable[c] or c in visited: continue
+    piece = [c]; visited.add(c); touches = False; n = 0
+    while n < len(piece):
+      for b in graph.neighbours(piece[n]):
+        if new[b]: touches = True
+        elif passable[b] and b not in visited: visited.add(b); piece.append(b)
+      n += 1
+      if len(visited) > budget: return graph.connected(i, j, passable.reshape(graph.shape))
+    if touches: new[piece] = True
+  return new.reshape(graph.shape)
+
+def _detached(graph, inside, starts, seed, budget, step=64):
+  """
+  Returns the flat indices of the cells of "inside" that are connected to one of starts but not to
+  seed, or None if that takes visiting more than budget cells. All of starts must have been
+  connected to seed (through cells that are no longer inside).
+  """
+  owner = {}
+  queues = []
+  for s in starts:
+    if s not in owner: owner[s] = len(queues); queues.append([s])
+  sets = UnionFind(len(queues))
+  heads = [0]*len(queues)
+  seedGroup = owner.get(seed)
+  while True:
+    running = set( sets.find(q) for q in range(len(queues)) if heads[q] < len(queues[q]) )
+    if seedGroup is not None: seedGroup = sets.find(seedGroup)
+    # Done when every search but the one with seed has run out (the last one running must have it)
+    if not (running - set([seedGroup])) or (len(running) == 1 and seedGroup is None): break
+    if len(owner) > budget: return None
+    for q in range(len(queues)):
+      queue = queues[q]
+      for n in range(step):
+        if heads[q] >= len(queue): break
+        c = queue[heads[q]]; heads[q] += 1
+        for b in graph.neighbours(c):
+          if not inside[b]: continue
+          if b in owner:
+            if owner[b] != q: sets.union(q, owner[b])
+          else:
+            owner[b] = q; queue.append(b)
+            if b == seed: seedGroup = q
+  if seedGroup is None: keep = running
+  else: keep = set([sets.find(seedGroup)])
+  return sorted( c for c, q in owner.items() if sets.find(q) not in keep )
+
+def updateCodes(code, wet, newWet, seeds=None, inRegion=None, budget=20000, xcyclic=True, tripolar=True):
+  """
+  Returns the basin codes for the wet mask newWet, given the codes (0 on land) for wet, each code
+  being the fill from the cell seeds[code] (flat index) through the wet cells of its region not in
+  an earlier code. Returns None (meaning the codes must be generated from scratch) unless the
+  change is one that a full regeneration would give the same answer for here:
+  - Cells no longer wet become 0, but not if a seed cell changes or if that cuts off other cells
+    from the seed of their code (searched for as in updateConnected).
+  - Each connected piece of newly wet cells takes the code of the wet cells it touches, but not if
+    it touches cells of different codes or none at all, or if inRegion(code, cells) is False (the
+    piece is not all within the region of that code).
+  """
+  graph = connectivity(np.shape(code), xcyclic=xcyclic, tripolar=tripolar)
+  wet = np.ma.filled(wet, 0).ravel() > 0
+  newWet = np.ma.filled(newWet, 0).ravel() > 0
+  new = np.array(code, copy=True).reshape(-1)
+  lost = np.flatnonzero(wet & ~newWet).tolist()
+  if seeds is None: seeds = {}
+  if any( wet[s] != newWet[s] for s in seeds.values() ): return None
+
+  inside = {} # Cells of each code losing cells, as they are removed
+  for c in lost: # One at a time, so that each search stays local to one cell
+    k = new[c]; new[c] = 0
+    if k not in seeds: continue
+    if k not in inside: inside[k] = new == k
+    inside[k][c] = False
+    starts = [n for n in graph.neighbours(c) if inside[k][n]]
+    if not starts: continue
+    if _detached(graph, inside[k], starts, seeds[k], budget) != []: return None
+
+  gained = set( np.flatnonzero(newWet & ~wet).tolist() )
+  while gained:
+    piece = [gained.pop()]; codes = set(); n = 0
+    while n < len(piece):
+      for b in graph.neighbours(piece[n]):
+        if b in gained: gained.remove(b); piece.append(b)
+        elif newWet[b] and wet[b]: codes.add(new[b])
+      n += 1
+    if len(codes) != 1: return None
+    k = codes.pop()
+    if inRegion is not None and not inRegion(k, piece): return None
+    new[piece] = k
+  return new.reshape(np.shape(code))
+
+def touches(mask, cells, xcyclic=True, tripolar=True):
+  """Returns True if any of the (flat) cells is in mask, or is next to a cell that is."""
+  graph = connectivity(np.shape(mask), xcyclic=xcyclic, tripolar=tripolar)
+  mask = np.ma.filled(mask, 0).ravel() > 0
+  for c in cells:
+    if mask[c] or any( mask[b] for b in graph.neighbours(c) ): return True
+  return False
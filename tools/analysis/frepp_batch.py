@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+import argparse
+import glob
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import traceback
+import m6toolbox
+from multiprocessing import Pool, cpu_count
+
+def run():
+  parser = argparse.ArgumentParser(description='''Runs every analysis listed in manifest.json in one batch,
+      the way frepp runs them one script at a time, and writes the same plot files. Analyses reading the same
+      ppdir/pptype input run one after the other in the same worker process, sharing the open input, and the
+      groups run concurrently. The grid (with its basin codes), matplotlib and the analysis modules are loaded
+      once, before the workers are forked.''')
+  parser.add_argument('pp', type=str, help='''Top-level post-processing directory for an experiment (i.e <some_path>/pp/)''')
+  parser.add_argument('-l','--label', type=str, default='', help='''Label to add to the plots, and the years
+      (e.g. 0001-0005) of the av files to use. Default is the last years found.''')
+  parser.add_argument('-s','--suptitle', type=str, default='', help='''Super-title for experiment.  Default is to read from netCDF file.''')
+  parser.add_argument('-o','--outdir', type=str, default='.', help='''Directory in which to place plots.''')
+  parser.add_argument('-g','--gridspec', type=str, required=True,
+    help='''Directory containing mosaic/grid-spec files (ocean_hgrid.nc and ocean_mask.nc).''')
+  parser.add_argument('-w','--woa', type=str, default='', help='''File containing annual WOA (or obs) data to compare against.''')
+  parser.add_argument('-W','--woa_monthly', type=str, default='', help='''File containing monthly WOA (or obs) data to compare against.''')
+  parser.add_argument('-od','--obsdata', type=str, default='', help='''File containing the observational MLD data (Hosoda et al., 2010).''')
+  parser.add_argument('-t','--trange', type=str, default=None, help='''Tuple containing start and end years to plot''')
+  parser.add_argument('-m','--manifest', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)),'manifest.json'),
+    help='''Manifest of analyses to run. Default is the manifest.json next to this script.''')
+  parser.add_argument('-a','--analyses', type=str, nargs='+', default=None, help='''Run only these analyses from the manifest.''')
+  parser.add_argument('-j','--nprocs', type=int, default=None, help='''Number of worker processes. Default is one per input, up to the number of CPUs.''')
+  cmdLineArgs = parser.parse_args()
+  main(cmdLineArgs)
+
+def readManifest(manifest, analyses=None):
+  """Returns the manifest entries, by analysis name, optionally only those named in analyses."""
+  with open(manifest) as f: entries = json.load(f)
+  if analyses is not None:
+    missing = [a for a in analyses if a not in entries]
+    if missing: raise Exception('Analyses %s are not in the manifest "%s"'%(missing,manifest))
+    entries = dict( (a, entries[a]) for a in analyses )
+  return entries
+
+def groupByInput(entries):
+  """Returns lists of analysis names that read the same ppdir/pptype/ppfreq (and var) input, largest first."""
+  groups = {}
+  for name in sorted(entries):
+    e = entries[name]
+    key = (e['ppdir'], e['pptype'], e['ppfreq'], e.get('var',''))
+    groups.setdefault(key, []).append(name)
+  return sorted(groups.values(), key=len, reverse=True)
+
+def latest(pattern):
+  """Returns the last of the files matching pattern, or None."""
+  files = sorted(glob.glob(pattern))
+  if files: return files[-1]
+  return None
+
+def inputFiles(pp, entry, years=''):
+  """
+  Returns the infile argument for an analysis reading entry's ppdir/pptype/ppfreq from the pp directory,
+  following the frepp layout, or None if no files are found.
+  """
+  ppdir, pptype, ppfreq = entry['ppdir'], entry['pptype'], entry['ppfreq']
+  if pptype == '': return pp
+  if years == '': years = '*'
+  base = os.path.join(pp, ppdir, pptype)
+  if pptype == 'av' and ppfreq == 'annual':
+    return latest(os.path.join(base, 'annual_*yr', '%s.%s.ann.nc'%(ppdir,years)))
+  if pptype == 'av' and ppfreq == 'monthly':
+    first = latest(os.path.join(base, 'monthly_*yr', '%s.%s.01.nc'%(ppdir,years)))
+    if first is None: return None
+    return sorted(glob.glob(first[:-len('01.nc')]+'[01][0-9].nc'))
+  if pptype == 'ts':
+    files = sorted(glob.glob(os.path.join(base, ppfreq, '*yr', '%s.*.%s.nc'%(ppdir,entry['var']))))
+    if files: return files
+    return None
+  if pptype == 'directory':
+    suffix = '.thetao_xyave.nc'
+    files = sorted(glob.glob(os.path.join(pp, ppdir, 'ts', ppfreq, '*yr', '%s.*%s'%(ppdir,suffix))))
+    if files: return [f[:-len(suffix)] for f in files]
+    return None
+  raise Exception('Unknown pptype "%s"'%pptype)
+
+def analysisArgs(cmdLineArgs, infile):
+  """Returns the arguments for the main() of any of the analyses, as their own parsers would."""
+  return argparse.Namespace(infile=infile, label=cmdLineArgs.label, suptitle=cmdLineArgs.suptitle,
+                            outdir=cmdLineArgs.outdir, gridspec=cmdLineArgs.gridspec, woa=cmdLineArgs.woa,
+                            woa_monthly=cmdLineArgs.woa_monthly, obsdata=cmdLineArgs.obsdata, trange=cmdLineArgs.trange)
+
+def runGroup(work):
+  """
+  Runs the analyses [(name, args), ...] of one input one after the other, so that they share the
+  dataset opened by m6toolbox.openDataset() and whatever else the first loaded. Returns
+  [(name, [(file name, png bytes), ...] or None, error message or None), ...] with the buffers
+  of main(args, stream=True). The plots an analysis saves itself are written to args.outdir.
+  """
+  results = []
+  try:
+    for name, args in work:
+      try:
+        imgbufs = importlib.import_module(name).main(args, stream=True)
+        results.append( (name, [(getattr(b, 'filename', None), b.getvalue()) for b in imgbufs or []], None) )
+      except Exception:
+        results.append( (name, None, traceback.format_exc()) )
+  finally: m6toolbox.closeDatasets()
+  return results
+
+def runManifest(cmdLineArgs, entries):
+  """
+  Runs the analyses in entries (see readManifest), writes their plots to cmdLineArgs.outdir and returns
+  {name: number of plots} for those that succeeded, and {name: error message} for those that did not.
+
+  Each analysis saves the plots it does not stream to a staging directory of its own. Once all have run,
+  those files and the streamed buffers are moved to the outdir, analysis by analysis in name order, so
+  that plots two analyses save under the same name end up as when the scripts are run one at a time.
+  """
+  stage = tempfile.mkdtemp(prefix='.frepp_batch.', dir=cmdLineArgs.outdir)
+  try:
+    work = []
+    errors = {}
+    for group in groupByInput(entries):
+      infile = inputFiles(cmdLineArgs.pp, entries[group[0]], cmdLineArgs.label)
+      if infile is None:
+        for name in group: errors[name] = 'No input found for %s'%entries[name]
+        continue
+      work.append( [] )
+      for name in group:
+        args = analysisArgs(cmdLineArgs, infile)
+        args.outdir = os.path.join(stage, name); os.mkdir(args.outdir)
+        work[-1].append( (name, args) )
+
+    # Load once in this process: the workers inherit them when forked
+    for group in work:
+      for name, args in group: importlib.import_module(name)
+    if any(entries[name]['pptype'] not in ('', 'directory') for group in work for name, args in group):
+      try: m6toolbox.loadGrid(cmdLineArgs.gridspec).basin_code
+      except Exception: pass # Reported by each analysis that needs it
+
+    nprocs = cmdLineArgs.nprocs
+    if nprocs is None: nprocs = min(len(work), cpu_count())
+    if len(work) > 1 and nprocs > 1:
+      pool = Pool(min(nprocs, len(work)))
+      try: results = pool.map(runGroup, work, chunksize=1)
+      finally: pool.close(); pool.join()
+    else: results = [runGroup(group) for group in work]
+
+    done = {}
+    for name, pngs, error in sorted(r for group in results for r in group):
+      if error is not None:
+        errors[name] = error
+        continue
+      files = sorted(os.listdir(os.path.join(stage, name)))
+      for file in files: shutil.move(os.path.join(stage, name, file), os.path.join(cmdLineArgs.outdir, file))
+      for n, (file, png) in enumerate(pngs):
+        if file is None: file = '%s.%i.png'%(name,n+1)
+        with open(os.path.join(cmdLineArgs.outdir, file), 'wb') as f: f.write(png)
+      done[name] = len(files) + len(pngs)
+  finally: shutil.rmtree(stage, ignore_errors=True)
+  return done, errors
+
+def main(cmdLineArgs):
+  entries = readManifest(cmdLineArgs.manifest, cmdLineArgs.analyses)
+  tic = time.time()
+  if not os.path.isdir(cmdLineArgs.outdir): os.makedirs(cmdLineArgs.outdir)
+  done, errors = runManifest(cmdLineArgs, entries)
+  for name in sorted(done): print('%s: %i plots'%(name, done[name]))
+  for name in sorted(errors): print('%s: FAILED\n%s'%(name, errors[name]))
+  print('%i of %i analyses done in %.1f s'%(len(done), len(entries), time.time()-tic))
+  if errors: raise Exception('%i analyses failed'%len(errors))
+
+if __name__ == '__main__':
+  run()
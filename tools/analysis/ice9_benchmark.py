@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import numpy
+import m6toolbox
+import time
+from scipy import ndimage
+
+def run():
+  try: import argparse
+  except: raise Exception('This version of python is not new enough. python 2.7 or newer is required.')
+  parser = argparse.ArgumentParser(description='''Times m6toolbox.ice9 on synthetic tri-polar topography
+      at resolutions up to 1/12 degree and checks the masks against the original stack-based "ice 9".''')
+  parser.add_argument('-r','--resolutions', type=float, nargs='+', default=[1., 0.5, 0.25, 0.125, 1./12.],
+    help='''Nominal grid spacings in degrees to time. Default is 1, 1/2, 1/4, 1/8 and 1/12.''')
+  parser.add_argument('--reference_limit', type=float, default=0.25,
+    help='''Finest resolution at which to also run the stack-based reference (it takes minutes below 1/4 degree).''')
+  parser.add_argument('--seed', type=int, default=1, help='''Random seed for the synthetic topography.''')
+  cmdLineArgs = parser.parse_args()
+  main(cmdLineArgs)
+
+def ice9_stack(i, j, source, xcyclic=True, tripolar=True):
+  """The original set-based implementation of "Ice 9", kept here as the reference."""
+  wetMask = 0*source
+  (nj,ni) = wetMask.shape
+  stack = set()
+  stack.add( (j,i) )
+  while stack:
+    (j,i) = stack.pop()
+    if wetMask[j,i] or source[j,i] <= 0: continue
+    wetMask[j,i] = 1
+    if i>0: stack.add( (j,i-1) )
+    elif xcyclic: stack.add( (j,ni-1) )
+    if i<ni-1: stack.add( (j,i+1) )
+    elif xcyclic: stack.add( (j,0) )
+    if j>0: stack.add( (j-1,i) )
+    if j<nj-1: stack.add( (j+1,i) )
+    elif tripolar: stack.add( (j,ni-1-i) ) # Tri-polar fold
+  return wetMask
+
+def syntheticDepth(ni, nj, seed):
+  """Smoothed random topography with ~30% land, open across the cyclic and tri-polar seams."""
+  rng = numpy.random.RandomState(seed)
+  depth = ndimage.uniform_filter(rng.standard_normal((nj,ni)), size=max(3,ni//180), mode='wrap')
+  depth = depth - numpy.percentile(depth, 30.)
+  return 4000.*depth/depth.max()
+
+def main(cmdLineArgs):
+  print('%12s %12s %10s %10s %10s %s'%('resolution','ni x nj','wet','ice9 [s]','stack [s]','identical'))
+  for res in cmdLineArgs.resolutions:
+    ni = int(round(360./res)); nj = int(round(270./res))
+    depth = syntheticDepth(ni, nj, cmdLineArgs.seed)
+    (j,i) = numpy.unravel_index(depth.argmax(), depth.shape)
+    tic = time.time()
+    wet = m6toolbox.ice9(i, j, depth)
+    tNew = time.time() - tic
+    if res >= cmdLineArgs.reference_limit:
+      tic = time.time()
+      ref = ice9_stack(i, j, depth)
+      tRef = '%10.3f'%(time.time() - tic)
+      same = str( ref.dtype==wet.dtype and numpy.array_equal(ref, wet) )
+    else: tRef = '%10s'%'-'; same = '-'
+    print('%12.4f %12s %10i %10.3f %s %s'%(res, '%ix%i'%(ni,nj), wet.sum(), tNew, tRef, same))
+
+if __name__ == '__main__':
+  run()
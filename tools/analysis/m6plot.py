@@ -11,9 +11,12 @@ except:
 import matplotlib.pyplot as plt
 from matplotlib.colors import BoundaryNorm, ListedColormap, LogNorm
 from matplotlib.ticker import MaxNLocator
+import io
 import math
-import numpy, numpy.matlib
+import multiprocessing
+import numpy
 import m6toolbox
+import streamstats
 import VerticalSplitScale
 
 try: from mpl_toolkits.basemap import Basemap
@@ -27,6 +30,9 @@ except:
   else:
     print('cmocean module not found. Some color maps may not render properly')
 
+try: from multiprocessing import shared_memory
+except: shared_memory = None # Python < 3.8: arrays are pickled to the rendering workers instead
+
 from sys import modules
 
 def xyplot(field, x=None, y=None, area=None,
@@ -35,7 +41,7 @@ def xyplot(field, x=None, y=None, area=None,
   clim=None, colormap=None, extend=None, centerlabels=False,
   nbins=None, landcolor=[.5,.5,.5],
   aspect=[16,9], resolution=576, axis=None, sigma=2.,
-  ignore=None, save=None, debug=False, show=False, interactive=False, logscale=False):
+  ignore=None, save=None, debug=False, show=False, interactive=False, logscale=False, lod=False):
   """
   Renders plot of scalar field, field(x,y).
 
@@ -68,6 +74,8 @@ def xyplot(field, x=None, y=None, area=None,
   show         If true, causes the figure to appear on screen. Used for testing. Default False.
   interactive  If true, adds interactive features such as zoom, close and cursor. Default False.
   logscale     If true, use logaritmic coloring scheme. Default False.
+  lod          If true, render the field block-averaged to about the pixel density of the axis
+               (see levelOfDetail). Statistics still use the full field. Default False.
   """
 
   # Create coordinates if not provided
@@ -94,6 +102,7 @@ def xyplot(field, x=None, y=None, area=None,
     setFigureSize(aspect, resolution, debug=debug)
     #plt.gcf().subplots_adjust(left=.08, right=.99, wspace=0, bottom=.09, top=.9, hspace=0)
     axis = plt.gca()
+  if lod: maskedField, xCoord, yCoord = levelOfDetail(maskedField, xCoord, yCoord, area, axisPixels(axis))
   plt.pcolormesh(xCoord, yCoord, maskedField, cmap=cmap, norm=norm)
   if interactive: addStatusBar(xCoord, yCoord, maskedField)
   cb = plt.colorbar(fraction=.08, pad=0.02, extend=extend)
@@ -116,6 +125,91 @@ def xyplot(field, x=None, y=None, area=None,
   if show: plt.show(block=False)
 
 
+class XYPlot:
+  """
+  A single-panel xyplot figure whose QuadMesh is built once, for drawing many fields on the same
+  grid (e.g. the months of a climatology, or the frames of an animation). The first draw() builds
+  the figure as xyplot does; later draws only update the mesh colours (set_array), color levels,
+  colorbar, annotations and titles, which is much cheaper than a new pcolormesh.
+
+    plot = m6plot.XYPlot(x, y, area=area)
+    for month in range(12):
+      plot.draw(sst[month], title=months[month], clim=ci, save='sst.%02i.png'%(month+1))
+
+  The arguments are those of xyplot, split between the figure (here) and each field (draw()).
+  """
+  def __init__(self, x=None, y=None, area=None,
+    xlabel=None, xunits=None, ylabel=None, yunits=None,
+    landcolor=[.5,.5,.5], aspect=[16,9], resolution=576, axis=None, debug=False, lod=False):
+    self.x = x; self.y = y; self.area = area
+    self.xlabel, self.xunits, self.ylabel, self.yunits = createXYlabels(x, y, xlabel, xunits, ylabel, yunits)
+    self.landcolor = landcolor; self.aspect = aspect; self.resolution = resolution
+    self.axis = axis; self.debug = debug; self.lod = lod
+    self.mesh = None; self.colorbar = None; self.shape = None; self.annotations = []
+
+  def draw(self, field, title='', suptitle='',
+    clim=None, colormap=None, extend=None, centerlabels=False,
+    nbins=None, sigma=2., ignore=None, logscale=False, save=None):
+    """Draws field(x,y) on the figure, saving it to save if given."""
+    if self.shape is not None and field.shape!=self.shape: raise Exception('field does not have the shape of the grid')
+    if ignore is not None: maskedField = numpy.ma.masked_array(field, mask=[field==ignore])
+    else: maskedField = field
+    sMin, sMax, sMean, sStd, sRMS = myStats(maskedField, self.area, debug=self.debug)
+
+    # Choose colormap
+    if nbins is None and (clim is None or len(clim)==2): nbins=35
+    if colormap is None: colormap = chooseColorMap(sMin, sMax)
+    if clim is None and sStd>0:
+      cmap, norm, extend = chooseColorLevels(sMean-sigma*sStd, sMean+sigma*sStd, colormap, clim=clim, nbins=nbins, extend=extend, logscale=logscale)
+    else:
+      cmap, norm, extend = chooseColorLevels(sMin, sMax, colormap, clim=clim, nbins=nbins, extend=extend, logscale=logscale)
+
+    if self.mesh is None: self.build(maskedField, cmap, norm)
+    else:
+      if self.lod: maskedField = levelOfDetail(maskedField, self.xCoord, self.yCoord, self.area, self.pixels)[0]
+      self.mesh.set_array(maskedField)
+      self.mesh.set_cmap(cmap); self.mesh.set_norm(norm)
+      self.colorbar.remove()
+    plt.figure(self.figure.number); plt.sca(self.axis)
+    self.colorbar = plt.colorbar(self.mesh, ax=self.axis, fraction=.08, pad=0.02, extend=extend)
+    if centerlabels and len(clim)>2: self.colorbar.set_ticks(  0.5*(clim[:-1]+clim[1:]) )
+    elif clim is not None and len(clim)>2: self.colorbar.set_ticks( clim )
+
+    for a in self.annotations: a.remove()
+    self.annotations = [self.axis.annotate('max=%.5g\nmin=%.5g'%(sMax,sMin), xy=(0.0,1.01), xycoords='axes fraction', verticalalignment='bottom', fontsize=10)]
+    if self.area is not None:
+      self.annotations.append( self.axis.annotate('mean=%.5g\nrms=%.5g'%(sMean,sRMS), xy=(1.0,1.01), xycoords='axes fraction', verticalalignment='bottom', horizontalalignment='right', fontsize=10) )
+      self.annotations.append( self.axis.annotate(' sd=%.5g\n'%(sStd), xy=(1.0,1.01), xycoords='axes fraction', verticalalignment='bottom', horizontalalignment='left', fontsize=10) )
+    self.axis.set_title(title)
+    if len(suptitle)>0: self.figure.suptitle(suptitle)
+
+    if save is not None: self.figure.savefig(save)
+
+  def build(self, field, cmap, norm):
+    """Creates the figure and the QuadMesh for the grid of field."""
+    self.shape = field.shape
+    self.xCoord, self.yCoord = createXYcoords(field, self.x, self.y)
+    if self.axis is None:
+      setFigureSize(self.aspect, self.resolution, debug=self.debug)
+      self.axis = plt.gca()
+    self.figure = self.axis.figure
+    xCoord, yCoord = self.xCoord, self.yCoord
+    if self.lod:
+      self.pixels = axisPixels(self.axis)
+      field, xCoord, yCoord = levelOfDetail(field, xCoord, yCoord, self.area, self.pixels)
+    self.mesh = self.axis.pcolormesh(xCoord, yCoord, field, cmap=cmap, norm=norm)
+    self.axis.set_facecolor(self.landcolor)
+    self.axis.set_xlim( boundaryStats(self.xCoord) )
+    self.axis.set_ylim( boundaryStats(self.yCoord) )
+    if len(self.xlabel+self.xunits)>0: self.axis.set_xlabel(label(self.xlabel, self.xunits))
+    if len(self.ylabel+self.yunits)>0: self.axis.set_ylabel(label(self.ylabel, self.yunits))
+
+  def close(self):
+    """Closes the figure."""
+    if self.mesh is not None: plt.close(self.figure)
+    self.mesh = None; self.colorbar = None; self.shape = None; self.annotations = []
+
+
 def xycompare(field1, field2, x=None, y=None, area=None,
   xlabel=None, xunits=None, ylabel=None, yunits=None,
   title1='', title2='', title3='A - B', addplabel=True, suptitle='',
@@ -123,7 +217,7 @@ def xycompare(field1, field2, x=None, y=None, area=None,
   dlim=None, dcolormap=None, dextend=None, centerdlabels=False,
   nbins=None, landcolor=[.5,.5,.5], sector=None, webversion=False,
   aspect=None, resolution=None, axis=None, npanels=3, sigma=2.,
-  ignore=None, save=None, debug=False, show=False, interactive=False):
+  ignore=None, save=None, debug=False, show=False, interactive=False, lod=False):
   """
   Renders n-panel plot of two scalar fields, field1(x,y) and field2(x,y).
 
@@ -166,6 +260,8 @@ def xycompare(field1, field2, x=None, y=None, area=None,
   show          If true, causes the figure to appear on screen. Used for testing. Default False.
   webversion    If true, set options specific for displaying figures in a web browser. Default False.
   interactive   If true, adds interactive features such as zoom, close and cursor. Default False.
+  lod           If true, render the global panels block-averaged to about the pixel density of the axes
+                (see levelOfDetail). Statistics still use the full fields. Default False.
   """
 
   if (field1.shape)!=(field2.shape): raise Exception('field1 and field2 must be the same shape')
@@ -188,11 +284,8 @@ def xycompare(field1, field2, x=None, y=None, area=None,
     maskedField1 = regionalMasking(field1,yCoord,xCoord,latRange,lonRange)
     maskedField2 = regionalMasking(field2,yCoord,xCoord,latRange,lonRange)
     areaCopy = numpy.ma.array(area,mask=maskedField1.mask,copy=True)
-  s1Min, s1Max, s1Mean, s1Std, s1RMS = myStats(maskedField1, area, debug=debug)
-  s2Min, s2Max, s2Mean, s2Std, s2RMS = myStats(maskedField2, area, debug=debug)
-  dMin, dMax, dMean, dStd, dRMS = myStats(maskedField1 - maskedField2, area, debug=debug)
-  if s1Mean is not None: dRxy = corr(maskedField1 - s1Mean, maskedField2 - s2Mean, area)
-  else: dRxy = None
+  (s1Min, s1Max, s1Mean, s1Std, s1RMS), (s2Min, s2Max, s2Mean, s2Std, s2RMS), \
+    (dMin, dMax, dMean, dStd, dRMS), dRxy = compareStats(maskedField1, maskedField2, area, debug=debug)
   s12Min = min(s1Min, s2Min); s12Max = max(s1Max, s2Max)
   xLims = boundaryStats(xCoord); yLims = boundaryStats(yCoord)
   if debug:
@@ -227,8 +320,7 @@ def xycompare(field1, field2, x=None, y=None, area=None,
   if npanels in [2,3]:
     axis = plt.subplot(npanels,1,1)
     if sector == None or sector == 'global':
-      plt.pcolormesh(xCoord, yCoord, maskedField1, cmap=cmap, norm=norm)
-      if interactive: addStatusBar(xCoord, yCoord, maskedField1)
+      pcolormeshLOD(xCoord, yCoord, maskedField1, area, lod, interactive, cmap=cmap, norm=norm)
       cb1 = plt.colorbar(fraction=.08, pad=0.02, extend=extend)
       plt.xlim( xLims ); plt.ylim( yLims )
       axis.set_xticklabels([''])
@@ -247,8 +339,7 @@ def xycompare(field1, field2, x=None, y=None, area=None,
 
     axis = plt.subplot(npanels,1,2)
     if sector == None or sector == 'global':
-      plt.pcolormesh(xCoord, yCoord, maskedField2, cmap=cmap, norm=norm)
-      if interactive: addStatusBar(xCoord, yCoord, maskedField2)
+      pcolormeshLOD(xCoord, yCoord, maskedField2, area, lod, interactive, cmap=cmap, norm=norm)
       cb2 = plt.colorbar(fraction=.08, pad=0.02, extend=extend)
       plt.xlim( xLims ); plt.ylim( yLims )
       if npanels>2: axis.set_xticklabels([''])
@@ -274,8 +365,7 @@ def xycompare(field1, field2, x=None, y=None, area=None,
                                                 extend='both', autocenter=True)
       else:
         cmap, norm, dextend = chooseColorLevels(dMin, dMax, dcolormap, clim=dlim, nbins=nbins, extend=dextend, autocenter=True)
-      plt.pcolormesh(xCoord, yCoord, maskedField1 - maskedField2, cmap=cmap, norm=norm)
-      if interactive: addStatusBar(xCoord, yCoord, maskedField1 - maskedField2)
+      pcolormeshLOD(xCoord, yCoord, maskedField1 - maskedField2, area, lod, interactive, cmap=cmap, norm=norm)
       if dextend is None: dextend = extend
       cb3 = plt.colorbar(fraction=.08, pad=0.02, extend=dextend) # was extend!
       if centerdlabels and len(dlim)>2: cb3.set_ticks(  0.5*(dlim[:-1]+dlim[1:]) )
@@ -472,13 +562,11 @@ def yzcompare(field1, field2, y=None, z=None,
 
   # Diagnose statistics
   yzWeighting = yzWeight(y, z)
-  s1Min, s1Max, s1Mean, s1Std, s1RMS = myStats(maskedField1, yzWeighting, debug=debug)
   if ignore is not None: maskedField2 = numpy.ma.masked_array(field2, mask=[field2==ignore])
   else: maskedField2 = field2.copy()
   yCoord, zCoord, field2 = m6toolbox.section2quadmesh(y, z, maskedField2)
-  s2Min, s2Max, s2Mean, s2Std, s2RMS = myStats(maskedField2, yzWeighting, debug=debug)
-  dMin, dMax, dMean, dStd, dRMS = myStats(maskedField1 - maskedField2, yzWeighting, debug=debug)
-  dRxy = corr(maskedField1 - s1Mean, maskedField2 - s2Mean, yzWeighting)
+  (s1Min, s1Max, s1Mean, s1Std, s1RMS), (s2Min, s2Max, s2Mean, s2Std, s2RMS), \
+    (dMin, dMax, dMean, dStd, dRMS), dRxy = compareStats(maskedField1, maskedField2, yzWeighting, debug=debug)
   s12Min = min(s1Min, s2Min); s12Max = max(s1Max, s2Max)
   xLims = numpy.amin(yCoord), numpy.amax(yCoord); yLims = boundaryStats(zCoord)
   if debug:
@@ -654,6 +742,182 @@ def ztplot(field, t=None, z=None,
   if interactive: addInteractiveCallbacks()
   if show: plt.show(block=False)
 
+class RenderQueue:
+  """
+  Queue of figures to render concurrently in a pool of worker processes, e.g.
+
+    queue = m6plot.RenderQueue()
+    queue.add(m6plot.xyplot, field, x, y, area=area, clim=ci, save=img)
+    queue.add(m6plot.xycompare, field1, field2, x, y, area=area, save='plot.png')
+    imgbufs = queue.render()
+
+  Figures are specified by the m6plot function and the arguments it would be called with.
+  save can be a file name, a file object such as io.BytesIO (filled when rendered) or None
+  (a new io.BytesIO is made). render() returns the save targets, in the order added.
+
+  Arrays of at least shareSize bytes are passed to the workers through shared memory,
+  once each however many figures use them, instead of being pickled for every figure.
+  """
+  def __init__(self, nprocs=None, shareSize=2**20):
+    self.nprocs = nprocs
+    self.shareSize = shareSize
+    self.jobs = []
+
+  def add(self, plot, *args, **kwargs):
+    """Queues the figure plot(*args, **kwargs)."""
+    self.jobs.append( (plot, args, kwargs) )
+
+  def render(self):
+    """Renders the queued figures and returns their save targets."""
+    jobs, self.jobs = self.jobs, []
+    targets = []
+    for plot, args, kwargs in jobs:
+      save = kwargs.get('save')
+      if save is None: save = io.BytesIO()
+      targets.append(save)
+    work = [(plot, args, _renderTarget(kwargs)) for plot, args, kwargs in jobs]
+    nprocs = self.nprocs
+    if nprocs is None: nprocs = min(len(work), multiprocessing.cpu_count())
+    if multiprocessing.current_process().daemon: nprocs = 1 # Pool workers can not have their own pools
+    if nprocs > 1:
+      shared = SharedArrays(self.shareSize)
+      try:
+        work = [shared.pack(job) for job in work]
+        pool = multiprocessing.Pool(min(nprocs, len(work)))
+        try: pngs = pool.map(_renderJob, work, chunksize=1)
+        finally: pool.close(); pool.join()
+      finally: shared.release()
+    else: pngs = [_renderJob(job) for job in work]
+    for save, png in zip(targets, pngs):
+      if png is not None: save.write(png)
+    return targets
+
+def _renderTarget(kwargs):
+  """Returns kwargs with save=None if it is not a file name (the worker renders to memory)."""
+  kwargs = dict(kwargs)
+  if not isinstance(kwargs.get('save'), str): kwargs['save'] = None
+  kwargs['show'] = False
+  kwargs['interactive'] = False
+  return kwargs
+
+def _renderJob(job):
+  """Renders one queued figure. Returns the PNG bytes, or None if it was saved to a file."""
+  attached = []
+  plot, args, kwargs = unpackShared(job, attached)
+  png = None
+  if kwargs['save'] is None:
+    kwargs['save'] = io.BytesIO()
+    png = kwargs['save']
+  try:
+    plot(*args, **kwargs)
+  finally:
+    plt.close('all')
+    del args, kwargs
+    for mem in attached:
+      try: mem.close()
+      except BufferError: pass # Still referenced, released when the worker exits
+  if png is not None: return png.getvalue()
+  return None
+
+class _Shared:
+  """Handle to an array in shared memory: (name, shape, dtype) of the data and, if masked, of the mask."""
+  def __init__(self, data, mask=None, fill_value=None):
+    self.data = data; self.mask = mask; self.fill_value = fill_value
+
+class SharedArrays:
+  """
+  Copies the large arrays in (nested tuples, lists and dicts of) arguments to shared memory,
+  each array once however often it appears, until release().
+  """
+  def __init__(self, minSize=2**20):
+    self.minSize = minSize
+    self.handles = {}
+    self.arrays = [] # Keeps the arrays (and so their ids) alive
+    self.memory = []
+
+  def pack(self, value):
+    """Returns value with the large arrays replaced by handles to shared copies."""
+    if isinstance(value, tuple): return tuple( self.pack(v) for v in value )
+    if isinstance(value, list): return [self.pack(v) for v in value]
+    if isinstance(value, dict): return dict( (k, self.pack(v)) for k, v in value.items() )
+    if shared_memory is None or not isinstance(value, numpy.ndarray) or value.nbytes < self.minSize: return value
+    if id(value) not in self.handles:
+      if numpy.ma.isMaskedArray(value):
+        handle = _Shared(self._share(value.data), self._share(numpy.ma.getmaskarray(value)), value.fill_value)
+      else: handle = _Shared(self._share(value))
+      self.handles[id(value)] = handle
+      self.arrays.append(value)
+    return self.handles[id(value)]
+
+  def _share(self, a):
+    a = numpy.ascontiguousarray(a)
+    mem = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+    numpy.ndarray(a.shape, dtype=a.dtype, buffer=mem.buf)[...] = a
+    self.memory.append(mem)
+    return (mem.name, a.shape, a.dtype.str)
+
+  def release(self):
+    for mem in self.memory:
+      mem.close(); mem.unlink()
+    self.handles = {}; self.arrays = []; self.memory = []
+
+def unpackShared(value, attached):
+  """Returns value with the handles made by SharedArrays.pack() replaced by arrays. attached lists the memory opened."""
+  if isinstance(value, tuple): return tuple( unpackShared(v, attached) for v in value )
+  if isinstance(value, list): return [unpackShared(v, attached) for v in value]
+  if isinstance(value, dict): return dict( (k, unpackShared(v, attached)) for k, v in value.items() )
+  if not isinstance(value, _Shared): return value
+  def attach(handle):
+    name, shape, dtype = handle
+    mem = shared_memory.SharedMemory(name=name)
+    attached.append(mem)
+    return numpy.ndarray(shape, dtype=dtype, buffer=mem.buf)
+  if value.mask is None: return attach(value.data)
+  return numpy.ma.array(attach(value.data), mask=attach(value.mask), fill_value=value.fill_value, copy=False)
+
+def pcolormeshLOD(xCoord, yCoord, field, area, lod, interactive, **kwargs):
+  """pcolormesh of field in the current axis, at the level of detail of the axis if lod is True."""
+  if lod: field, xCoord, yCoord = levelOfDetail(field, xCoord, yCoord, area, axisPixels(plt.gca()))
+  plt.pcolormesh(xCoord, yCoord, field, **kwargs)
+  if interactive: addStatusBar(xCoord, yCoord, field)
+
+
+def axisPixels(axis):
+  """Returns the size of axis in pixels as (rows, columns)."""
+  bbox = axis.get_window_extent()
+  return bbox.height, bbox.width
+
+
+def levelOfDetail(field, xCoord, yCoord, area, pixels):
+  """
+  Returns field(nj,ni) and its corner coordinates reduced to about pixels=(rows,columns) cells, by
+  averaging blocks of f x f cells weighted by area (or equally if area is None) and ignoring masked
+  values. Blocks with no unmasked values are masked. The field is returned unchanged if cells are
+  already bigger than half a pixel.
+
+  The blocks along each row are mirror-symmetric about the middle column, so that blocks meeting
+  across a tri-polar fold in the top row are averages of cells that meet there.
+  """
+  nj, ni = field.shape
+  f = int( min( nj/float(pixels[0]), ni/float(pixels[1]) ) )
+  if f < 2: return field, xCoord, yCoord
+  jStart = numpy.arange(0, nj, f)
+  left = list(range(0, (ni+1)//2, f))
+  iStart = numpy.array( sorted( set( left + [ni - i for i in left] ) )[:-1] )
+  W = numpy.zeros( (len(jStart), len(iStart)) ); S = numpy.zeros( W.shape )
+  for n, j in enumerate(jStart):
+    band = field[j:j+f]
+    if area is None: w = numpy.ones(band.shape)
+    else: w = numpy.ma.filled(area[j:j+f], 0.).astype(numpy.float64)
+    w = numpy.where(numpy.ma.getmaskarray(band), 0., w)
+    W[n] = numpy.add.reduceat(w.sum(axis=0), iStart)
+    S[n] = numpy.add.reduceat((w*numpy.ma.filled(band, 0.)).sum(axis=0), iStart)
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    coarse = numpy.ma.masked_where(W==0, S/W)
+  jCorner = numpy.append(jStart, nj); iCorner = numpy.append(iStart, ni)
+  return coarse, xCoord[jCorner][:,iCorner], yCoord[jCorner][:,iCorner]
+
+
 def chooseColorMap(sMin, sMax, difference=None):
   """
   Based on the min/max extremes of the data, choose a colormap that fits the data.
@@ -731,24 +995,31 @@ def pmCI(min, max, ci, *args):
 
 def myStats(s, area, s2=None, debug=False):
   """
-  Calculates mean, standard deviation and root-mean-square of s.
-  """
-  sMin = numpy.ma.min(s); sMax = numpy.ma.max(s)
-  if area is None: return sMin, sMax, None, None, None
-  weight = area.copy()
-  if debug: print(('myStats: sum(area) =',numpy.ma.sum(weight)))
-  if not numpy.ma.getmask(s).any()==numpy.ma.nomask: weight[s.mask] = 0.
-  sumArea = numpy.ma.sum(weight)
-  if debug: print(('myStats: sum(area) =',sumArea,'after masking'))
-  if debug: print(('myStats: sum(s) =',numpy.ma.sum(s)))
-  if debug: print(('myStats: sum(area*s) =',numpy.ma.sum(weight*s)))
-  mean = numpy.ma.sum(weight*s)/sumArea
-  std = math.sqrt( numpy.ma.sum( weight*((s-mean)**2) )/sumArea )
-  rms = math.sqrt( numpy.ma.sum( weight*(s**2) )/sumArea )
-  if debug: print(('myStats: mean(s) =',mean))
-  if debug: print(('myStats: std(s) =',std))
-  if debug: print(('myStats: rms(s) =',rms))
-  return sMin, sMax, mean, std, rms
+  Calculates min, max and the area-weighted mean, standard deviation and root-mean-square of s,
+  in one pass over s and area (see Stats).
+  """
+  stats = Stats()
+  for block, weight in statsBlocks(area, s):
+    stats.update(block[0], weight)
+  if debug: print(('myStats: sum(area) =',stats.moments.W,'after masking'))
+  if area is None: return stats.min, stats.max, None, None, None
+  return stats.results()
+
+
+def compareStats(s1, s2, area, debug=False):
+  """
+  Returns the myStats() of s1, of s2 and of s1-s2, and the correlation coefficient of s1 and s2
+  (None if area is None), all from one pass over s1, s2 and area.
+  """
+  stats1 = Stats(); stats2 = Stats(); statsD = Stats(); both = streamstats.CoMoments()
+  for (b1, b2), weight in statsBlocks(area, s1, s2):
+    stats1.update(b1, weight); stats2.update(b2, weight)
+    statsD.update(b1 - b2, weight)
+    if weight is not None: both.update(b1.ravel(), b2.ravel(), weight.ravel())
+  if area is None:
+    return (stats1.min, stats1.max, None, None, None), (stats2.min, stats2.max, None, None, None), \
+           (statsD.min, statsD.max, None, None, None), None
+  return stats1.results(), stats2.results(), statsD.results(), float(both.correlation())
 
 
 def corr(s1, s2, area):
@@ -756,41 +1027,101 @@ def corr(s1, s2, area):
   Calculates the correlation coefficient between s1 and s2, assuming s1 and s2 have
   not mean. That is s1 = S - mean(S), etc.
   """
-  weight = area.copy()
-  if not numpy.ma.getmask(s1).any()==numpy.ma.nomask: weight[s1.mask] = 0.
-  sumArea = numpy.ma.sum(weight)
-  v1 = numpy.ma.sum( weight*(s1**2) )/sumArea
-  v2 = numpy.ma.sum( weight*(s2**2) )/sumArea
-  if v1==0 or v2==0: return numpy.NaN
-  rxy = numpy.ma.sum( weight*(s1*s2) )/sumArea / math.sqrt( v1*v2 )
-  return rxy
+  both = streamstats.CoMoments()
+  for (b1, b2), weight in statsBlocks(area, s1, s2):
+    if weight is not None: both.update(b1.ravel(), b2.ravel(), weight.ravel())
+  return float(both.correlation(centered=True))
+
 
+def statsBlocks(area, *fields):
+  """
+  Yields blocks of rows of fields, as float64 masked arrays, with the matching float64 block of
+  area (or None), so that statistics are accumulated in one pass without copying whole arrays.
+  """
+  shape = numpy.shape(fields[0])
+  if len(shape)<2: shape = (1,) + shape
+  rows = int(numpy.prod(shape[:-1])); ni = shape[-1]
+  step = max(1, 2**16 // max(1, ni))
+  fields = [numpy.ma.asanyarray(f).reshape(rows, ni) for f in fields]
+  if area is not None: area = numpy.ma.asanyarray(area).reshape(rows, ni)
+  for j in range(0, rows, step):
+    blocks = [numpy.ma.array(f[j:j+step], dtype=numpy.float64) for f in fields]
+    if area is None: weight = None
+    else: weight = numpy.ma.filled(area[j:j+step], 0.).astype(numpy.float64)
+    yield blocks, weight
+
+
+class Stats:
+  """
+  Running min and max of a field and, given weights, its weighted moments (streamstats.Moments),
+  updated block by block.
+  """
+  def __init__(self):
+    self.min = numpy.ma.masked; self.max = numpy.ma.masked
+    self.moments = streamstats.Moments()
+
+  def update(self, s, weight=None):
+    """Adds the unmasked values of the masked array s with the matching weights."""
+    valid = ~numpy.ma.getmaskarray(s)
+    if not valid.any(): return
+    x = numpy.ma.getdata(s)[valid]
+    self.min = min(self.min, x.min()) if self.min is not numpy.ma.masked else x.min()
+    self.max = max(self.max, x.max()) if self.max is not numpy.ma.masked else x.max()
+    if weight is not None: self.moments.update(s.ravel(), weight.ravel())
+
+  def results(self):
+    """
+    Returns min, max, mean, standard deviation and root-mean-square. With no weight, the mean is
+    masked if there were no values at all and NaN otherwise, and the others NaN.
+    """
+    if not self.moments.W > 0:
+      if self.min is numpy.ma.masked: return self.min, self.max, numpy.ma.masked, numpy.nan, numpy.nan
+      return self.min, self.max, numpy.nan, numpy.nan, numpy.nan
+    mean = float(self.moments.weightedMean()); variance = float(self.moments.variance())
+    return self.min, self.max, mean, math.sqrt(variance), math.sqrt(variance + mean**2)
+
+
+_cornerCache = [] # (shape, x, y, corners) of the most recent grids, newest last
 
 def createXYcoords(s, x, y):
   """
   Checks that x and y are appropriate 2D corner coordinates
   and tries to make some if they are not.
+
+  1D coordinates become read-only broadcast views rather than 2D copies. The corner coordinates
+  of the last few grids are cached, keyed by the identity of x and y, so repeated plots on the
+  same grid (e.g. the panels of xycompare or successive xyplots) share them. Coordinates must
+  therefore not be modified in place between plots.
   """
+  for shape, cx, cy, corners in _cornerCache:
+    if shape==s.shape and cx is x and cy is y: return corners
   nj, ni = s.shape
   if x is None: xCoord = numpy.arange(0., ni+1)
   else: xCoord = numpy.ma.filled(x, 0.)
   if y is None: yCoord = numpy.arange(0., nj+1)
   else: yCoord = numpy.ma.filled(y, 0.)
 
-  # Turn coordinates into 2D arrays if 1D arrays were provided
-  if len(xCoord.shape)==1:
-    nxy = yCoord.shape
-    xCoord = numpy.matlib.repmat(xCoord, nxy[0], 1)
-  nxy = xCoord.shape
-  if len(yCoord.shape)==1: yCoord = numpy.matlib.repmat(yCoord.T, nxy[-1], 1).T
-  if xCoord.shape!=yCoord.shape: raise Exception('The shape of coordinates are mismatched!')
+  # The 2D shape of the coordinates, 1D arrays being repeated along the other dimension
+  if len(xCoord.shape)==1: nxy = (yCoord.shape[0], xCoord.shape[0])
+  else: nxy = xCoord.shape
+  if len(yCoord.shape)==1 and yCoord.shape[0]!=nxy[0]: raise Exception('The shape of coordinates are mismatched!')
+  if len(yCoord.shape)>1 and yCoord.shape!=nxy: raise Exception('The shape of coordinates are mismatched!')
 
   # Create corner coordinates from center coordinates is center coordinates were provided
-  if xCoord.shape!=yCoord.shape: raise Exception('The shape of coordinates are mismatched!')
-  if s.shape==xCoord.shape:
-    xCoord = expandJ( expandI( xCoord ) )
-    yCoord = expandJ( expandI( yCoord ) )
-  return xCoord, yCoord
+  centers = s.shape==nxy
+  if centers: nxy = (nxy[0]+1, nxy[1]+1)
+  if len(xCoord.shape)==1:
+    if centers: xCoord = expandI(xCoord.reshape(1,-1))[0] # Array arithmetic in the dtype of x, as expandI() did
+    xCoord = numpy.broadcast_to(xCoord, nxy)
+  elif centers: xCoord = expandJ( expandI( xCoord ) )
+  if len(yCoord.shape)==1:
+    if centers: yCoord = expand(yCoord.astype(numpy.float64)) # In float64, as expandJ( expandI() ) did
+    yCoord = numpy.broadcast_to(yCoord.reshape(-1,1), nxy)
+  elif centers: yCoord = expandJ( expandI( yCoord ) )
+
+  corners = xCoord, yCoord
+  _cornerCache.append( (s.shape, x, y, corners) ); del _cornerCache[:-4]
+  return corners
 
 
 def expandI(a):
@@ -1038,7 +1369,7 @@ def yzWeight(y, z):
   elevations of each column. Returns weight(nk,nj).
   """
   dz = z[:-1,:] - z[1:,:]
-  return numpy.matlib.repmat(y[1:] - y[:-1], dz.shape[0], 1) * dz
+  return (y[1:] - y[:-1]) * dz
 
 
 def dunne_rainbow(N=256):
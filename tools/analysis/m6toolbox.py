@@ -1,9 +1,19 @@
 """
 A collection of useful functions...
 """
+import atexit
+import glob
+import hashlib
+import io
+import mmap
+import netCDF4
 import numpy as np
+import os
+import re
 import tarfile
 from scipy.io import netcdf
+from floodfill import ice9
+from spatialindex import sphericalIndex
 
 def section2quadmesh(x, z, q, representation='pcm'):
   """
@@ -124,35 +134,6 @@ def rho_Wright97(S, T, P=0):
   return (P + p0) / (Lambda + al0*(P + p0))
 
 
-def ice9(i, j, source, xcyclic=True, tripolar=True):
-  """
-  An iterative (stack based) implementation of "Ice 9".
-
-  The flood fill starts at [j,i] and treats any positive value of "source" as
-  passable. Zero and negative values block flooding.
-
-  xcyclic = True allows cyclic behavior in the last index. (default)
-  tripolar = True allows a fold across the top-most edge. (default)
-
-  Returns an array of 0's and 1's.
-  """
-  wetMask = 0*source
-  (nj,ni) = wetMask.shape
-  stack = set()
-  stack.add( (j,i) )
-  while stack:
-    (j,i) = stack.pop()
-    if wetMask[j,i] or source[j,i] <= 0: continue
-    wetMask[j,i] = 1
-    if i>0: stack.add( (j,i-1) )
-    elif xcyclic: stack.add( (j,ni-1) )
-    if i<ni-1: stack.add( (j,i+1) )
-    elif xcyclic: stack.add( (j,0) )
-    if j>0: stack.add( (j-1,i) )
-    if j<nj-1: stack.add( (j+1,i) )
-    elif tripolar: stack.add( (j,ni-1-i) ) # Tri-polar fold
-  return wetMask
-
 def ice9Wrapper(x, y, depth, xy0):
   ji = nearestJI(x, y, xy0)
   return ice9(ji[1], ji[0], depth)
@@ -169,22 +150,35 @@ def maskFromDepth(depth, zCellTop):
   wet[depth>-zCellTop] = 1
   return wet
 
-def MOCpsi(vh, vmsk=None):
-  """Sums 'vh' zonally and cumulatively in the vertical to yield an overturning stream function, psi(y,z)."""
-  shape = list(vh.shape); shape[-3] += 1
-  psi = np.zeros(shape[:-1])
-  if len(shape)==3:
-    for k in range(shape[-3]-1,0,-1):
-      if vmsk is None: psi[k-1,:] = psi[k,:] - vh[k-1].sum(axis=-1)
-      else: psi[k-1,:] = psi[k,:] - (vmsk*vh[k-1]).sum(axis=-1)
-  else:
-    for n in range(shape[0]):
-      for k in range(shape[-3]-1,0,-1):
-        if vmsk is None: psi[n,k-1,:] = psi[n,k,:] - vh[n,k-1].sum(axis=-1)
-        else: psi[n,k-1,:] = psi[n,k,:] - (vmsk*vh[n,k-1]).sum(axis=-1)
-  return psi
+def MOCpsi(vh, vmsk=None, dtype=None, out=None):
+  """
+  Sums 'vh' zonally and cumulatively in the vertical to yield an overturning stream function, psi(z,y).
+
+  vh(...,z,y,x) may have any number of leading dimensions. The zonal sums are accumulated in the
+  precision of vh unless dtype is given (e.g. numpy.float64 for float32 data) and the vertical
+  sums in that of psi (float64). If out(...,z+1,y) is given, psi is written into it and returned.
+  """
+  shape = list(vh.shape[:-1]); shape[-2] += 1
+  if out is None: out = np.zeros(shape)
+  else: out[...,-1,:] = 0.
+  if vmsk is not None: # The masked zonal sums as one einsum, with no vmsk*vh temporary
+    if dtype is None: dtype = np.result_type(vmsk, vh)
+    vmsk = np.ma.filled(vmsk, 0)
+  def zonalSum(a):
+    if vmsk is None: return a.sum(axis=-1, dtype=dtype)
+    return np.einsum('...kji,ji->...kj', a, vmsk, dtype=dtype, casting='same_kind')
+  if np.ma.is_masked(vh): # Masked values count as 0: filled a few levels at a time to bound the copy
+    levels = vh.reshape((-1,)+vh.shape[-2:])
+    trans = np.empty(levels.shape[:-1], dtype=vh.dtype if dtype is None else dtype)
+    block = max(1, 2**20//(vh.shape[-2]*vh.shape[-1]))
+    for n in range(0, levels.shape[0], block):
+      trans[n:n+block] = zonalSum(np.ma.filled(levels[n:n+block], 0))
+    trans = trans.reshape(vh.shape[:-1])
+  else: trans = zonalSum(np.ma.getdata(vh))
+  # psi[k-1] = psi[k] - trans[k-1], upwards from psi = 0 at the bottom
+  np.cumsum(-trans[...,::-1,:], axis=-2, dtype=out.dtype, out=out[...,-2::-1,:])
+  return out
 
- 
 def moc_maskedarray(vh,mask=None):
     if mask is not None:
         _mask = np.ma.masked_where(np.not_equal(mask,1.),mask)
@@ -199,18 +193,461 @@ def moc_maskedarray(vh,mask=None):
     _vh = _vh[:,::-1] # flip z-axis back to original order
     return _vh
 
+def basinIndex(basin_code, basins, vpoint=False):
+  """
+  Returns an integer array, shaped as basin_code, that is n where the code is one
+  of basins[n] (a list of codes) and len(basins) elsewhere. The basins should not
+  overlap.
+
+  vpoint = True puts a point in a basin only when both cells j and j+1 are in it,
+  as used for the v-points on the northern face of each cell.
+  """
+  codes = np.ma.filled(basin_code, 0)
+  index = np.zeros(codes.shape, dtype=int) + len(basins)
+  for n, basin in enumerate(basins):
+    inBasin = np.zeros(codes.shape, dtype=bool)
+    for code in basin: inBasin |= (codes==code)
+    if vpoint: inBasin = inBasin & np.roll(inBasin, -1, axis=-2)
+    index[inBasin] = n
+  return index
+
+def zonalBasinSum(field, index, nbasins):
+  """
+  Sums field(...,y,x) in x over each basin of index(y,x) (see basinIndex) in a single
+  pass, accumulating in float64. Returns sums(...,nbasins+1,y) where sums[...,n,:] is
+  the sum over basin n < nbasins and sums[...,nbasins,:] is the sum over all x.
+
+  If field is a masked array, masked values are skipped and a sum is masked where
+  there are no unmasked values.
+  """
+  nj, ni = index.shape
+  nbins = (nbasins+1)*nj
+  bins = ( index*nj + np.arange(nj).reshape(nj,1) ).ravel()
+  isMasked = np.ma.isMaskedArray(field)
+  leading = field.shape[:-2]
+  field = field.reshape( (-1, nj*ni) )
+  sums = np.zeros( (field.shape[0], nbins) )
+  if isMasked: counts = np.zeros( (field.shape[0], nbins) )
+  for n in range(field.shape[0]):
+    sums[n] = np.bincount(bins, weights=np.ma.filled(field[n], 0.), minlength=nbins)
+    if isMasked: counts[n] = np.bincount(bins, weights=~np.ma.getmaskarray(field[n]), minlength=nbins)
+  sums = sums.reshape( (-1, nbasins+1, nj) )
+  sums[:,-1] = sums.sum(axis=1) # Everything not in a basin was binned in the last slot
+  if isMasked:
+    counts = counts.reshape( (-1, nbasins+1, nj) )
+    counts[:,-1] = counts.sum(axis=1)
+    sums = np.ma.array(sums, mask=(counts==0))
+  return sums.reshape( leading + (nbasins+1, nj) )
+
+def basinMOCpsi(vh, index, nbasins):
+  """
+  Returns the overturning stream functions psi(...,basin,z_i,y) of vh(...,z,y,x) for
+  each basin of index(y,x) and, last, for the whole domain, from one pass over vh
+  (see zonalBasinSum). As for moc_maskedarray, psi is masked where the zonal sum of
+  vh is masked and the bottom interface takes the mask of the bottom layer.
+  """
+  trans = np.moveaxis( zonalBasinSum(vh, index, nbasins), -3, -2 ) # (...,basin,z,y)
+  shape = list(trans.shape); shape[-2] += 1
+  psi = np.zeros(shape)
+  psi[...,:-1,:] = -np.cumsum( np.ma.filled(trans, 0.)[...,::-1,:], axis=-2 )[...,::-1,:]
+  if np.ma.isMaskedArray(trans):
+    mask = np.ma.getmaskarray(trans)
+    psi = np.ma.array(psi, mask=np.concatenate( (mask, mask[...,-1:,:]), axis=-2 ))
+  return psi
+
+def zonalBasinMin(field, index, nbasins):
+  """
+  As zonalBasinSum but the minimum over x of field(...,y,x) for each basin, and last over all x.
+  Minima over no (unmasked) values are masked.
+  """
+  nj, ni = index.shape
+  nbins = (nbasins+1)*nj
+  bins = ( index*nj + np.arange(nj).reshape(nj,1) ).ravel()
+  order = np.argsort(bins, kind='mergesort') # Cells grouped by (basin,y)
+  counts = np.bincount(bins, minlength=nbins)
+  nonEmpty = counts>0
+  starts = (np.cumsum(counts) - counts)[nonEmpty]
+  leading = field.shape[:-2]
+  field = field.reshape( (-1, nj*ni) )
+  mins = np.zeros( (field.shape[0], nbins) ) + np.inf
+  for n in range(field.shape[0]):
+    mins[n,nonEmpty] = np.minimum.reduceat(np.ma.filled(field[n], np.inf)[order], starts)
+  mins = mins.reshape( (-1, nbasins+1, nj) )
+  mins[:,-1] = mins.min(axis=1) # Everything not in a basin was binned in the last slot
+  return np.ma.masked_invalid( mins.reshape( leading + (nbasins+1, nj) ) )
+
+class ZonalAverager:
+  """
+  Volume-weighted zonal averages over several basins at once of fields on the layers of
+  eta(k,y,x), with basins given by index(y,x) (see basinIndex). The layer volumes, their
+  zonal sums and the interface depths are computed once and reused for every field.
+  """
+  def __init__(self, eta, area, index, nbasins):
+    self.index = index; self.nbasins = nbasins
+    self.vols = area * ( eta[:-1] - eta[1:] ) # area * level thicknesses
+    self.volume = zonalBasinSum(self.vols, index, nbasins)
+    # Deepest interface, as the zonal minimum of mask*eta where mask is 1 in the basin and 0 elsewhere
+    self.z = zonalBasinMin(eta, index, nbasins)
+    cells = np.array( [ (index==n).sum(axis=-1) for n in range(nbasins) ] )
+    outside = np.concatenate( (cells < index.shape[-1], np.zeros((1,index.shape[-2]), dtype=bool)) )
+    self.z = np.ma.filled( np.ma.where(outside, np.ma.minimum(self.z, 0.), self.z), 0. )
+
+  def mean(self, field):
+    """Returns the zonal averages of field(k,y,x) as (basin,k,y), with the basins in order and the whole domain last."""
+    return np.moveaxis( zonalBasinSum(self.vols * field, self.index, self.nbasins) / self.volume, -2, 0 )
+
+  def depth(self):
+    """Returns the interface depths z(basin,k+1,y) to plot the averages against."""
+    return np.moveaxis( self.z, -2, 0 )
+
+_averagers = []
+
+def zonalAverager(key, eta, area, index, nbasins):
+  """
+  Returns a ZonalAverager, reusing the one made for the same key (e.g. the file eta was read from)
+  by a previous call in this process, such as the temperature bias before the salinity bias.
+  Only the two most recent are kept.
+  """
+  for cachedKey, averager in _averagers:
+    if cachedKey == key: return averager
+  averager = ZonalAverager(eta, area, index, nbasins)
+  _averagers.append( (key, averager) ); del _averagers[:-2]
+  return averager
+
 def nearestJI(x, y, xy0):
   """
-  Find (j,i) of cell with center nearest to (x0,y0).
+  Find (j,i) of cell with center nearest to (x0,y0), by great-circle distance.
+  The spatial index of x,y is built on the first call and reused while the same arrays are passed.
   """
   x0,y0 = xy0
-  return np.unravel_index( ((x-x0)**2 + (y-y0)**2).argmin() , x.shape)
+  j,i = sphericalIndex(x, y).nearest(x0, y0)
+  return int(j), int(i)
+
+class TarNC:
+  """
+  Read-only access to the netCDF files inside a tar file (e.g. a mosaic gridspec tar).
+
+  The member index (name -> data offset and size) is built with a single scan of
+  the tar headers when the object is created. The tar is memory-mapped and each
+  member is opened in place from its offset, so nothing is extracted or copied
+  and only the pages of the variables actually read are touched. Each member is
+  opened once and its variables are all served from that one handle.
+  """
+  def __init__(self, tar):
+    self.tar = tar
+    with tarfile.open(tar, 'r') as TF:
+      self.members = dict( (m.name, (m.offset_data, m.size)) for m in TF.getmembers() if m.isfile() )
+    self._file = open(tar, 'rb')
+    self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    self._buffers = {}
+    self._datasets = {}
+
+  def member(self, file):
+    """Returns the name of the member matching file (by base name, else by substring)."""
+    matches = [m for m in self.members if os.path.basename(m)==file]
+    if not matches: matches = [m for m in sorted(self.members) if file in m]
+    if not matches: raise KeyError('No member matching "%s" in "%s"'%(file, self.tar))
+    return matches[0]
+
+  def dataset(self, file):
+    """Returns the open dataset for the member matching file."""
+    name = self.member(file)
+    if name not in self._datasets:
+      offset, size = self.members[name]
+      buf = memoryview(self._mm)[offset:offset+size]
+      if getattr(netCDF4, '__has_nc_open_mem__', False): nc = netCDF4.Dataset(name, 'r', memory=buf)
+      else: nc = netcdf.netcdf_file(io.BytesIO(buf), 'r')
+      self._buffers[name] = buf; self._datasets[name] = nc
+    return self._datasets[name]
+
+  def variable(self, file, var):
+    """Returns variable var from the member matching file."""
+    return self.dataset(file).variables[var]
+
+  def close(self):
+    for name in list(self._datasets): self._datasets.pop(name).close()
+    for name in list(self._buffers): self._buffers.pop(name).release()
+    self._mm.close(); self._file.close()
+
+_tars = {} # path -> (size, mtime), TarNC
+
+def openTar(tar):
+  """
+  Returns the (cached) TarNC for a tar file. If the file has changed since it was opened,
+  the old TarNC is closed and the file is re-indexed.
+  """
+  st = os.stat(tar)
+  path, sig = os.path.realpath(tar), (st.st_size, st.st_mtime)
+  if path in _tars and _tars[path][0] != sig: _tars.pop(path)[1].close()
+  if path not in _tars: _tars[path] = (sig, TarNC(tar))
+  return _tars[path][1]
+
+@atexit.register
+def closeTars():
+  """Closes all tar files opened by openTar()."""
+  while _tars: _tars.popitem()[1][1].close()
 
 def readNCFromTar(tar,file,var):
-  TF = tarfile.open(tar,'r')
-  member = [m for m in TF.getmembers() if file in m.name][0]
-  nc = netcdf.netcdf_file(TF.extractfile(member),'r')
-  return nc.variables[var]
+  return openTar(tar).variable(file, var)
+
+class Grid(object):
+  """
+  Grid fields derived from a gridspec (see loadGrid):
+    x, y             corner coordinates, supergrid[::2,::2]
+    xcenter, ycenter cell-center coordinates, supergrid[1::2,1::2]
+    msk              ocean mask from ocean_mask.nc
+    area             msk times the cell area (sum of the 2x2 supergrid areas)
+    depth            depth from ocean_topog.nc
+    basin_code       basin codes from basin_codes.nc or, if absent, from basinMasks()
+                     on first access, so that scripts not using them never pay for it
+  """
+  fields = ['x', 'y', 'xcenter', 'ycenter', 'msk', 'area', 'depth', 'basin_code']
+  def __init__(self, **kwargs):
+    for name in self.fields: setattr(self, name, kwargs.get(name))
+
+  @property
+  def basin_code(self):
+    if self._basin_code is None: self._basin_code = basinMasks(self.xcenter, self.ycenter, self.depth)
+    return self._basin_code
+
+  @basin_code.setter
+  def basin_code(self, code): self._basin_code = code
+
+gridCacheVersion = 1
+_grids = {}
+
+def gridCacheDir():
+  """Directory for grid cache files: $M6_GRID_CACHE, or ~/.cache/m6toolbox by default."""
+  return os.environ.get('M6_GRID_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'm6toolbox'))
+
+def gridspecKey(gridspec):
+  """
+  Returns a hash identifying the contents of a gridspec directory or tar file,
+  built from the resolved path, size and modification time of each file read.
+  """
+  if os.path.isdir(gridspec):
+    files = [os.path.join(gridspec, f) for f in ['ocean_hgrid.nc', 'ocean_mask.nc', 'ocean_topog.nc', 'basin_codes.nc']]
+  else: files = [gridspec]
+  sig = ['m6toolbox.Grid v%i'%gridCacheVersion]
+  for f in files:
+    if os.path.exists(f):
+      st = os.stat(f)
+      sig.append('%s %i %r'%(os.path.realpath(f), st.st_size, st.st_mtime))
+  return hashlib.sha1('\n'.join(sig).encode()).hexdigest()
+
+def readGrid(gridspec):
+  """Reads and derives the Grid fields from a gridspec directory or tar file, without caching."""
+  if os.path.isdir(gridspec):
+    def read(file, var): return netCDF4.Dataset(os.path.join(gridspec, file)).variables[var][:]
+  elif os.path.isfile(gridspec):
+    tar = openTar(gridspec)
+    def read(file, var): return tar.variable(file, var)[:]
+  else: raise ValueError('Unable to extract grid information from gridspec directory/tar file.')
+  fields = {}
+  X = read('ocean_hgrid.nc', 'x'); fields['x'] = X[::2,::2]; fields['xcenter'] = X[1::2,1::2]
+  Y = read('ocean_hgrid.nc', 'y'); fields['y'] = Y[::2,::2]; fields['ycenter'] = Y[1::2,1::2]
+  msk = read('ocean_mask.nc', 'mask'); fields['msk'] = msk
+  fields['area'] = msk*read('ocean_hgrid.nc', 'area').reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
+  fields['depth'] = read('ocean_topog.nc', 'depth')
+  try: fields['basin_code'] = read('basin_codes.nc', 'basin')
+  except: pass # Generated by Grid.basin_code when first used
+  return Grid(**fields)
+
+def loadGrid(gridspec, cache=True):
+  """
+  Returns the Grid for a gridspec directory or tar file.
+
+  The derived fields are saved to <gridCacheDir()>/grid.<gridspecKey>.npz so that
+  every later call on the same gridspec, from any script, reads that one file
+  instead of re-reading and re-deriving the supergrid. Calls within one process
+  return the same Grid object. cache=False bypasses the cache file.
+  """
+  if not os.path.exists(gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
+  key = gridspecKey(gridspec)
+  if cache and key in _grids: return _grids[key]
+  cacheFile = os.path.join(gridCacheDir(), 'grid.%s.npz'%key)
+  grid = None
+  if cache and os.path.isfile(cacheFile):
+    try: grid = _readGridCache(cacheFile)
+    except: grid = None # Unreadable cache files are regenerated
+  if grid is None:
+    grid = readGrid(gridspec)
+    if cache:
+      try: _writeGridCache(cacheFile, grid)
+      except (IOError, OSError): pass # A read-only cache location is not an error
+  if cache: _grids[key] = grid
+  return grid
+
+def _writeGridCache(cacheFile, grid):
+  arrays = {}
+  for name in Grid.fields:
+    v = grid._basin_code if name == 'basin_code' else getattr(grid, name) # Not generated just to be cached
+    if v is None: continue
+    arrays[name] = np.ma.getdata(v)
+    if np.ma.isMaskedArray(v): arrays[name+'.mask'] = np.ma.getmaskarray(v)
+  _writeCache(cacheFile, arrays)
+
+def _writeCache(cacheFile, arrays):
+  if not os.path.isdir(os.path.dirname(cacheFile)): os.makedirs(os.path.dirname(cacheFile))
+  tmpFile = '%s.%i.tmp'%(cacheFile, os.getpid())
+  with open(tmpFile, 'wb') as f: np.savez(f, **arrays)
+  os.rename(tmpFile, cacheFile) # Atomic, so concurrent scripts never see a partial file
+
+basinCacheVersion = 1
+_basinCodes = {}
+
+def basinKey(x, y, depth):
+  """Returns a hash of the contents (values, masks, types and shapes) of x, y and depth."""
+  h = hashlib.sha1( ('m6toolbox.genBasinMasks v%i'%basinCacheVersion).encode() )
+  for a in (x, y, depth):
+    data = np.ascontiguousarray(np.ma.getdata(a))
+    h.update( ('%s %s'%(data.dtype.str, data.shape)).encode() )
+    h.update( data.view(np.uint8).ravel() )
+    if np.ma.is_masked(a): h.update( np.ascontiguousarray(np.ma.getmaskarray(a)).view(np.uint8).ravel() )
+  return h.hexdigest()
+
+def basinMasks(x, y, depth, verbose=False, cache=True):
+  """
+  Returns the basin codes of genBasinMasks(x, y, depth).
+
+  The codes are saved to <gridCacheDir()>/basin_code.<basinKey>.npz, keyed on the contents
+  of x, y and depth, so that every later call for the same grid, from any script or gridspec
+  path, reads them back instead of re-running the flood fills. cache=False bypasses the cache.
+  """
+  if not cache: return genBasinMasks(x, y, depth, verbose=verbose)
+  key = basinKey(x, y, depth)
+  if key in _basinCodes: return _basinCodes[key].copy()
+  cacheFile = os.path.join(gridCacheDir(), 'basin_code.%s.npz'%key)
+  code = None
+  if os.path.isfile(cacheFile):
+    try:
+      with np.load(cacheFile, allow_pickle=False) as npz:
+        if 'mask' in npz.files: code = np.ma.array(npz['code'], mask=npz['mask'])
+        else: code = npz['code']
+    except: code = None # Unreadable cache files are regenerated
+  if code is None:
+    code = genBasinMasks(x, y, depth, verbose=verbose)
+    arrays = {'code': np.ma.getdata(code)}
+    if np.ma.isMaskedArray(code): arrays['mask'] = np.ma.getmaskarray(code)
+    try: _writeCache(cacheFile, arrays)
+    except (IOError, OSError): pass # A read-only cache location is not an error
+  _basinCodes[key] = code
+  return code.copy()
+
+def _readGridCache(cacheFile):
+  fields = {}
+  with np.load(cacheFile, allow_pickle=False) as npz:
+    for name in Grid.fields:
+      if name+'.mask' in npz.files: fields[name] = np.ma.array(npz[name], mask=npz[name+'.mask'])
+      elif name in npz.files: fields[name] = npz[name]
+  return Grid(**fields)
+
+_datasets = {}
+
+def openDataset(infile):
+  """
+  Returns netCDF4.MFDataset(infile) for a file name or list of file names. Calls within one
+  process for the same infile return the same open dataset, so that analyses run one after
+  the other (see frepp_batch.py) open their input once.
+  """
+  key = tuple(infile) if isinstance(infile, (list, tuple)) else infile
+  if key not in _datasets: _datasets[key] = netCDF4.MFDataset(infile)
+  return _datasets[key]
+
+def closeDatasets():
+  """Closes all datasets opened by openDataset()."""
+  while _datasets: _datasets.popitem()[1].close()
+
+class PlotBuffer(io.BytesIO):
+  """In-memory png returned by an analysis main(..., stream=True), named as it would have been saved."""
+  def __init__(self, filename):
+    io.BytesIO.__init__(self)
+    self.filename = filename
+
+def plotOutput(cmdLineArgs, filename, stream=False):
+  """
+  Returns where an analysis main() saves the plot filename: a new PlotBuffer if stream is True,
+  else the path in cmdLineArgs.outdir.
+  """
+  if stream is True: return PlotBuffer(filename)
+  return cmdLineArgs.outdir+'/'+filename
+
+class MFTimeSeries:
+  """
+  Read-only, time-indexed view of a variable split in time across several files
+  (e.g. the ts/*/5yr/*.nc files of a post-processed run), as read by MFDataset.
+
+  Only the time axis of each file is read when the series is created. Records are
+  then read with read(), which opens just the files that overlap the requested
+  records, so selecting 20 years of a 500 year run costs 20 years of I/O.
+  """
+  def __init__(self, files, timeName='time'):
+    if not isinstance(files, list): files = [files]
+    self.files = []
+    for f in files:
+      if glob.has_magic(f): self.files += sorted(glob.glob(f))
+      else: self.files.append(f)
+    if not self.files: raise IOError('No files found matching %s'%files)
+    times = []
+    for n, f in enumerate(self.files):
+      rg = netCDF4.Dataset(f)
+      try:
+        time = rg.variables[timeName]
+        calendar = getattr(time, 'calendar', 'standard')
+        if n == 0:
+          self.units = time.units; self.calendar = calendar
+          self.title = getattr(rg, 'title', '')
+          self.dimensions = dict( (name, var.dimensions) for name, var in rg.variables.items() )
+          self.variables = list(self.dimensions.keys())
+        values = np.asarray(time[:])
+        if time.units != self.units: # Express all times in the units of the first file
+          values = netCDF4.date2num(netCDF4.num2date(values, time.units, calendar), self.units, self.calendar)
+        times.append(values)
+      finally: rg.close()
+    self.offsets = np.cumsum([0]+[len(t) for t in times])
+    self.time = np.concatenate(times)
+
+  def years(self, records=slice(None)):
+    """Returns the calendar year of each of the records."""
+    return np.array([int(d.year) for d in netCDF4.num2date(self.time[records], self.units, self.calendar)])
+
+  def select(self, trange=None):
+    """Returns the slice of records in the years trange = (first, last), inclusive, or of all records if None."""
+    if trange is None: return slice(0, len(self.time))
+    years = self.years()
+    inRange = np.nonzero( (years>=trange[0]) & (years<=trange[1]) )[0]
+    if not inRange.size: raise ValueError('No records found in years %i to %i'%tuple(trange))
+    return slice(int(inRange[0]), int(inRange[-1])+1)
+
+  def read(self, varName, records=None, index=()):
+    """
+    Returns varName[records,index] where records is a slice of the whole series (default all)
+    and index selects within the remaining dimensions.
+    """
+    if records is None: records = slice(0, len(self.time))
+    start, stop, step = records.indices(len(self.time))
+    if step != 1: raise ValueError('Only contiguous records can be read')
+    parts = []
+    for n, f in enumerate(self.files):
+      first = max(start, self.offsets[n]); last = min(stop, self.offsets[n+1])
+      if first >= last: continue
+      rg = netCDF4.Dataset(f)
+      try: parts.append( rg.variables[varName][(slice(first-self.offsets[n], last-self.offsets[n]),)+tuple(index)] )
+      finally: rg.close()
+    return np.ma.concatenate(parts)
+
+  def static(self, varName):
+    """Returns a variable that does not depend on time (e.g. a vertical coordinate), read from the first file."""
+    rg = netCDF4.Dataset(self.files[0])
+    try: return rg.variables[varName][:]
+    finally: rg.close()
+
+def parseTrange(trange):
+  """Returns the (first, last) years given by a --trange string such as "1950,1969" or "(1950, 1969)", or None."""
+  if trange is None: return None
+  years = [int(y) for y in re.findall('[0-9]+', trange)]
+  if len(years) != 2: raise ValueError('Could not read a start and end year from "%s"'%trange)
+  return tuple(years)
 
 def southOf(x, y, xy0, xy1):
   """
@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import io
 import netCDF4
 import numpy
 import m6plot
@@ -23,31 +22,17 @@ def run():
   main(cmdLineArgs)
 
 def main(cmdLineArgs,stream=False):
-  if not os.path.exists(cmdLineArgs.gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
-  if os.path.isdir(cmdLineArgs.gridspec):
-    x = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][::2,::2]
-    xcenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][1::2,1::2]
-    y = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][::2,::2]
-    ycenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][1::2,1::2]
-    msk = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_mask.nc').variables['mask'][:]
-    area = msk*netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['area'][:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_topog.nc').variables['depth'][:]
-    try: basin_code = netCDF4.Dataset(cmdLineArgs.gridspec+'/basin_codes.nc').variables['basin'][:]
-    except: basin_code = m6toolbox.genBasinMasks(xcenter, ycenter, depth)
-  elif os.path.isfile(cmdLineArgs.gridspec):
-    x = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[::2,::2]
-    xcenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[1::2,1::2]
-    y = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[::2,::2]
-    ycenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[1::2,1::2]
-    msk = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_mask.nc','mask')[:]
-    area = msk*m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','area')[:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_topog.nc','depth')[:]
-    try: basin_code = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'basin_codes.nc','basin')[:]
-    except: basin_code = m6toolbox.genBasinMasks(xcenter, ycenter, depth)
-  else:
-    raise ValueError('Unable to extract grid information from gridspec directory/tar file.') 
+  grid = m6toolbox.loadGrid(cmdLineArgs.gridspec)
+  x = grid.x
+  xcenter = grid.xcenter
+  y = grid.y
+  ycenter = grid.ycenter
+  msk = grid.msk
+  area = grid.area
+  depth = grid.depth
+  basin_code = grid.basin_code
 
-  rootGroup = netCDF4.MFDataset( cmdLineArgs.infile )
+  rootGroup = m6toolbox.openDataset( cmdLineArgs.infile )
   if 'vmo' in rootGroup.variables:
     varName = 'vmo'; conversion_factor = 1.e-9
   elif 'vh' in rootGroup.variables:
@@ -60,21 +45,6 @@ def main(cmdLineArgs,stream=False):
   except: pass
   Zmod = m6toolbox.get_z(rootGroup, depth, varName)
   
-  def MOCpsi(vh, vmsk=None):
-    """Sums 'vh' zonally and cumulatively in the vertical to yield an overturning stream function, psi(y,z)."""
-    shape = list(vh.shape); shape[-3] += 1
-    psi = numpy.zeros(shape[:-1])
-    if len(shape)==3:
-      for k in range(shape[-3]-1,0,-1):
-        if vmsk is None: psi[k-1,:] = psi[k,:] - vh[k-1].sum(axis=-1)
-        else: psi[k-1,:] = psi[k,:] - (vmsk*vh[k-1]).sum(axis=-1)
-    else:
-      for n in range(shape[0]):
-        for k in range(shape[-3]-1,0,-1):
-          if vmsk is None: psi[n,k-1,:] = psi[n,k,:] - vh[n,k-1].sum(axis=-1)
-          else: psi[n,k-1,:] = psi[n,k,:] - (vmsk*vh[n,k-1]).sum(axis=-1)
-    return psi
-  
   def plotPsi(y, z, psi, ci, title):
     cmap = plt.get_cmap('dunnePM')
     plt.contourf(y, z, psi, levels=ci, cmap=cmap, extend='both')
@@ -96,11 +66,15 @@ def main(cmdLineArgs,stream=False):
 
   imgbufs = []
 
+  # Overturning for the Atlantic (basin 0) and the global ocean (basin 1), in one pass over VHmod
+  atlantic = m6toolbox.basinIndex(basin_code, [[2,4,6,7,8]], vpoint=True)
+  psi = m6toolbox.basinMOCpsi(VHmod, atlantic, 1)*conversion_factor
+
   # Global MOC
   m6plot.setFigureSize([16,9],576,debug=False)
   axis = plt.gca()
   cmap = plt.get_cmap('dunnePM')
-  z = Zmod.min(axis=-1); psiPlot = MOCpsi(VHmod)*conversion_factor
+  z = Zmod.min(axis=-1); psiPlot = psi[1]
   yy = y[1:,:].max(axis=-1)+0*z
   ci=m6plot.pmCI(0.,40.,5.)
   plotPsi(yy, z, psiPlot, ci, 'Global MOC [Sv]')
@@ -109,8 +83,7 @@ def main(cmdLineArgs,stream=False):
   findExtrema(yy, z, psiPlot, max_lat=-30.)
   findExtrema(yy, z, psiPlot, min_lat=25.)
   findExtrema(yy, z, psiPlot, min_depth=2000., mult=-1.)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/MOC_global.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'MOC_global.png', stream)
   plt.savefig(objOut)
   if stream is True: imgbufs.append(objOut)
 
@@ -119,7 +92,7 @@ def main(cmdLineArgs,stream=False):
   cmap = plt.get_cmap('dunnePM')
   m = 0*basin_code; m[(basin_code==2) | (basin_code==4) | (basin_code==6) | (basin_code==7) | (basin_code==8)]=1
   ci=m6plot.pmCI(0.,22.,2.)
-  z = (m*Zmod).min(axis=-1); psiPlot = MOCpsi(VHmod, vmsk=m*numpy.roll(m,-1,axis=-2))*conversion_factor
+  z = (m*Zmod).min(axis=-1); psiPlot = psi[0]
   yy = y[1:,:].max(axis=-1)+0*z
   plotPsi(yy, z, psiPlot, ci, 'Atlantic MOC [Sv]')
   plt.xlabel(r'Latitude [$\degree$N]')
@@ -128,8 +101,7 @@ def main(cmdLineArgs,stream=False):
   findExtrema(yy, z, psiPlot, max_lat=-33.)
   findExtrema(yy, z, psiPlot)
   findExtrema(yy, z, psiPlot, min_lat=5.)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/MOC_Atlantic.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'MOC_Atlantic.png', stream)
   plt.savefig(objOut,format='png')
   if stream is True: imgbufs.append(objOut)
 
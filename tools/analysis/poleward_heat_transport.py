@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import io
 import netCDF4
 import numpy
 import m6plot
@@ -25,31 +24,17 @@ def run():
   main(cmdLineArgs)
 
 def main(cmdLineArgs,stream=False):
-  if not os.path.exists(cmdLineArgs.gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
-  if os.path.isdir(cmdLineArgs.gridspec):
-    x = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][::2,::2]
-    xcenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][1::2,1::2]
-    y = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][::2,::2]
-    ycenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][1::2,1::2]
-    msk = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_mask.nc').variables['mask'][:]
-    area = msk*netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['area'][:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_topog.nc').variables['depth'][:]
-    try: basin_code = netCDF4.Dataset(cmdLineArgs.gridspec+'/basin_codes.nc').variables['basin'][:]
-    except: basin_code = m6toolbox.genBasinMasks(xcenter, ycenter, depth)
-  elif os.path.isfile(cmdLineArgs.gridspec):
-    x = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[::2,::2]
-    xcenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[1::2,1::2]
-    y = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[::2,::2]
-    ycenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[1::2,1::2]
-    msk = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_mask.nc','mask')[:]
-    area = msk*m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','area')[:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_topog.nc','depth')[:]
-    try: basin_code = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'basin_codes.nc','basin')[:]
-    except: basin_code = m6toolbox.genBasinMasks(xcenter, ycenter, depth)
-  else:
-    raise ValueError('Unable to extract grid information from gridspec directory/tar file.')
-
-  rootGroup = netCDF4.MFDataset( cmdLineArgs.infile )
+  grid = m6toolbox.loadGrid(cmdLineArgs.gridspec)
+  x = grid.x
+  xcenter = grid.xcenter
+  y = grid.y
+  ycenter = grid.ycenter
+  msk = grid.msk
+  area = grid.area
+  depth = grid.depth
+  basin_code = grid.basin_code
+
+  rootGroup = m6toolbox.openDataset( cmdLineArgs.infile )
   if 'T_ady_2d' in rootGroup.variables:
     varName = 'T_ady_2d'
     advective = rootGroup.variables[varName]
@@ -64,8 +49,9 @@ def main(cmdLineArgs,stream=False):
     diffusive = None
     warnings.warn('Diffusive temperature term not found. This will result in an underestimation of the heat transport.')
 
-  def heatTrans(advective, diffusive=None, vmask=None):
-    """Converts vertically integrated temperature advection into heat transport"""
+  def heatTrans(advective, diffusive=None, index=None, nbasins=0):
+    """Converts vertically integrated temperature advection into heat transport, HT(basin,y), for
+    each basin of index (see m6toolbox.basinIndex) followed by the global transport."""
     if diffusive is not None:
       HT = advective[:] + diffusive[:]
     else:
@@ -83,8 +69,10 @@ def main(cmdLineArgs,stream=False):
       HT = HT * 1.e-15
     else:
       print('Unknown units')
-    if vmask is not None: HT = HT*vmask
-    HT = HT.sum(axis=-1); HT = HT.squeeze() # sum in x-direction
+    if index is None: index = numpy.zeros(HT.shape[-2:], dtype=int)
+    HT = m6toolbox.zonalBasinSum(HT, index, nbasins) # sum in x-direction, all basins at once
+    # A basin transport is only missing where the whole latitude row is, as for a masked sum of HT*vmask
+    HT = numpy.ma.array(numpy.ma.filled(HT, 0.), mask=numpy.ma.getmaskarray(HT)[-1:].repeat(nbasins+1, axis=0))
     return HT
 
   def plotHeatTrans(y, HT, title, xlim=(-80,90)):
@@ -151,8 +139,12 @@ def main(cmdLineArgs,stream=False):
 
   imgbufs = []
 
+  # Atlantic (basin 0), Indo-Pacific (basin 1) and global (basin 2) heat transports
+  basins = m6toolbox.basinIndex(basin_code, [[2,4,6,7,8], [3,5]], vpoint=True)
+  HT = heatTrans(advective, diffusive, index=basins, nbasins=2)
+
   # Global Heat Transport
-  HTplot = heatTrans(advective,diffusive)
+  HTplot = HT[2]
   yy = y[1:,:].max(axis=-1)
   plotHeatTrans(yy,HTplot,title='Global Y-Direction Heat Transport [PW]')
   plt.plot(yobs,NCEP['Global'],'k--',linewidth=0.5,label='NCEP')
@@ -163,15 +155,13 @@ def main(cmdLineArgs,stream=False):
   plt.legend(loc=0,fontsize=10)
   annotateObs()
   if diffusive is None: annotatePlot('Warning: Diffusive component of transport is missing.')
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/HeatTransport_global.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'HeatTransport_global.png', stream)
   plt.savefig(objOut)
   if stream is True: imgbufs.append(objOut)
 
   # Atlantic Heat Transport
   plt.clf()
-  m = 0*basin_code; m[(basin_code==2) | (basin_code==4) | (basin_code==6) | (basin_code==7) | (basin_code==8)] = 1
-  HTplot = heatTrans(advective, diffusive, vmask=m*numpy.roll(m,-1,axis=-2))
+  HTplot = HT[0]
   yy = y[1:,:].max(axis=-1)
   HTplot[yy<-34] = numpy.nan
   plotHeatTrans(yy,HTplot,title='Atlantic Y-Direction Heat Transport [PW]')
@@ -183,15 +173,13 @@ def main(cmdLineArgs,stream=False):
   plt.legend(loc=0,fontsize=10)
   annotateObs()
   if diffusive is None: annotatePlot('Warning: Diffusive component of transport is missing.')
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/HeatTransport_Atlantic.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'HeatTransport_Atlantic.png', stream)
   plt.savefig(objOut)
   if stream is True: imgbufs.append(objOut)
 
   # Indo-Pacific Heat Transport
   plt.clf()
-  m = 0*basin_code; m[(basin_code==3) | (basin_code==5)] = 1
-  HTplot = heatTrans(advective, diffusive, vmask=m*numpy.roll(m,-1,axis=-2))
+  HTplot = HT[1]
   yy = y[1:,:].max(axis=-1)
   HTplot[yy<-34] = numpy.nan
   plotHeatTrans(yy,HTplot,title='Indo-Pacific Y-Direction Heat Transport [PW]')
@@ -203,8 +191,7 @@ def main(cmdLineArgs,stream=False):
   if diffusive is None: annotatePlot('Warning: Diffusive component of transport is missing.')
   plt.suptitle(suptitle)
   plt.legend(loc=0,fontsize=10)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/HeatTransport_IndoPac.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'HeatTransport_IndoPac.png', stream)
   plt.savefig(objOut)
   if stream is True: imgbufs.append(objOut)
 
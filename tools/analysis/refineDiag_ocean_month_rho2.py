@@ -41,11 +41,8 @@ def main(args):
     f_basin = nc.Dataset(args.basinfile)
     basin_code = f_basin.variables['basin'][:]
 
-    atlantic_arctic_mask = basin_code * 0.
-    atlantic_arctic_mask[(basin_code==2) | (basin_code==4) | (basin_code==6) | (basin_code==7) | (basin_code==8)] = 1.
-
-    indo_pacific_mask = basin_code * 0.
-    indo_pacific_mask[(basin_code==3) | (basin_code==5)] = 1.
+    #   basin 0 is atlantic_arctic, 1 is indo_pacific and 2 (the last) is the global ocean
+    basin_index = m6toolbox.basinIndex(basin_code, [[2,4,6,7,8], [3,5]])
 
     #-- Read model data
     f_in = nc.Dataset(args.infile)
@@ -56,16 +53,12 @@ def main(args):
     rho2_i = f_in.variables['rho2_i']
     tax = f_in.variables['time']
 
-    if (len(yq) == 1+atlantic_arctic_mask.shape[0]): #symmetric case
-       atlantic_arctic_mask=np.append(atlantic_arctic_mask,np.zeros((1,atlantic_arctic_mask.shape[1])),axis=0)
-       indo_pacific_mask=np.append(indo_pacific_mask,np.zeros((1,indo_pacific_mask.shape[1])),axis=0)
+    if (len(yq) == 1+basin_index.shape[0]): #symmetric case
+       basin_index=np.append(basin_index,2+np.zeros((1,basin_index.shape[1]),dtype=int),axis=0)
     #-- msftyrho
     if 'vmo' in list(f_in.variables.keys()):
       varname = 'vmo'
-      msftyrho = np.ma.ones((len(tax),3,len(rho2_i),len(yq)))*0.
-      msftyrho[:,0,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=atlantic_arctic_mask)
-      msftyrho[:,1,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=indo_pacific_mask)
-      msftyrho[:,2,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:])
+      msftyrho = m6toolbox.basinMOCpsi(f_in.variables[varname][:], basin_index, 2)
       msftyrho[msftyrho.mask] = 1.e20
       msftyrho = np.ma.array(msftyrho,fill_value=1.e20)
       msftyrho.long_name = 'Ocean Y Overturning Mass Streamfunction'
@@ -81,10 +74,7 @@ def main(args):
     #-- msftyrhompa
     if 'vhGM' in list(f_in.variables.keys()):
       varname = 'vhGM'
-      msftyrhompa = np.ma.ones((len(tax),3,len(rho2_i),len(yq)))*0.
-      msftyrhompa[:,0,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=atlantic_arctic_mask)
-      msftyrhompa[:,1,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=indo_pacific_mask)
-      msftyrhompa[:,2,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:])
+      msftyrhompa = m6toolbox.basinMOCpsi(f_in.variables[varname][:], basin_index, 2)
       msftyrhompa[msftyrhompa.mask] = 1.e20
       msftyrhompa = np.ma.array(msftyrhompa,fill_value=1.e20)
       msftyrhompa.long_name = 'ocean Y overturning mass streamfunction due to parameterized mesoscale advection'
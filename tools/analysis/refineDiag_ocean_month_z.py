@@ -7,7 +7,7 @@ import numpy as np
 import os
 import sys
 import matplotlib.pyplot as plt
-from verticalvelocity import calc_w_from_convergence
+from verticalvelocity import Workspace, w_from_convergence
 from strait_transport_timeseries import sum_transport_in_straits
 ##-- RefineDiag Script for CMIP6
 ##
@@ -75,11 +75,8 @@ def main(args):
     f_basin = nc.Dataset(args.basinfile)
     basin_code = f_basin.variables['basin'][:]
 
-    atlantic_arctic_mask = basin_code * 0.
-    atlantic_arctic_mask[(basin_code==2) | (basin_code==4) | (basin_code==6) | (basin_code==7) | (basin_code==8)] = 1.
-
-    indo_pacific_mask = basin_code * 0.
-    indo_pacific_mask[(basin_code==3) | (basin_code==5)] = 1.
+    #   basin 0 is atlantic_arctic, 1 is indo_pacific and 2 (the last) is the global ocean
+    basin_index = m6toolbox.basinIndex(basin_code, [[2,4,6,7,8], [3,5]])
 
     #-- Read model data
     f_in = nc.Dataset(args.infile)
@@ -102,87 +99,34 @@ def main(args):
     #   The quanity 'yy' above is numerically-equivalent to 'yq'
 
     if (len(yq) == 1+len(yh)): #symmetric case
-       atlantic_arctic_mask=np.append(atlantic_arctic_mask,np.zeros((1,atlantic_arctic_mask.shape[1])),axis=0)
-       indo_pacific_mask=np.append(indo_pacific_mask,np.zeros((1,indo_pacific_mask.shape[1])),axis=0)
-    #-- msftyyz
-    if 'vmo' in list(f_in.variables.keys()):
-      varname = 'vmo'
-      msftyyz = np.ma.ones((len(tax),3,len(z_i),len(yq)))*0.
-      msftyyz[:,0,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=atlantic_arctic_mask)
-      msftyyz[:,1,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=indo_pacific_mask)
-      msftyyz[:,2,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:])
-      msftyyz[msftyyz.mask] = nc_misval
-      msftyyz = np.ma.array(msftyyz,fill_value=nc_misval)
-      msftyyz.long_name = 'Ocean Y Overturning Mass Streamfunction'
-      msftyyz.units = 'kg s-1'
-      msftyyz.coordinates = 'region'
-      msftyyz.cell_methods = 'z_i:point yq:point time:mean'
-      msftyyz.time_avg_info = 'average_T1,average_T2,average_DT'
-      msftyyz.standard_name = 'ocean_y_overturning_mass_streamfunction'
-      do_msftyyz = True
-    else:
-      do_msftyyz = False
-
-    #-- msftyzmpa
-    if 'vhGM' in list(f_in.variables.keys()):
-      varname = 'vhGM'
-      msftyzmpa = np.ma.ones((len(tax),3,len(z_i),len(yq)))*0.
-      msftyzmpa[:,0,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=atlantic_arctic_mask)
-      msftyzmpa[:,1,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=indo_pacific_mask)
-      msftyzmpa[:,2,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:])
-      msftyzmpa[msftyzmpa.mask] = nc_misval
-      msftyzmpa = np.ma.array(msftyzmpa,fill_value=nc_misval)
-      msftyzmpa.long_name = 'ocean Y overturning mass streamfunction due to parameterized mesoscale advection'
-      msftyzmpa.units = 'kg s-1'
-      msftyzmpa.coordinates = 'region'
-      msftyzmpa.cell_methods = 'z_i:point yq:point time:mean'
-      msftyzmpa.time_avg_info = 'average_T1,average_T2,average_DT'
-      msftyzmpa.standard_name = 'ocean_y_overturning_mass_streamfunction_due_to_parameterized_'+\
-                                'mesoscale_advection'
-      do_msftyzmpa = True
-    else:
-      do_msftyzmpa = False
-
-    #-- msftyzsmpa
-    if 'vhml' in list(f_in.variables.keys()):
-      varname = 'vhml'
-      msftyzsmpa = np.ma.ones((len(tax),3,len(z_i),len(yq)))*0.
-      msftyzsmpa[:,0,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=atlantic_arctic_mask)
-      msftyzsmpa[:,1,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:],mask=indo_pacific_mask)
-      msftyzsmpa[:,2,:,:] = m6toolbox.moc_maskedarray(f_in.variables[varname][:])
-      msftyzsmpa[msftyzsmpa.mask] = nc_misval
-      msftyzsmpa = np.ma.array(msftyzsmpa,fill_value=nc_misval)
-      msftyzsmpa.long_name = 'ocean Y overturning mass streamfunction due to parameterized submesoscale advection'
-      msftyzsmpa.units = 'kg s-1'
-      msftyzsmpa.coordinates = 'region'
-      msftyzsmpa.cell_methods = 'z_i:point yq:point time:mean'
-      msftyzsmpa.time_avg_info = 'average_T1,average_T2,average_DT'
-      msftyzsmpa.standard_name = 'ocean_meridional_overturning_mass_streamfunction_due_to_parameterized_'+\
-                                 'submesoscale_advection'
-      do_msftyzsmpa = True
-    else:
-      do_msftyzsmpa = False
+       basin_index=np.append(basin_index,2+np.zeros((1,basin_index.shape[1]),dtype=int),axis=0)
+    #-- Overturning streamfunctions: msftyyz (vmo), msftyzmpa (vhGM) and msftyzsmpa (vhml)
+    #   These are computed one time level at a time while writing (see below) so that
+    #   each input field is read once for all three basins and memory is bounded by one record.
+    moc_attrs = {}
+    moc_attrs['msftyyz'] = {'long_name': 'Ocean Y Overturning Mass Streamfunction',
+                            'standard_name': 'ocean_y_overturning_mass_streamfunction'}
+    moc_attrs['msftyzmpa'] = {'long_name': 'ocean Y overturning mass streamfunction due to parameterized mesoscale advection',
+                              'standard_name': 'ocean_y_overturning_mass_streamfunction_due_to_parameterized_'+\
+                                               'mesoscale_advection'}
+    moc_attrs['msftyzsmpa'] = {'long_name': 'ocean Y overturning mass streamfunction due to parameterized submesoscale advection',
+                               'standard_name': 'ocean_meridional_overturning_mass_streamfunction_due_to_parameterized_'+\
+                                                'submesoscale_advection'}
+    for attrs in moc_attrs.values():
+      attrs.update({'units': 'kg s-1', 'coordinates': 'region', 'cell_methods': 'z_i:point yq:point time:mean',
+                    'time_avg_info': 'average_T1,average_T2,average_DT'})
+    moc_source = {'msftyyz': 'vmo', 'msftyzmpa': 'vhGM', 'msftyzsmpa': 'vhml'}
+    do_msftyyz = 'vmo' in f_in.variables
+    do_msftyzmpa = 'vhGM' in f_in.variables
+    do_msftyzsmpa = 'vhml' in f_in.variables
 
     #-- wmo
-    if all(x in list(f_in.variables.keys()) for x in ['umo', 'vmo']):
-      varname = 'wmo'
-      if (len(yq) == 1+len(yh)): #symmetric case
-         #print(f_in.variables['umo'].shape, f_in.variables['vmo'].shape)
-         #((12, 35, 1120, 1441), (12, 35, 1121, 1440))
-         wmo = calc_w_from_convergence(f_in.variables['umo'][:,:,:,1:], f_in.variables['vmo'][:,:,1:,:])
-      else:
-         wmo = calc_w_from_convergence(f_in.variables['umo'], f_in.variables['vmo'])
-      wmo[wmo.mask] = nc_misval
-      wmo = np.ma.array(wmo,fill_value=nc_misval)
-      wmo.long_name = 'Upward mass transport from resolved and parameterized advective transport'
-      wmo.units = 'kg s-1'
-      wmo.cell_methods = 'z_i:point xh:sum yh:sum time:mean'
-      wmo.time_avg_info = 'average_T1,average_T2,average_DT'
-      wmo.standard_name = 'upward_ocean_mass_transport'
-      wmo.cell_measures = 'area:areacello'
-      do_wmo = True
-    else:
-      do_wmo = False
+    #   Also computed one time level at a time while writing (see below).
+    wmo_attrs = {'long_name': 'Upward mass transport from resolved and parameterized advective transport',
+                 'units': 'kg s-1', 'cell_methods': 'z_i:point xh:sum yh:sum time:mean',
+                 'time_avg_info': 'average_T1,average_T2,average_DT', 'standard_name': 'upward_ocean_mass_transport',
+                 'cell_measures': 'area:areacello'}
+    do_wmo = all(x in f_in.variables for x in ['umo', 'vmo'])
 
     #-- mfo
     try:
@@ -260,29 +204,17 @@ def main(args):
       z_i_out  = f_out.createVariable('z_i',  np.float64, ('z_i'))
       nv_out  = f_out.createVariable('nv',  np.float64, ('nv'))
 
-      if do_msftyyz:
-        msftyyz_out = f_out.createVariable('msftyyz', np.float32, ('time', 'basin', 'z_i', 'yq'), fill_value=nc_misval)
-        msftyyz_out.missing_value = nc_misval
-        for k in list(msftyyz.__dict__.keys()):
-          if k[0] != '_': msftyyz_out.setncattr(k,msftyyz.__dict__[k])
-
-      if do_msftyzsmpa:
-        msftyzsmpa_out = f_out.createVariable('msftyzsmpa', np.float32, ('time', 'basin', 'z_i', 'yq'), fill_value=nc_misval)
-        msftyzsmpa_out.missing_value = nc_misval
-        for k in list(msftyzsmpa.__dict__.keys()):
-          if k[0] != '_': msftyzsmpa_out.setncattr(k,msftyzsmpa.__dict__[k])
-
-      if do_msftyzmpa:
-        msftyzmpa_out = f_out.createVariable('msftyzmpa', np.float32, ('time', 'basin', 'z_i', 'yq'), fill_value=nc_misval)
-        msftyzmpa_out.missing_value = nc_misval
-        for k in list(msftyzmpa.__dict__.keys()):
-          if k[0] != '_': msftyzmpa_out.setncattr(k,msftyzmpa.__dict__[k])
+      moc_out = {}
+      for name, do_moc in [('msftyyz', do_msftyyz), ('msftyzsmpa', do_msftyzsmpa), ('msftyzmpa', do_msftyzmpa)]:
+        if not do_moc: continue
+        moc_out[name] = f_out.createVariable(name, np.float32, ('time', 'basin', 'z_i', 'yq'), fill_value=nc_misval)
+        moc_out[name].missing_value = nc_misval
+        moc_out[name].setncatts(moc_attrs[name])
 
       if do_wmo:
         wmo_out = f_out.createVariable('wmo', np.float32, ('time', 'z_i', 'yh', 'xh'), fill_value=nc_misval)
         wmo_out.missing_value = nc_misval
-        for k in list(wmo.__dict__.keys()):
-          if k[0] != '_': wmo_out.setncattr(k,wmo.__dict__[k])
+        wmo_out.setncatts(wmo_attrs)
 
       if do_mfo:
         mfo_out = f_out.createVariable('mfo', np.float32, ('time', 'strait'), fill_value=nc_misval)
@@ -320,10 +252,19 @@ def main(args):
       z_i_out[:] = np.array(z_i[:])
       nv_out[:] = np.array(nv[:])
 
-      if do_msftyyz:    msftyyz_out[:] = np.ma.array(msftyyz[:])
-      if do_msftyzsmpa: msftyzsmpa_out[:] = np.ma.array(msftyzsmpa[:])
-      if do_msftyzmpa:  msftyzmpa_out[:] = np.ma.array(msftyzmpa[:])
-      if do_wmo:        wmo_out[:] = np.ma.array(wmo[:])
+      for name in moc_out:
+        vh = f_in.variables[moc_source[name]]
+        for n in range(vh.shape[0]):
+          moc_out[name][n] = m6toolbox.basinMOCpsi(vh[n], basin_index, 2)
+      if do_wmo:
+        umo = f_in.variables['umo']; vmo = f_in.variables['vmo']
+        work = Workspace(len(z_l), len(yh), len(xh), np.result_type(umo.dtype, vmo.dtype))
+        for n in range(umo.shape[0]):
+          if (len(yq) == 1+len(yh)): #symmetric case
+             #((12, 35, 1120, 1441), (12, 35, 1121, 1440))
+             wmo_out[n] = w_from_convergence(umo[n,:,:,1:], vmo[n,:,1:,:], work=work)
+          else:
+             wmo_out[n] = w_from_convergence(umo[n], vmo[n], work=work)
       if do_mfo:        mfo_out[:] = np.array(mfo[:])
 
       average_T1_out[:] = average_T1[:]
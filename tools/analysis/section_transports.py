@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import io
 import netCDF4
 import numpy
 import m6plot
@@ -24,6 +23,7 @@ def run():
 def main(cmdLineArgs,stream=False):
 
   if cmdLineArgs.infile[-1] != '/': cmdLineArgs.infile = cmdLineArgs.infile+'/'
+  trange = m6toolbox.parseTrange(cmdLineArgs.trange)
 
   class Transport():
     def __init__(self, cmdLineArgs, section, var, label=None, ylim=None, zlim=None, mks2Sv=True):
@@ -38,30 +38,30 @@ def main(cmdLineArgs,stream=False):
       self.ylim = ylim
       for k in range(0,len(section)):
         if os.path.isdir(cmdLineArgs.infile + section[k] + '/ts/120hr/20yr'):
-          rootGroup = netCDF4.MFDataset( cmdLineArgs.infile + section[k] + '/ts/120hr/20yr/*.'+var[k]+'.nc')
+          rootGroup = m6toolbox.MFTimeSeries( cmdLineArgs.infile + section[k] + '/ts/120hr/20yr/*.'+var[k]+'.nc')
         elif os.path.isdir(cmdLineArgs.infile + section[k] + '/ts/120hr/5yr'):
-          rootGroup = netCDF4.MFDataset( cmdLineArgs.infile + section[k] + '/ts/120hr/5yr/*.'+var[k]+'.nc')
+          rootGroup = m6toolbox.MFTimeSeries( cmdLineArgs.infile + section[k] + '/ts/120hr/5yr/*.'+var[k]+'.nc')
         elif os.path.isdir(cmdLineArgs.infile + section[k] + '/ts/daily/20yr'):
-          rootGroup = netCDF4.MFDataset( cmdLineArgs.infile + section[k] + '/ts/daily/20yr/*.'+var[k]+'.nc')
+          rootGroup = m6toolbox.MFTimeSeries( cmdLineArgs.infile + section[k] + '/ts/daily/20yr/*.'+var[k]+'.nc')
         elif os.path.isdir(cmdLineArgs.infile + section[k] + '/ts/daily/5yr'):
-          rootGroup = netCDF4.MFDataset( cmdLineArgs.infile + section[k] + '/ts/daily/5yr/*.'+var[k]+'.nc')
+          rootGroup = m6toolbox.MFTimeSeries( cmdLineArgs.infile + section[k] + '/ts/daily/5yr/*.'+var[k]+'.nc')
         elif os.path.isdir(cmdLineArgs.infile + section[k] + '/ts/monthly/5yr'):
-          rootGroup = netCDF4.MFDataset( cmdLineArgs.infile + section[k] + '/ts/monthly/5yr/*.'+var[k]+'.nc')
+          rootGroup = m6toolbox.MFTimeSeries( cmdLineArgs.infile + section[k] + '/ts/monthly/5yr/*.'+var[k]+'.nc')
         else:
            print('Unable to find suitable trasport data in ts/120hr or ts/daily') 
-        if k == 0: total = numpy.ones(rootGroup.variables[var[k]][:].shape[0])*0.0
-        if zlim is None: trans = rootGroup.variables[var[k]][:].sum(axis=1)  # Depth summation
+        records = rootGroup.select(trange) # Only the files and records in the requested years are read
+        if k == 0: total = numpy.ones(records.stop-records.start)*0.0
+        if zlim is None: trans = rootGroup.read(var[k], records).sum(axis=1)  # Depth summation
         else:
-          vardims = rootGroup.variables[var[k]].dimensions
-          zdimname = vardims[1]
-          z_l = rootGroup.variables[zdimname][:]
-          trans = rootGroup.variables[var[k]][:,(z_l>zlim[0]) & (z_l<zlim[1])].sum(axis=1)  # Limited depth summation
+          zdimname = rootGroup.dimensions[var[k]][1]
+          z_l = rootGroup.static(zdimname)
+          trans = rootGroup.read(var[k], records, ((z_l>zlim[0]) & (z_l<zlim[1]),)).sum(axis=1)  # Limited depth summation
         if   var[k] == 'umo': total = total + trans.sum(axis=1).squeeze()
         elif var[k] == 'vmo': total = total + trans.sum(axis=2).squeeze()
         else: raise ValueError('Unknown variable name')
       if mks2Sv == True: total = total * 1.e-9
       self.data = total
-      self.time = rootGroup.variables['time'][:]*(1/365.0)
+      self.time = rootGroup.time[records]*(1/365.0)
       if cmdLineArgs.suptitle != '':  self.suptitle = cmdLineArgs.suptitle + ' ' + cmdLineArgs.label
       else: self.suptitle = rootGroup.title + ' ' + cmdLineArgs.label
 
@@ -158,8 +158,7 @@ def main(cmdLineArgs,stream=False):
   if stream != None: fig.text(0.5,0.05,str('Generated by dora.gfdl.noaa.gov'),horizontalalignment='center',fontsize=12)
   plt.show(block=False)
 
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/section_flows.png'
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'section_flows.png', stream)
   plt.savefig(objOut)
   if stream is True: imgbufs.append(objOut)
 
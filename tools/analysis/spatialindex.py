@@ -0,0 +1,143 @@
+"""
+Spatial index of the cells of a (curvilinear) grid on the sphere, shared by the analysis
+tools (m6toolbox) and the topography preprocessing scripts (make_basin_mask.py).
+
+Cell centres are placed on the unit sphere and stored in a KD-tree (scipy.spatial.cKDTree),
+built once per grid. Nearest-cell and within-radius queries then take logarithmic time and,
+unlike nearest in (longitude, latitude), are correct across the dateline, at any longitude
+convention and near the poles and the tri-polar fold.
+
+MeshIndex locates points in the cells of a mesh in the plane of its own coordinates, such as
+the axes of a plot of the mesh (editTopo.py).
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+radius_earth = 6371.e3 # Radius of the earth (m)
+
+def unitVectors(lon, lat):
+  """Returns the (...,3) positions on the unit sphere of lon, lat (degrees)."""
+  lon = np.radians(np.asarray(lon, dtype=np.float64))
+  lat = np.radians(np.asarray(lat, dtype=np.float64))
+  coslat = np.cos(lat)
+  return np.stack( (coslat*np.cos(lon), coslat*np.sin(lon), np.sin(lat)), axis=-1 )
+
+class SphericalIndex:
+  """
+  KD-tree of the cell centres lon(nj,ni), lat(nj,ni) in degrees. Masked centres are left out.
+  """
+  def __init__(self, lon, lat):
+    self.shape = np.shape(lon)
+    valid = ~( np.ma.getmaskarray(lon) | np.ma.getmaskarray(lat) ).ravel()
+    self.cells = np.flatnonzero(valid) # Flat index of each point in the tree
+    xyz = unitVectors(np.ma.getdata(lon), np.ma.getdata(lat)).reshape(-1,3)[valid]
+    self.tree = cKDTree(xyz)
+
+  def nearest(self, lon0, lat0):
+    """
+    Returns (j,i) of the cell with centre nearest to (lon0,lat0), as integers for a single
+    point or as arrays shaped as lon0 for many.
+    """
+    dist, n = self.tree.query( unitVectors(lon0, lat0) )
+    return np.unravel_index( self.cells[n], self.shape )
+
+  def distance(self, lon0, lat0):
+    """Returns the great-circle distance (m) from (lon0,lat0) to the nearest cell centre."""
+    dist, n = self.tree.query( unitVectors(lon0, lat0) )
+    return radius_earth * 2. * np.arcsin( np.minimum(1., 0.5*dist) )
+
+  def withinRadius(self, lon0, lat0, radius):
+    """
+    Returns (j,i) arrays of the cells with centres within a great-circle distance radius (m)
+    of the point (lon0,lat0).
+    """
+    chord = 2. * np.sin( 0.5 * min(np.pi, radius/radius_earth) )
+    n = np.array( sorted( self.tree.query_ball_point( unitVectors(lon0, lat0), chord ) ), dtype=int )
+    return np.unravel_index( self.cells[n], self.shape )
+
+class MeshIndex:
+  """
+  Point location in the cells of the mesh of corners meshX(nj+1,ni+1), meshY(nj+1,ni+1), in the plane
+  of those coordinates. A KD-tree of the cell centres gives the nearest few cells, which are tested for
+  containing the point (the cells are taken to be convex).
+  """
+  def __init__(self, meshX, meshY, candidates=8):
+    self.X = np.array(np.ma.getdata(meshX), dtype=np.float64)
+    self.Y = np.array(np.ma.getdata(meshY), dtype=np.float64)
+    self.ni = self.X.shape[1] - 1
+    xc = 0.25*( self.X[:-1,:-1] + self.X[1:,:-1] + self.X[1:,1:] + self.X[:-1,1:] )
+    yc = 0.25*( self.Y[:-1,:-1] + self.Y[1:,:-1] + self.Y[1:,1:] + self.Y[:-1,1:] )
+    self.tree = cKDTree( np.stack( (xc.ravel(), yc.ravel()), axis=-1 ) )
+    self.candidates = min(candidates, xc.size)
+    self.last = None # The cell last found
+    # Every point of a cell is within this distance of its centre
+    self.radius = 0.
+    for x, y in ( (self.X[:-1,:-1],self.Y[:-1,:-1]), (self.X[1:,:-1],self.Y[1:,:-1]),
+                  (self.X[1:,1:],self.Y[1:,1:]), (self.X[:-1,1:],self.Y[:-1,1:]) ):
+      self.radius = max( self.radius, np.sqrt( (x-xc)**2 + (y-yc)**2 ).max() )
+
+  def contains(self, cells, pointX, pointY):
+    """Returns True for each of the (flat) cells that contains the point."""
+    j, i = np.divmod(np.asarray(cells, dtype=int), self.ni)
+    px = np.stack( (self.X[j,i], self.X[j+1,i], self.X[j+1,i+1], self.X[j,i+1]), axis=-1 )
+    py = np.stack( (self.Y[j,i], self.Y[j+1,i], self.Y[j+1,i+1], self.Y[j,i+1]), axis=-1 )
+    u = np.roll(px, -1, axis=-1) - px; v = np.roll(py, -1, axis=-1) - py
+    cross = u*(pointY - py) - v*(pointX - px) # Sign tells which side of each edge the point is on
+    return ~( (cross>0).any(axis=-1) & (cross<0).any(axis=-1) )
+
+  def inside(self, cell, pointX, pointY):
+    """Returns True if the (flat) cell contains the point, as contains() for one cell without numpy overheads."""
+    j, i = divmod(cell, self.ni)
+    X = self.X; Y = self.Y
+    px = (X.item(j,i), X.item(j+1,i), X.item(j+1,i+1), X.item(j,i+1))
+    py = (Y.item(j,i), Y.item(j+1,i), Y.item(j+1,i+1), Y.item(j,i+1))
+    positive = negative = False
+    for n in range(4):
+      cross = (px[n-3]-px[n])*(pointY-py[n]) - (py[n-3]-py[n])*(pointX-px[n])
+      if cross > 0: positive = True
+      elif cross < 0: negative = True
+    return not (positive and negative)
+
+  def find(self, pointX, pointY):
+    """Returns (j,i) of the cell containing the point (pointX,pointY), or (None,None) if none does."""
+    if pointX is None or pointY is None: return None, None
+    if self.last is not None: # Successive points (e.g. of a cursor) are usually in the same or the next cell
+      j, i = divmod(self.last, self.ni)
+      for jj, ii in ((j,i), (j,i-1), (j,i+1), (j-1,i), (j+1,i), (j-1,i-1), (j-1,i+1), (j+1,i-1), (j+1,i+1)):
+        if 0 <= jj < self.X.shape[0]-1 and 0 <= ii < self.ni and self.inside(jj*self.ni+ii, pointX, pointY):
+          self.last = jj*self.ni + ii
+          return jj, ii
+    dist, cells = self.tree.query( (pointX, pointY), self.candidates )
+    if np.atleast_1d(dist)[0] > self.radius: return None, None
+    cell = None
+    for c in np.atleast_1d(cells).tolist():
+      if self.inside(c, pointX, pointY): cell = c; break
+    if cell is None: # Only in odd meshes: test every cell that could contain the point
+      cells = np.array( sorted( self.tree.query_ball_point( (pointX, pointY), self.radius ) ), dtype=int )
+      if not cells.size: return None, None
+      inside = self.contains(cells, pointX, pointY)
+      if not inside.any(): return None, None
+      cell = int(cells[np.argmax(inside)])
+    self.last = cell
+    return divmod(cell, self.ni)
+
+_indices = []
+
+def sphericalIndex(lon, lat):
+  """
+  Returns the SphericalIndex of lon, lat, reusing the one built for the same arrays by a previous
+  call (the arrays are kept, so must not be modified in place). Only the last few are kept.
+  """
+  for cachedLon, cachedLat, index in _indices:
+    if cachedLon is lon and cachedLat is lat: return index
+  index = SphericalIndex(lon, lat)
+  _indices.append( (lon, lat, index) ); del _indices[:-4]
+  return index
+
+def nearestJI(x, y, xy0):
+  """
+  Find (j,i) of cell with center nearest to (x0,y0).
+  """
+  x0, y0 = xy0
+  j, i = sphericalIndex(x, y).nearest(x0, y0)
+  return int(j), int(i)
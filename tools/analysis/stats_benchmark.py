@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+
+import math
+import numpy
+import m6plot
+import time
+import warnings
+
+def run():
+  try: import argparse
+  except: raise Exception('This version of python is not new enough. python 2.7 or newer is required.')
+  parser = argparse.ArgumentParser(description='''Times m6plot.myStats and m6plot.compareStats on synthetic
+      fields and checks them, and the fields with no values or no area, against the original implementations.''')
+  parser.add_argument('-r','--resolutions', type=float, nargs='+', default=[1., 0.5, 0.25],
+    help='''Nominal grid spacings in degrees to time. Default is 1, 1/2 and 1/4.''')
+  parser.add_argument('--seed', type=int, default=1, help='''Random seed for the synthetic fields.''')
+  cmdLineArgs = parser.parse_args()
+  main(cmdLineArgs)
+
+def myStats_ref(s, area):
+  """The original implementation of myStats, kept here as the reference."""
+  sMin = numpy.ma.min(s); sMax = numpy.ma.max(s)
+  if area is None: return sMin, sMax, None, None, None
+  weight = area.copy()
+  if not numpy.ma.getmask(s).any()==numpy.ma.nomask: weight[s.mask] = 0.
+  sumArea = numpy.ma.sum(weight)
+  with numpy.errstate(divide='ignore', invalid='ignore'), warnings.catch_warnings():
+    warnings.simplefilter('ignore') # Converting a masked element to nan, with no area
+    mean = numpy.ma.sum(weight*s)/sumArea
+    std = math.sqrt( numpy.ma.sum( weight*((s-mean)**2) )/sumArea )
+    rms = math.sqrt( numpy.ma.sum( weight*(s**2) )/sumArea )
+  return sMin, sMax, mean, std, rms
+
+def corr_ref(s1, s2, area):
+  """The original implementation of corr, kept here as the reference."""
+  weight = area.copy()
+  if not numpy.ma.getmask(s1).any()==numpy.ma.nomask: weight[s1.mask] = 0.
+  sumArea = numpy.ma.sum(weight)
+  v1 = numpy.ma.sum( weight*(s1**2) )/sumArea
+  v2 = numpy.ma.sum( weight*(s2**2) )/sumArea
+  if v1==0 or v2==0: return numpy.nan
+  return numpy.ma.sum( weight*(s1*s2) )/sumArea / math.sqrt( v1*v2 )
+
+def agree(a, b):
+  """True if the statistics a and b are the same to round-off, masked and NaN alike."""
+  for x, y in zip(a, b):
+    if x is numpy.ma.masked or y is numpy.ma.masked:
+      if not (x is numpy.ma.masked and y is numpy.ma.masked): return False
+    elif x is None or y is None:
+      if not (x is None and y is None): return False
+    elif numpy.isnan(x) or numpy.isnan(y):
+      if not (numpy.isnan(x) and numpy.isnan(y)): return False
+    elif not numpy.isclose(x, y, rtol=1.e-6, atol=0.): return False
+  return True
+
+def syntheticField(ni, nj, rng):
+  """A float32 field with a large mean and ~30% masked, and the cell areas of a regular lat-lon grid."""
+  lat = numpy.linspace(-90., 90., nj+1)
+  area = numpy.outer( numpy.diff(numpy.sin(numpy.radians(lat))), numpy.ones(ni) )
+  s = (1000. + rng.standard_normal((nj,ni))).astype(numpy.float32)
+  return numpy.ma.masked_where(rng.rand(nj,ni)<0.3, s), area
+
+def main(cmdLineArgs):
+  rng = numpy.random.RandomState(cmdLineArgs.seed)
+  empty = numpy.ma.masked_all((10,20), dtype=numpy.float32)
+  noArea = numpy.ma.masked_where(rng.rand(10,20)<0.5, rng.standard_normal((10,20)))
+  area = numpy.where(noArea.mask, 1., 0.) # Zero wherever the field is valid
+  print('%24s %s'%('no values', agree(m6plot.myStats(empty, numpy.ones((10,20))), myStats_ref(empty, numpy.ones((10,20))))))
+  print('%24s %s'%('no area', agree(m6plot.myStats(noArea, area), myStats_ref(noArea, area))))
+  s1, s2, d, r = m6plot.compareStats(empty, noArea, area)
+  print('%24s %s'%('compare no values/area', agree(s1, myStats_ref(empty, area)) and agree(s2, myStats_ref(noArea, area))
+                   and numpy.isnan(r)))
+  print('%12s %12s %10s %10s %10s %s'%('resolution','ni x nj','stats [s]','ref [s]','speedup','agree'))
+  for res in cmdLineArgs.resolutions:
+    ni = int(round(360./res)); nj = int(round(180./res))
+    s1, area = syntheticField(ni, nj, rng)
+    s2 = s1 + 0.1*rng.standard_normal((nj,ni)).astype(numpy.float32)
+    tic = time.time()
+    stats1, stats2, statsD, rxy = m6plot.compareStats(s1, s2, area)
+    tNew = time.time() - tic
+    tic = time.time()
+    ref1 = myStats_ref(s1, area); ref2 = myStats_ref(s2, area); refD = myStats_ref(s1 - s2, area)
+    refR = corr_ref(s1 - ref1[2], s2 - ref2[2], area)
+    tRef = time.time() - tic
+    same = agree(stats1, ref1) and agree(stats2, ref2) and agree(statsD, refD) and agree([rxy], [refR])
+    print('%12.4f %12s %10.3f %10.3f %10.1f %s'%(res, '%ix%i'%(ni,nj), tNew, tRef, tRef/tNew, same))
+
+if __name__ == '__main__':
+  run()
@@ -4,65 +4,36 @@
 from netCDF4 import Dataset
 import numpy as np
 from fnmatch import filter as fn_filter
+from multiprocessing import Pool, cpu_count, current_process
 from os import listdir
 
-def sum_transport_in_straits(runpath, monthly_average = False):
+def sum_transport_in_straits(runpath, monthly_average = False, nprocs = None):
+  """
+  Sums the transport through each strait from the section files in runpath. The directory is
+  listed once and the straits are reduced concurrently by nprocs processes (default: one per
+  strait, up to the number of CPUs; nprocs = 1 works serially, as it does in a pool worker).
+  """
 
   strait = set_strait_info()
   nstraits = len(strait)
-  # Calculate transport in each of the straits
+  strait_files = index_strait_files(runpath, strait)
   for sidx in range(0,nstraits):
     strait[sidx].transport = 0.
-    if strait[sidx].is_zonal and strait[sidx].is_meridional:
-      u_file = fn_filter(listdir(runpath), '*' + strait[sidx].mom6_name + '_U.nc')
-      v_file = fn_filter(listdir(runpath), '*' + strait[sidx].mom6_name + '_V.nc')
-      if (len(u_file)==0 and len(v_file)==0):
-        print(("Warning: File not found for %s" % strait[sidx].mom6_name))
-        continue
-      u_vargroup = Dataset(runpath+'/'+u_file[0]).variables
-      v_vargroup = Dataset(runpath+'/'+v_file[0]).variables
-    elif strait[sidx].is_zonal:
-      v_file = fn_filter(listdir(runpath), '*' + strait[sidx].mom6_name + '*.nc')
-      if (len(v_file)==0):
-        print(("Warning: File not found for %s" % strait[sidx].mom6_name))
-        continue
-      v_vargroup = Dataset(runpath+'/'+v_file[0]).variables
-    elif strait[sidx].is_meridional:
-      u_file = fn_filter(listdir(runpath), '*' + strait[sidx].mom6_name + '*.nc')
-      if (len(u_file)==0):
-        print(("Warning: File not found for %s" % strait[sidx].mom6_name))
-        continue
-      u_vargroup = Dataset(runpath+'/'+u_file[0]).variables
-
-    if strait[sidx].is_zonal:
-      strait[sidx].time = v_vargroup['time'][:]
-      # Need to find the first interface deeper than or equal to the requested z-limit. If deeper, then we'll need to
-      # scale the next layer back and zero out the rest of the column
-      vmo = v_vargroup['vmo'][:,:,:,:]
-      if strait[sidx].zlim > 0.:
-        z_i = v_vargroup['z_i'][:]
-        zidx = np.sum(z_i<=strait[sidx].zlim)-1
-        if z_i[zidx] < strait[sidx].zlim: # Scale back transport in the next layer
-          # Fraction of the layer that should be included in the calculation
-          frac = (z_i[zidx+1] - strait[sidx].zlim)/(z_i[zidx+1]-z_i[zidx]) # Fraction of the layer that should be
-          vmo[:,zidx+1,:] = vmo[:,zidx+1,:]*frac
-          vmo[:,zidx+2:,:] = 0. # All layers below do not contribute
-      strait[sidx].transport += vmo.sum(axis=(1,2,3))
-      Dataset(runpath+'/'+v_file[0]).close()
-
-    if strait[sidx].is_meridional:
-      strait[sidx].time = u_vargroup['time'][:]
-      umo = u_vargroup['umo'][:,:,:,:]
-      if strait[sidx].zlim > 0.:
-        z_i = u_vargroup['z_i'][:]
-        zidx = np.sum(z_i<=strait[sidx].zlim)-1
-        if z_i[zidx] < strait[sidx].zlim:
-          frac = (z_i[zidx+1] - strait[sidx].zlim)/(z_i[zidx+1]-z_i[zidx])
-          umo[:,zidx+1,:] = umo[:,zidx+1,:]*frac
-          umo[:,zidx+2:,:] = 0.
-      strait[sidx].transport += umo.sum(axis=(1,2,3))
-      Dataset(runpath+'/'+u_file[0]).close()
+    if sidx not in strait_files: print(("Warning: File not found for %s" % strait[sidx].mom6_name))
+  # Calculate transport in each of the straits
+  found = [sidx for sidx in range(0,nstraits) if sidx in strait_files]
+  work = [(strait_files[sidx], strait[sidx].zlim) for sidx in found]
+  if nprocs is None: nprocs = min(len(work), cpu_count())
+  if current_process().daemon: nprocs = 1 # Pool workers (e.g. of frepp_batch) can not have their own pools
+  if nprocs > 1:
+    pool = Pool(nprocs)
+    try: results = pool.map(strait_transport, work)
+    finally: pool.close(); pool.join()
+  else: results = [strait_transport(args) for args in work]
 
+  for sidx, (time, transport) in zip(found, results):
+    strait[sidx].time = time
+    strait[sidx].transport += transport
     if monthly_average:
       strait[sidx].transport = make_monthly_averages(strait[sidx].transport)
       strait[sidx].time = make_monthly_averages(strait[sidx].time)
@@ -74,6 +45,59 @@ def sum_transport_in_straits(runpath, monthly_average = False):
     transport_array[:,sidx] = strait[sidx].transport
   return time, transport_array, strait
 
+def index_strait_files(runpath, strait):
+  """
+  Returns {strait index: [(file, variable), ...]} for the straits whose section files are
+  all present in runpath, from a single listing of the directory.
+  """
+  files = listdir(runpath)
+  index = {}
+  for sidx in range(0,len(strait)):
+    if strait[sidx].is_zonal and strait[sidx].is_meridional:
+      v_file = fn_filter(files, '*' + strait[sidx].mom6_name + '_V.nc')
+      u_file = fn_filter(files, '*' + strait[sidx].mom6_name + '_U.nc')
+    else:
+      v_file = u_file = fn_filter(files, '*' + strait[sidx].mom6_name + '*.nc')
+    sections = []
+    if strait[sidx].is_zonal: sections.append( (v_file, 'vmo') )
+    if strait[sidx].is_meridional: sections.append( (u_file, 'umo') )
+    if all(len(section_file) for section_file, _ in sections):
+      index[sidx] = [(runpath+'/'+section_file[0], varname) for section_file, varname in sections]
+  return index
+
+def strait_transport(args):
+  """
+  Returns (time, transport) for one strait, args being ([(file, variable), ...], zlim) as
+  set up by sum_transport_in_straits. Each file is opened once.
+  """
+  sections, zlim = args
+  transport = 0.
+  for section_file, varname in sections:
+    rootGroup = Dataset(section_file)
+    try:
+      time, section_transport = section_sum(rootGroup.variables, varname, zlim)
+    finally:
+      rootGroup.close()
+    transport += section_transport
+  return time, transport
+
+def section_sum(vargroup, varname, zlim):
+  """Returns (time, transport) summed over the section, reading only the levels that contribute above zlim (if > 0)."""
+  time = vargroup['time'][:]
+  var = vargroup[varname]
+  if zlim > 0.:
+    # Need to find the first interface deeper than or equal to the requested z-limit. If deeper, then we'll need to
+    # scale the next layer back and the rest of the column does not contribute (and is not read)
+    z_i = vargroup['z_i'][:]
+    zidx = np.sum(z_i<=zlim)-1
+    if z_i[zidx] < zlim: # Scale back transport in the next layer
+      # Fraction of the layer that should be included in the calculation
+      frac = (z_i[zidx+1] - zlim)/(z_i[zidx+1]-z_i[zidx])
+      trans = var[:,:zidx+2,:,:]
+      trans[:,zidx+1,:] = trans[:,zidx+1,:]*frac
+      return time, trans.sum(axis=(1,2,3))
+  return time, var[:,:,:,:].sum(axis=(1,2,3))
+
 def make_monthly_averages(data):
   # This fundamentally assumes that the output is only one year long, any longer and we'd have to know the actual year to properly
   # handle leap years
@@ -0,0 +1,179 @@
+"""
+Streaming (single pass) weighted statistics of gridded time series.
+
+Records are fed in chunks of any length with Moments.update() (or CoMoments.update()
+for pairs of variables). Each chunk is reduced about its own mean and then merged into
+the running totals with the pairwise update of Chan, Golub & LeVeque (1979), extended to
+the third and fourth moments by Pebay (2008). This keeps the variance accurate even for
+float32 data with a large mean, unlike E[x^2]-E[x]^2. All accumulation is in float64.
+
+Masked values carry no weight, and statistics with no weight at all are returned masked.
+"""
+import netCDF4
+import numpy as np
+
+class Moments:
+  """
+  Running weighted central moments of a field, up to order 2, 3 or 4.
+  """
+  def __init__(self, order=2):
+    if order not in (2, 3, 4): raise Exception('order must be 2, 3 or 4')
+    self.order = order
+    self.W = 0.; self.mean = 0.; self.M2 = 0.; self.M3 = 0.; self.M4 = 0.
+
+  def update(self, x, weights=None):
+    """Adds the records x(n,...) with optional weights(n) (e.g. the averaging interval of each record)."""
+    w = chunkWeights(x, weights)
+    d = np.ma.filled(x, 0.).astype(np.float64) # A copy, reduced about the mean in place
+    W, mean = weightedMean(d, w)
+    d -= mean
+    wdn = d*d
+    if w is not None: wdn *= w
+    M2 = wdn.sum(axis=0); M3 = M4 = 0.
+    if self.order>2: wdn *= d; M3 = wdn.sum(axis=0)
+    if self.order>3: wdn *= d; M4 = wdn.sum(axis=0)
+    self.combine(W, mean, M2, M3, M4)
+
+  def combine(self, W, mean, M2, M3=0., M4=0.):
+    """Merges the moments of another set of records into these."""
+    Wa = self.W; n = Wa + W
+    with np.errstate(divide='ignore', invalid='ignore'):
+      fa = np.where(n>0, Wa/n, 0.); fb = np.where(n>0, W/n, 0.)
+    delta = mean - self.mean
+    cross = Wa*fb*delta*delta
+    if self.order>3:
+      self.M4 = self.M4 + M4 + cross*delta*delta*(fa*fa - fa*fb + fb*fb) \
+                + 6.*delta*delta*(fa*fa*M2 + fb*fb*self.M2) + 4.*delta*(fa*M3 - fb*self.M3)
+    if self.order>2:
+      self.M3 = self.M3 + M3 + cross*delta*(fa - fb) + 3.*delta*(fa*M2 - fb*self.M2)
+    self.M2 = self.M2 + M2 + cross
+    self.mean = self.mean + delta*fb
+    self.W = n
+
+  def _masked(self, value):
+    return np.ma.masked_where(np.broadcast_to(np.asarray(self.W)<=0, np.shape(value)), value)
+
+  def weightedMean(self):
+    return self._masked(self.mean)
+
+  def variance(self):
+    """Returns the (population) variance."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return self._masked(self.M2/self.W)
+
+  def meanSquare(self):
+    """Returns the mean of the square, E[x^2]."""
+    return self.variance() + self.weightedMean()**2
+
+  def skewness(self):
+    if self.order<3: raise Exception('Moments were not accumulated to order 3')
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return self._masked( np.sqrt(self.W)*self.M3/self.M2**1.5 )
+
+  def kurtosis(self):
+    """Returns the (non-excess) kurtosis, which is 3 for a normal distribution."""
+    if self.order<4: raise Exception('Moments were not accumulated to order 4')
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return self._masked( self.W*self.M4/(self.M2*self.M2) )
+
+class CoMoments:
+  """
+  Running weighted covariance of two fields, e.g. u'v', and their variances for the correlation.
+  Only records where both are unmasked count.
+  """
+  def __init__(self):
+    self.W = 0.; self.xmean = 0.; self.ymean = 0.; self.C = 0.; self.xM2 = 0.; self.yM2 = 0.
+
+  def update(self, x, y, weights=None):
+    """Adds the records x(n,...) and y(n,...) with optional weights(n)."""
+    w = chunkWeights(x, weights, np.ma.getmask(x) | np.ma.getmask(y))
+    dx = np.ma.filled(x, 0.).astype(np.float64); dy = np.ma.filled(y, 0.).astype(np.float64)
+    W, xmean = weightedMean(dx, w)
+    W, ymean = weightedMean(dy, w)
+    dx -= xmean; dy -= ymean
+    sums = []
+    for a, b in ((dx, dy), (dx, dx), (dy, dy)):
+      wab = a*b
+      if w is not None: wab *= w
+      sums.append(wab.sum(axis=0)); del wab
+    self.combine(W, xmean, ymean, *sums)
+
+  def combine(self, W, xmean, ymean, C, xM2=0., yM2=0.):
+    """Merges the co-moments of another set of records into these."""
+    Wa = self.W; n = Wa + W
+    with np.errstate(divide='ignore', invalid='ignore'):
+      fb = np.where(n>0, W/n, 0.)
+    dx = xmean - self.xmean; dy = ymean - self.ymean
+    self.C = self.C + C + Wa*fb*dx*dy
+    self.xM2 = self.xM2 + xM2 + Wa*fb*dx*dx
+    self.yM2 = self.yM2 + yM2 + Wa*fb*dy*dy
+    self.xmean = self.xmean + dx*fb; self.ymean = self.ymean + dy*fb
+    self.W = n
+
+  def covariance(self):
+    with np.errstate(divide='ignore', invalid='ignore'):
+      C = self.C/self.W
+    return np.ma.masked_where(np.broadcast_to(np.asarray(self.W)<=0, np.shape(C)), C)
+
+  def correlation(self, centered=False):
+    """
+    Returns the correlation coefficient, NaN where either field is constant or there is no weight.
+    With centered=True the fields are taken to have zero mean, i.e. it is E[xy]/sqrt(E[x^2]E[y^2]).
+    """
+    C, xM2, yM2 = self.C, self.xM2, self.yM2
+    if centered:
+      C = C + self.W*self.xmean*self.ymean
+      xM2 = xM2 + self.W*self.xmean**2; yM2 = yM2 + self.W*self.ymean**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return np.where( (xM2>0) & (yM2>0), C/np.sqrt(xM2*yM2), np.nan )
+
+def chunkWeights(x, weights=None, mask=None):
+  """
+  Returns the float64 weight of each element of x(n,...): weights[n] (or 1) where x (or mask, if given)
+  is not masked, 0 where it is. Without a mask this is weights(n,1,...), and None without weights either.
+  """
+  if mask is None: mask = np.ma.getmask(x)
+  if weights is not None: weights = np.asarray(weights, dtype=np.float64).reshape( (-1,)+(1,)*(np.ndim(x)-1) )
+  if not np.any(mask): return weights
+  w = (~np.broadcast_to(mask, np.shape(x))).astype(np.float64)
+  if weights is not None: w *= weights
+  return w
+
+def weightedMean(x, w):
+  """Returns the sum of the weights w (from chunkWeights) and the weighted mean (0 where that is 0) of x(n,...)."""
+  if w is None:
+    n = x.shape[0]
+    return np.full(x.shape[1:], float(n)), x.sum(axis=0)/max(n, 1)
+  W = np.broadcast_to(w, x.shape).sum(axis=0)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    return W, np.where(W>0, (w*x).sum(axis=0)/W, 0.)
+
+def chunkSize(shape, budget=2**26):
+  """Returns the number of records of shape (without time) whose float64 copy fits in budget bytes, at least 1."""
+  return max(1, int( budget // (8*np.prod(shape, dtype=np.float64)) ))
+
+def windows(time, units=None, calendar='standard', window='monthly'):
+  """
+  Returns a list of (start, stop) record ranges of consecutive records that fall in the same
+  averaging window. window is 'monthly', 'annual' or 'all' (using the dates of time in the given
+  units and calendar), or an integer number of records.
+  """
+  nt = len(time)
+  if window == 'all': return [(0, nt)]
+  try: n = int(window)
+  except ValueError: n = None
+  if n is not None: return [(start, min(start+n, nt)) for start in range(0, nt, n)]
+  if window not in ('monthly', 'annual'): raise Exception('Unknown averaging window "%s"'%window)
+  dates = netCDF4.num2date(np.asarray(time), units, calendar)
+  if window == 'monthly': keys = [(d.year, d.month) for d in dates]
+  else: keys = [d.year for d in dates]
+  ranges = []; start = 0
+  for t in range(1, nt+1):
+    if t == nt or keys[t] != keys[start]:
+      ranges.append( (start, t) ); start = t
+  return ranges
+
+def chunks(start, stop, size):
+  """Yields (first, last) sub-ranges of at most size records covering the range (start, stop)."""
+  for first in range(start, stop, size):
+    yield first, min(first+size, stop)
@@ -5,39 +5,79 @@
 # Written by Andrew Shao (andrew.shao@noaa.gov) 29 September 2017
 import numpy as np
 
-def calc_w_from_convergence(u_var, v_var, wrapx = True, wrapy = False):
+class Workspace:
+  """Scratch arrays for w_from_convergence, allocated for one time level and reused for every other."""
+  def __init__(self, nk, nlat, nlon, dtype):
+    self.u = np.zeros( (nk, nlat, nlon), dtype=dtype )
+    self.v = np.zeros( (nk, nlat, nlon), dtype=dtype )
+    self.div = np.zeros( (nk, nlat, nlon), dtype=dtype )
+    self.h_mask = np.zeros( (nk, nlat, nlon), dtype=bool )
+    self.w = np.ma.array( np.zeros( (nk+1, nlat, nlon) ), mask=np.zeros( (nk+1, nlat, nlon), dtype=bool ) )
+
+  def fits(self, u_dat, v_dat):
+    return self.u.shape == u_dat.shape and self.u.dtype == np.result_type(u_dat, v_dat)
+
+def w_from_convergence(u_dat, v_dat, wrapx = True, wrapy = False, work = None):
+  """
+  Returns w(nk+1,nlat,nlon) for one time level of u_dat(nk,nlat,nlon) and v_dat(nk,nlat,nlon).
+  If a Workspace is given, w is its buffer and is overwritten by the next call using the same work.
+  """
+  if work is None or not work.fits(u_dat, v_dat):
+    work = Workspace( *u_dat.shape, dtype=np.result_type(u_dat, v_dat) )
+  u, v, div, h_mask = work.u, work.v, work.div, work.h_mask
+  w = work.w.data; w_mask = work.w.mask
+  nk = u.shape[0]
+
+  # Get and process the u component
+  u_msk = np.ma.getmaskarray(u_dat)
+  np.copyto(u, np.ma.getdata(u_dat)); u[u_msk] = 0.
+  h_mask[...] = u_msk
+  h_mask[:,:,1:] |= u_msk[:,:,:-1]; h_mask[:,:,0] |= u_msk[:,:,-1]
 
-  tmax = u_var.shape[0]
+  # Get and process the v component
+  v_msk = np.ma.getmaskarray(v_dat)
+  np.copyto(v, np.ma.getdata(v_dat)); v[v_msk] = 0.
+  h_mask |= v_msk
+  h_mask[:,1:,:] |= v_msk[:,:-1,:]; h_mask[:,0,:] |= v_msk[:,-1,:]
+
+  # Order of subtraction based on upwind sign convention and desire for w>0 to correspond with upwards velocity
+  np.subtract(u[:,:,:-1], u[:,:,1:], out=div[:,:,1:])
+  np.subtract(u[:,:,-1], u[:,:,0], out=div[:,:,0])
+  w[:-1] = div
+  if not wrapx: # If not wrapping, then convergence on westernmost side is simply so subtract back the rolled value
+    w[:-1,:,0] += -u[:,:,-1]
+  np.subtract(v[:,:-1,:], v[:,1:,:], out=div[:,1:,:])
+  np.subtract(v[:,-1,:], v[:,0,:], out=div[:,0,:])
+  w[:-1] += div
+  if not wrapy: # If not wrapping, convergence on westernmost side is v
+    w[:-1,0,:] += -v[:,-1,:]
+  w[-1] = 0.
+  # Integrate from the bottom
+  for k in range(nk-1,0,-1): w[k-1] += w[k]
+  # Mask if any of u[i-1], u[i], v[j-1], v[j] are not masked
+  w_mask[:-1] = h_mask
+  # Bottom should always be zero, mask applied wherever the top interface is a valid value
+  w_mask[-1] = h_mask[-2]
+  return work.w
+
+def iter_w_from_convergence(u_var, v_var, wrapx = True, wrapy = False):
+  """
+  Yields w(nk+1,nlat,nlon) for each time level of u_var and v_var, reading one time level at a
+  time and reusing the same buffers, so each w yielded is overwritten by the next.
+  """
+  work = None
+  for tidx in range(u_var.shape[0]):
+    u_dat = u_var[tidx,:,:,:]; v_dat = v_var[tidx,:,:,:]
+    if work is None: work = Workspace( *u_dat.shape, dtype=np.result_type(u_dat, v_dat) )
+    yield w_from_convergence(u_dat, v_dat, wrapx, wrapy, work=work)
+
+def calc_w_from_convergence(u_var, v_var, wrapx = True, wrapy = False):
 
   ntime, nk, nlat, nlon = u_var.shape
   w = np.ma.zeros( (ntime, nk+1, nlat, nlon)  )
   # Work timelevel by timelevel
-  for tidx in range(0,tmax):
-    # Get and process the u component
-    u_dat = u_var[tidx,:,:,:]
-    h_mask = np.logical_or(np.ma.getmask(u_dat), np.ma.getmask(np.roll(u_dat,1,axis=-1)))
-    u_dat = u_dat.filled(0.)
-
-    # Get and process the v component
-    v_dat = v_var[tidx,:,:,:]
-    h_mask = np.logical_or(h_mask,np.ma.getmask(v_dat))
-    h_mask = np.logical_or(h_mask,np.ma.getmask(np.roll(v_dat,1,axis=-2)))
-    v_dat = v_dat.filled(0.)
-
-    # Order of subtraction based on upwind sign convention and desire for w>0 to correspond with upwards velocity
-    w[tidx,:-1,:,:] += np.roll(u_dat,1,axis=-1)-u_dat
-    if not wrapx: # If not wrapping, then convergence on westernmost side is simply so subtract back the rolled value
-      w[tidx,:-1,:,0] += -u_dat[:-1,:,-1]
-    w[tidx,:-1,:,:] += np.roll(v_dat,1,axis=-2)-v_dat
-    if not wrapy: # If not wrapping, convergence on westernmost side is v
-      w[tidx,:-1,0,:] += -v_dat[:,-1,:]
-    w[tidx,-1,:,:] = 0.
-    # Do a double-flip so that we integrate from the bottom
-    w[tidx,:-1,:,:] = w[tidx,-2::-1,:,:].cumsum(axis=0)[::-1,:,:]
-    # Mask if any of u[i-1], u[i], v[j-1], v[j] are not masked
-    w[tidx,:-1,:,:] = np.ma.masked_where(h_mask, w[tidx,:-1,:,:])
-    # Bottom should always be zero, mask applied wherever the top interface is a valid value
-    w[tidx,-1,:,:] = np.ma.masked_where(h_mask[-2,:,:], w[tidx,-1,:,:])
+  for tidx, w_t in enumerate(iter_w_from_convergence(u_var, v_var, wrapx, wrapy)):
+    w[tidx] = w_t
 
   return w
 
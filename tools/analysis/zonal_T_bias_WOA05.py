@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 
-import io
 import netCDF4
 import numpy
 import m6toolbox
@@ -24,27 +23,14 @@ def run():
   main(cmdLineArgs)
 
 def main(cmdLineArgs,stream=False):
-  if not os.path.exists(cmdLineArgs.gridspec): raise ValueError('Specified gridspec directory/tar file does not exist.')
-  if os.path.isdir(cmdLineArgs.gridspec):
-    xcenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['x'][1::2,1::2]
-    y = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][1::2,1::2].max(axis=-1)
-    ycenter = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['y'][1::2,1::2]
-    msk = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_mask.nc').variables['mask'][:]
-    area = msk*netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_hgrid.nc').variables['area'][:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = netCDF4.Dataset(cmdLineArgs.gridspec+'/ocean_topog.nc').variables['depth'][:]
-    try: basin = netCDF4.Dataset(cmdLineArgs.gridspec+'/basin_codes.nc').variables['basin'][:]
-    except: basin = m6toolbox.genBasinMasks(xcenter, ycenter, depth)
-  elif os.path.isfile(cmdLineArgs.gridspec):
-    xcenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','x')[1::2,1::2]
-    y = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[1::2,1::2].max(axis=-1)
-    ycenter = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','y')[1::2,1::2]
-    msk = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_mask.nc','mask')[:]
-    area = msk*m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_hgrid.nc','area')[:,:].reshape([msk.shape[0], 2, msk.shape[1], 2]).sum(axis=-3).sum(axis=-1)
-    depth = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'ocean_topog.nc','depth')[:]
-    try: basin = m6toolbox.readNCFromTar(cmdLineArgs.gridspec,'basin_codes.nc','basin')[:]
-    except: basin = m6toolbox.genBasinMasks(xcenter, ycenter, depth)
-  else:
-    raise ValueError('Unable to extract grid information from gridspec directory/tar file.') 
+  grid = m6toolbox.loadGrid(cmdLineArgs.gridspec)
+  xcenter = grid.xcenter
+  y = grid.ycenter.max(axis=-1)
+  ycenter = grid.ycenter
+  msk = grid.msk
+  area = grid.area
+  depth = grid.depth
+  basin = grid.basin_code
 
   Tobs = netCDF4.Dataset( cmdLineArgs.woa )
   if 'temp' in Tobs.variables: Tobs = Tobs.variables['temp']
@@ -53,7 +39,7 @@ def main(cmdLineArgs,stream=False):
   else: Tobs = Tobs[:].mean(axis=0)
   Zobs = netCDF4.Dataset( cmdLineArgs.woa ).variables['eta'][:]
   
-  rootGroup = netCDF4.MFDataset( cmdLineArgs.infile )
+  rootGroup = m6toolbox.openDataset( cmdLineArgs.infile )
   if 'temp' in rootGroup.variables: varName = 'temp'
   elif 'ptemp' in rootGroup.variables: varName = 'ptemp'
   elif 'thetao' in rootGroup.variables: varName = 'thetao'
@@ -63,9 +49,15 @@ def main(cmdLineArgs,stream=False):
   if 'e' in rootGroup.variables: Zmod = rootGroup.variables['e'][0]
   else: Zmod = Zobs # Using model z-ou:put
   
-  def zonalAverage(T, eta, area, mask=1.):
-    vols = ( mask * area ) * ( eta[:-1] - eta[1:] ) # mask * area * level thicknesses
-    return numpy.sum( vols * T, axis=-1 ) / numpy.sum( vols, axis=-1 ), (mask*eta).min(axis=-1)
+  # Zonal averages over the Atlantic + Arctic (0), Pacific (1), Indian (2) and the whole domain (3),
+  # with layer volumes computed once for the model and once for the obs, and shared with the other tracer
+  basin_index = m6toolbox.basinIndex(basin, [[2,4],[3],[5]])
+  basin_index[ numpy.ma.filled(msk, 0.)==0 ] = 3
+  if 'e' in rootGroup.variables: modKey = (cmdLineArgs.infile, cmdLineArgs.gridspec)
+  else: modKey = (cmdLineArgs.woa, cmdLineArgs.gridspec)
+  modAverager = m6toolbox.zonalAverager(modKey, Zmod, area, basin_index, 3)
+  obsAverager = m6toolbox.zonalAverager((cmdLineArgs.woa, cmdLineArgs.gridspec), Zobs, area, basin_index, 3)
+  tAve, tObsAve, zAve = modAverager.mean(Tmod), obsAverager.mean(Tobs), modAverager.depth()
   
   ci=m6plot.pmCI(0.25,4.5,.5)
 
@@ -73,20 +65,19 @@ def main(cmdLineArgs,stream=False):
   else: suptitle = rootGroup.title + ' ' + cmdLineArgs.label
 
   imgbufs = []
+  queue = m6plot.RenderQueue() # Figures are rendered concurrently by queue.render()
     
   # Global
-  tPlot, z = zonalAverage(Tmod, Zmod, area)
-  tObsPlot, _ = zonalAverage(Tobs, Zobs, area)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/T_global_xave_bias_WOA05.png'
-  m6plot.yzplot( tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+  tPlot, tObsPlot, z = tAve[3], tObsAve[3], zAve[3]
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'T_global_xave_bias_WOA05.png', stream)
+  queue.add(m6plot.yzplot, tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle, title=r'''Global zonal-average $\theta$ bias (w.r.t. WOA'05) [$\degree$C]''',
         clim=ci, colormap='dunnePM', centerlabels=True, extend='both',
         save=objOut)
   if stream is True: imgbufs.append(objOut)
 
   if stream is None:
-    m6plot.yzcompare( tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+    queue.add(m6plot.yzcompare, tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle,
         title1=r'Global zonal-average $\theta$ [$\degree$C]',
         title2=r'''WOA'05 $\theta$ [$\degree$C]''',
@@ -95,19 +86,16 @@ def main(cmdLineArgs,stream=False):
         save=cmdLineArgs.outdir+'/T_global_xave_bias_WOA05.3_panel.png')
   
   # Atlantic + Arctic
-  newMask = 1.*msk; newMask[ (basin!=2) & (basin!=4) ] = 0.
-  tPlot, z = zonalAverage(Tmod, Zmod, area, mask=newMask)
-  tObsPlot, _ = zonalAverage(Tobs, Zobs, area, mask=newMask)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/T_Atlantic_xave_bias_WOA05.png'
-  m6plot.yzplot( tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+  tPlot, tObsPlot, z = tAve[0], tObsAve[0], zAve[0]
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'T_Atlantic_xave_bias_WOA05.png', stream)
+  queue.add(m6plot.yzplot, tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle, title=r'''Atlantic zonal-average $\theta$ bias (w.r.t. WOA'05) [$\degree$C]''',
         clim=ci, colormap='dunnePM', centerlabels=True, extend='both',
         save=objOut)
   if stream is True: imgbufs.append(objOut)
   
   if stream is None:
-    m6plot.yzcompare( tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+    queue.add(m6plot.yzcompare, tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle,
         title1=r'Atlantic zonal-average $\theta$ [$\degree$C]',
         title2=r'''WOA'05 $\theta$ [$\degree$C]''',
@@ -116,19 +104,16 @@ def main(cmdLineArgs,stream=False):
         save=cmdLineArgs.outdir+'/T_Atlantic_xave_bias_WOA05.3_panel.png')
   
   # Pacific
-  newMask = 1.*msk; newMask[ (basin!=3) ] = 0.
-  tPlot, z = zonalAverage(Tmod, Zmod, area, mask=newMask)
-  tObsPlot, _ = zonalAverage(Tobs, Zobs, area, mask=newMask)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/T_Pacific_xave_bias_WOA05.png'
-  m6plot.yzplot( tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+  tPlot, tObsPlot, z = tAve[1], tObsAve[1], zAve[1]
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'T_Pacific_xave_bias_WOA05.png', stream)
+  queue.add(m6plot.yzplot, tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle, title=r'''Pacific zonal-average $\theta$ bias (w.r.t. WOA'05) [$\degree$C]''',
         clim=ci, colormap='dunnePM', centerlabels=True, extend='both',
         save=objOut)
   if stream is True: imgbufs.append(objOut)
 
   if stream is None:
-    m6plot.yzcompare( tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+    queue.add(m6plot.yzcompare, tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle,
         title1=r'Pacific zonal-average $\theta$ [$\degree$C]',
         title2=r'''WOA'05 $\theta$ [$\degree$C]''',
@@ -137,19 +122,16 @@ def main(cmdLineArgs,stream=False):
         save=cmdLineArgs.outdir+'/T_Pacific_xave_bias_WOA05.3_panel.png')
   
   # Indian
-  newMask = 1.*msk; newMask[ (basin!=5) ] = 0.
-  tPlot, z = zonalAverage(Tmod, Zmod, area, mask=newMask)
-  tObsPlot, _ = zonalAverage(Tobs, Zobs, area, mask=newMask)
-  if stream is True: objOut = io.BytesIO()
-  else: objOut = cmdLineArgs.outdir+'/T_Indian_xave_bias_WOA05.png'
-  m6plot.yzplot( tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+  tPlot, tObsPlot, z = tAve[2], tObsAve[2], zAve[2]
+  objOut = m6toolbox.plotOutput(cmdLineArgs, 'T_Indian_xave_bias_WOA05.png', stream)
+  queue.add(m6plot.yzplot, tPlot - tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle, title=r'''Indian zonal-average $\theta$ bias (w.r.t. WOA'05) [$\degree$C]''',
         clim=ci, colormap='dunnePM', centerlabels=True, extend='both',
         save=objOut)
   if stream is True: imgbufs.append(objOut)
   
   if stream is None:
-    m6plot.yzcompare( tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
+    queue.add(m6plot.yzcompare, tPlot, tObsPlot , y, z, splitscale=[0., -1000., -6500.],
         suptitle=suptitle,
         title1=r'Indian zonal-average $\theta$ [$\degree$C]',
         title2=r'''WOA'05 $\theta$ [$\degree$C]''',
@@ -157,6 +139,8 @@ def main(cmdLineArgs,stream=False):
         dlim=ci, dcolormap='dunnePM', dextend='both', centerdlabels=True,
         save=cmdLineArgs.outdir+'/T_Indian_xave_bias_WOA05.3_panel.png')
 
+  queue.render()
+
   if stream is True:
     return imgbufs
 